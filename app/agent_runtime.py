@@ -0,0 +1,408 @@
+"""常駐的名片 Agent 與 Runner
+
+原本每則文字訊息都會重新建立 Agent、Runner 與 InMemorySessionService，
+並以 make_adk_tools 的閉包把 user_id 綁進工具。現在整個行程共用一組
+Agent／Runner（第一次使用時建立），工具是模組層級的函式，透過
+agent_request() 設定的 ContextVar 取得目前訊息的使用者與要顯示的名片；
+ContextVar 會隨 asyncio task 複製，並行處理不同使用者的訊息時互不影響。
+
+每則訊息使用獨立的 ADK session，建立時帶入 agent_sessions 保存的最近
+幾輪對話、較早對話的摘要與最近顯示過的名片，結束後再記錄這一輪。
+唯讀查詢的回覆存入 response_cache，相同的查詢不再呼叫模型。
+
+Agent 上註冊的 ADK callback 把每次模型與工具呼叫記錄到目前請求的
+AgentTrace（見 agent_trace），超過回合預算時中止執行；模型依訊息類型
+由 model_router 的 policy 決定，lite 模型超過預算時改用 standard 重試。
+Vertex AI 熔斷中時（見 circuit_breaker）不執行 Agent，直接拋出
+CircuitOpenError，由 handle_smart_query 改用本地搜尋。每個模型回合送出
+前以 interactive 優先權向 vertex_scheduler 取得配額。整個 Agent 執行以
+請求剩餘的時間預算為上限（見 deadline），逾時拋出 DeadlineExceeded。
+"""
+import asyncio
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from google.adk import Agent, Runner
+from google.adk.sessions.in_memory_session_service import (
+    InMemorySessionService
+)
+from google.adk.events import Event
+from google.genai.types import Content, GenerateContentConfig, Part
+
+from . import (
+    agent_sessions, agent_trace, circuit_breaker, config, deadline,
+    firebase_utils, model_router, response_cache, vertex_scheduler
+)
+from .bot_instance import user_states
+
+APP_NAME = "namecard_bot_app"
+AGENT_NAME = "namecard_agent"
+# Agent 搜尋工具單次最多回傳的名片摘要數量
+SEARCH_TOOL_MAX_RESULTS = 20
+
+AGENT_INSTRUCTION = (
+    "你是一個聰明且親切的 LINE 名片助理。你的工作是幫助使用者管理名片資料。\n"
+    "你可以使用合適的工具來讀取或修改 Firebase 資料庫中的名片記錄。\n\n"
+    "【核心操作準則】\n"
+    "1. 【查詢】當使用者查詢某人或某公司的名片時，"
+    "請從訊息中取出關鍵字（例如姓名、公司、職稱、電話）調用 "
+    "search_namecards 搜尋，結果只包含摘要；"
+    "需要電話、Email、地址等完整欄位時，"
+    "再以 card_id 調用 get_namecard_by_id。"
+    "找不到時可換用其他關鍵字再搜尋一次；"
+    "若使用者以描述（產業、認識的場合、備忘錄內容等）找人，"
+    "請調用 semantic_search_namecards 以語意搜尋。\n"
+    "2. 【顯示】只要找到了符合條件的名片，"
+    "『務必』調用 display_namecard 工具將該名片的 card_id "
+    "標記為顯示，以便系統繪製並呈現在 LINE 畫面上。\n"
+    "3. 【修改】如果使用者想修改名片（例如電話、Email、備註），"
+    "請先比對找出 card_id，然後調用相對應的更新工具"
+    "（如 update_namecard_field 或 update_namecard_memo）"
+    "進行修改；同時修改多個欄位或多張名片時，"
+    "請以 update_namecard_fields 一次送出所有修改，不要逐欄調用。"
+    "修改成功後請『務必』再次調用 display_namecard "
+    "顯示更新後的名片，讓使用者進行確認。\n"
+    "4. 【回覆】最後請以親切、精簡的繁體中文口吻"
+    "向使用者回覆操作結果或搜尋進度。\n"
+    "5. 【上下文】使用者以「他」、「她」、「這張」等代稱指稱名片時，"
+    "優先使用最近顯示過的名片，直接以其 card_id 操作，不必重新搜尋。\n"
+    "最近顯示過的名片：{recent_cards?}\n"
+    "較早的對話摘要：{conversation_summary?}"
+)
+
+
+class AgentRequest:
+    """單則訊息交給 Agent 處理時的請求範圍狀態"""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.found_card_ids = []  # display_namecard 標記要顯示的名片
+        self.read_only = True  # 調用修改工具後為 False，回覆不可快取
+        # 修改工具提出、等待使用者確認的變更 [{"card_id", "field", "value"}]
+        self.pending_changes = []
+        self.tier = model_router.STANDARD  # 這次執行使用的模型等級
+        self.ticket = None  # 目前模型回合的 vertex_scheduler 配額
+        self.trace = agent_trace.AgentTrace(
+            config.AGENT_MAX_MODEL_CALLS, config.AGENT_MAX_TOOL_CALLS)
+
+
+_agent_request: ContextVar = ContextVar("agent_request", default=None)
+
+
+@contextmanager
+def agent_request(user_id: str):
+    """開啟一個請求範圍的 AgentRequest，離開時自動還原"""
+    request = AgentRequest(user_id)
+    token = _agent_request.set(request)
+    try:
+        yield request
+    finally:
+        _agent_request.reset(token)
+
+
+def current_request() -> AgentRequest:
+    """取得目前的 AgentRequest；工具只能在 agent_request() 範圍內呼叫"""
+    request = _agent_request.get()
+    if request is None:
+        raise RuntimeError("Agent tool called outside of agent_request()")
+    return request
+
+
+def search_namecards(query: str, limit: int = 10) -> list[dict]:
+    """以關鍵字（姓名、公司、職稱、電話、Email、地址、備忘錄）搜尋名片，
+    依相關度回傳最多 limit 筆摘要（card_id、name、company、title）。
+    多個關鍵字以空白分隔；也可直接傳入完整或末幾碼電話號碼反查
+    （不限格式，例如 +886 912-345-678 或 5678）。
+    需要完整欄位時請再調用 get_namecard_by_id。"""
+    limit = max(1, min(limit, SEARCH_TOOL_MAX_RESULTS))
+    return firebase_utils.search_card_summaries(
+        current_request().user_id, query, limit)
+
+
+async def semantic_search_namecards(description: str,
+                                    limit: int = 5) -> list[dict]:
+    """以自然語言描述做語意搜尋（例如「在東京認識的 AI 新創創辦人」），
+    適用於關鍵字找不到、需要理解產業、場合或備忘錄內容的查詢。
+    依相似度回傳最多 limit 筆摘要（card_id、name、company、title、
+    score），score 越高越相近。"""
+    limit = max(1, min(limit, SEARCH_TOOL_MAX_RESULTS))
+    return await firebase_utils.semantic_search_cards(
+        current_request().user_id, description, limit)
+
+
+def get_namecard_by_id(card_id: str) -> dict:
+    """透過特定的 card_id 取得單張名片的詳細欄位與資料。"""
+    return firebase_utils.get_card_by_id(current_request().user_id, card_id)
+
+
+def display_namecard(card_id: str) -> str:
+    """顯示特定名片給使用者看。
+    當找到與搜尋相匹配的名片時，務必調用此工具。"""
+    found_card_ids = current_request().found_card_ids
+    if card_id not in found_card_ids:
+        found_card_ids.append(card_id)
+    return f"已將名片 ID 標記為顯示：{card_id}"
+
+
+def _propose_change(card_id: str, field: str, value: str) -> None:
+    """把一項修改加入這則訊息的待確認變更，等使用者確認後一次寫入
+
+    同一則訊息中的修改累積成一組（同一名片的同一欄位以最後一次為準），
+    確認畫面列出全部修改，不會只留下最後一次工具呼叫的修改。Agent
+    成功執行完畢後才由 run_agent 寫入 user_states，中途失敗或升級重試
+    的那一輪修改不會留下來被確認。
+    """
+    request = current_request()
+    request.read_only = False
+    for change in request.pending_changes:
+        if change['card_id'] == card_id and change['field'] == field:
+            change['value'] = value
+            break
+    else:
+        request.pending_changes.append(
+            {'card_id': card_id, 'field': field, 'value': value})
+
+
+def update_namecard_memo(card_id: str, memo: str) -> bool:
+    """更新特定名片的備忘錄／記事資訊。"""
+    _propose_change(card_id, 'memo', memo)
+    return True
+
+
+def update_namecard_field(card_id: str, field: str, value: str) -> bool:
+    """更新特定名片的指定欄位（可選欄位有：name、title、company、address、phone、email）。"""
+    _propose_change(card_id, field, value)
+    return True
+
+
+def update_namecard_fields(updates: list[dict]) -> dict:
+    """一次修改多個欄位（可跨多張名片），所有修改合併為一次確認與寫入。
+    updates 的每一項為 {"card_id": ..., "field": ..., "value": ...}，
+    field 可為 name、title、company、address、phone、email 或 memo。
+    同時修改多個欄位時請使用此工具，不要逐欄調用 update_namecard_field。"""
+    invalid = [
+        update for update in updates
+        if not update.get('card_id')
+        or update.get('field') not in firebase_utils.EDITABLE_FIELDS
+    ]
+    if invalid:
+        return {"status": "error", "invalid": invalid,
+                "fields": list(firebase_utils.EDITABLE_FIELDS)}
+    for update in updates:
+        _propose_change(update['card_id'], update['field'],
+                        str(update.get('value', '')))
+    return {"status": "pending",
+            "changes": len(current_request().pending_changes)}
+
+
+TOOLS = [
+    search_namecards,
+    semantic_search_namecards,
+    get_namecard_by_id,
+    display_namecard,
+    update_namecard_memo,
+    update_namecard_field,
+    update_namecard_fields,
+]
+
+
+def _card_reads() -> tuple:
+    """目前事件累計的 RTDB 讀取次數與耗時"""
+    ctx = firebase_utils.get_card_context()
+    return (ctx.reads, ctx.read_seconds) if ctx is not None else (0, 0.0)
+
+
+async def _before_model(callback_context, llm_request):
+    request = current_request()
+    ticket = await vertex_scheduler.scheduler.acquire(
+        vertex_scheduler.INTERACTIVE, request.user_id)
+    try:
+        request.trace.model_started()
+    except agent_trace.AgentBudgetExceeded:
+        vertex_scheduler.scheduler.settle(ticket, 0)
+        raise
+    request.ticket = ticket
+    llm_request.model = model_router.model_for(request.tier)
+
+
+def _after_model(callback_context, llm_response):
+    request = current_request()
+    usage = llm_response.usage_metadata
+    request.trace.model_finished(usage)
+    if request.ticket is not None:
+        tokens = ((getattr(usage, "prompt_token_count", None) or 0)
+                  + (getattr(usage, "candidates_token_count", None) or 0))
+        vertex_scheduler.scheduler.settle(
+            request.ticket, tokens or request.ticket.tokens)
+        request.ticket = None
+
+
+def _before_tool(tool, args, tool_context):
+    current_request().trace.tool_started(
+        tool_context.function_call_id, *_card_reads())
+
+
+def _after_tool(tool, args, tool_context, tool_response):
+    current_request().trace.tool_finished(
+        tool_context.function_call_id, tool.name, args, tool_response,
+        *_card_reads())
+
+
+def create_runner() -> Runner:
+    agent = Agent(
+        name=AGENT_NAME,
+        model=model_router.model_for(model_router.STANDARD),
+        instruction=AGENT_INSTRUCTION,
+        tools=TOOLS,
+        before_model_callback=_before_model,
+        after_model_callback=_after_model,
+        before_tool_callback=_before_tool,
+        after_tool_callback=_after_tool,
+        generate_content_config=GenerateContentConfig(
+            labels={"client_id": "namecard"}
+        ),
+    )
+    return Runner(
+        app_name=APP_NAME,
+        agent=agent,
+        session_service=InMemorySessionService()
+    )
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> Runner:
+    """取得行程共用的 Runner（第一次使用時建立）"""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = create_runner()
+    return _runner
+
+
+async def _create_session(runner: Runner, user_id: str, session_id: str,
+                          conversation) -> None:
+    """建立這則訊息的 session，並帶入保存的最近幾輪對話"""
+    service = runner.session_service
+    session = await service.create_session(
+        app_name=APP_NAME, user_id=user_id, session_id=session_id,
+        state=conversation.state())
+    for turn in conversation.turns:
+        for author, role, text in (("user", "user", turn["user"]),
+                                   (AGENT_NAME, "model", turn["agent"])):
+            await service.append_event(session, Event(
+                author=author,
+                content=Content(role=role, parts=[Part(text=text)])))
+
+
+def _displayed_cards(user_id: str, card_ids: list) -> list:
+    """這一輪顯示的名片 [{"card_id", "name"}]，供下一輪解析代稱"""
+    if not card_ids:
+        return []
+    summaries = firebase_utils.get_card_summaries(
+        user_id, card_ids[:agent_sessions.MAX_RECENT_CARDS])
+    return [{"card_id": card["card_id"], "name": card.get("name", "N/A")}
+            for card in summaries]
+
+
+async def _run(runner: Runner, user_id: str, msg: str, conversation) -> str:
+    """以新的 session 執行 Agent，回傳組合後的文字回覆"""
+    session_id = f"{user_id}-{uuid.uuid4().hex}"
+    try:
+        await _create_session(runner, user_id, session_id, conversation)
+        # 超過回合預算、請求時間預算用完、或因本地搜尋先回覆而取消，
+        # 都不是 Vertex AI 故障，不計入熔斷器的失敗率
+        with circuit_breaker.vertex.guard(
+                ignore=(agent_trace.AgentBudgetExceeded,
+                        deadline.DeadlineExceeded,
+                        asyncio.CancelledError)):
+            events = await deadline.wait_for(runner.run_debug(
+                msg, user_id=user_id, session_id=session_id
+            ))
+    finally:
+        await runner.session_service.delete_session(
+            app_name=APP_NAME, user_id=user_id, session_id=session_id)
+
+    # 組合 Agent 的文字回覆
+    final_text = ""
+    for ev in events:
+        if ev.content and ev.content.parts:
+            for part in ev.content.parts:
+                if part.text:
+                    final_text += part.text
+    return final_text.strip()
+
+
+async def _run_tier(user_id: str, msg: str, conversation, task: str,
+                    tier: str) -> str:
+    """以指定的模型等級執行一次 Agent，並記錄追蹤與分級統計"""
+    request = current_request()
+    request.tier = tier
+    request.found_card_ids.clear()
+    request.pending_changes.clear()
+    request.trace = agent_trace.AgentTrace(
+        config.AGENT_MAX_MODEL_CALLS, config.AGENT_MAX_TOOL_CALLS)
+    try:
+        return await _run(get_runner(), user_id, msg, conversation)
+    finally:
+        trace = request.trace
+        trace.edits = len(request.pending_changes)
+        trace.finish()
+        agent_trace.metrics.record(trace)
+        summary = trace.summary()
+        model_router.stats.record(
+            task, tier, trace.elapsed,
+            summary["prompt_tokens"], summary["output_tokens"])
+        print(f"Agent trace for {user_id} ({tier}): {summary}")
+
+
+async def run_agent(user_id: str, msg: str) -> str:
+    """在目前的 agent_request() 範圍內執行一次 Agent，回傳組合後的文字回覆
+
+    每則訊息使用獨立的 session，結束後刪除，不在共用的 session service
+    中累積資料；對話脈絡由 agent_sessions 保存。相同的唯讀查詢命中
+    response_cache 時直接沿用上次的回覆與名片，不呼叫模型。lite 模型
+    超過回合預算時改用 standard 重試一次；standard 也超過預算時拋出
+    agent_trace.AgentBudgetExceeded。
+    """
+    request = current_request()
+    key = (response_cache.cache_key(msg)
+           if config.RESPONSE_CACHE_ENABLED else None)
+    cached = response_cache.cache.get(user_id, key) if key else None
+    conversation = agent_sessions.load(user_id)
+
+    if cached is not None:
+        final_text = cached.text
+        request.found_card_ids.extend(cached.card_ids)
+    else:
+        version = response_cache.cache.version(user_id)
+        task = model_router.agent_task(msg)
+        tier = model_router.policy_tier(task)
+        try:
+            final_text = await _run_tier(
+                user_id, msg, conversation, task, tier)
+        except agent_trace.AgentBudgetExceeded:
+            if tier == model_router.STANDARD:
+                raise
+            model_router.stats.escalated(task)
+            final_text = await _run_tier(
+                user_id, msg, conversation, task, model_router.STANDARD)
+        if request.pending_changes:
+            user_states[user_id] = {
+                'action': 'pending_update',
+                'changes': [dict(change)
+                            for change in request.pending_changes],
+            }
+        if key and request.read_only:
+            response_cache.cache.put(
+                user_id, key, final_text, request.found_card_ids, version)
+
+    conversation.add_turn(msg, final_text, _displayed_cards(
+        user_id, request.found_card_ids))
+    agent_sessions.save(user_id, conversation)
+    return final_text
@@ -0,0 +1,255 @@
+"""Agent 多輪對話的精簡 session
+
+每則訊息的 ADK session 仍在執行後刪除，但對話的精簡紀錄會依 user_id
+保存在 session store 中，下一則訊息建立 session 時帶入：
+
+- 最近 AGENT_SESSION_MAX_TURNS 輪的使用者訊息與 Agent 回覆（不含工具
+  呼叫與回傳內容），以一般對話事件放進 session
+- 更早的對話壓縮成一段簡短摘要，連同最近顯示過的名片（姓名與
+  card_id）放進 session state，由 Agent 指令引用
+
+因此「把他的電話改成…」這類接續的訊息可以直接使用上一輪找到的
+card_id，不必重新搜尋整本通訊錄。超過 AGENT_SESSION_TTL_SECONDS 沒有
+對話的 session 視為過期。
+
+session store 可替換：sqlite（單機，預設）、memory（測試）、backend
+（存在 storage_backend，例如 Firebase，供多個實例共用）。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from . import config
+from .storage_backend import get_backend
+
+# 最近顯示過的名片最多記住幾張
+MAX_RECENT_CARDS = 3
+# 壓縮進摘要時，每則訊息保留的字數
+SUMMARY_CLIP_CHARS = 40
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class Conversation:
+    """單一使用者的精簡對話紀錄"""
+
+    def __init__(self, turns: list = None, summary: str = "",
+                 recent_cards: list = None, updated_at: float = 0.0):
+        self.turns = turns or []  # [{"user": ..., "agent": ...}, ...]
+        self.summary = summary
+        self.recent_cards = recent_cards or []  # [{"card_id", "name"}]
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data.get("turns"), data.get("summary", ""),
+                   data.get("recent_cards"), data.get("updated_at", 0.0))
+
+    def to_dict(self) -> dict:
+        return {
+            "turns": self.turns,
+            "summary": self.summary,
+            "recent_cards": self.recent_cards,
+            "updated_at": self.updated_at,
+        }
+
+    def is_expired(self, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        return now - self.updated_at > config.AGENT_SESSION_TTL_SECONDS
+
+    def _compact(self, turn: dict) -> None:
+        """把移出視窗的一輪對話併入摘要，超過長度時捨棄最舊的內容"""
+        line = (f"使用者：{_clip(turn['user'], SUMMARY_CLIP_CHARS)}"
+                f" → 助理：{_clip(turn['agent'], SUMMARY_CLIP_CHARS)}")
+        lines = [item for item in self.summary.split("\n") if item]
+        lines.append(line)
+        while (len(lines) > 1 and sum(map(len, lines)) + len(lines)
+               > config.AGENT_SESSION_SUMMARY_CHARS):
+            lines.pop(0)
+        self.summary = "\n".join(lines)
+
+    def add_turn(self, user_msg: str, reply: str, cards: list = (),
+                 now: float = None) -> None:
+        """記錄一輪對話；cards 為這輪顯示的名片 [{"card_id", "name"}]"""
+        self.turns.append({"user": user_msg, "agent": reply})
+        while len(self.turns) > config.AGENT_SESSION_MAX_TURNS:
+            self._compact(self.turns.pop(0))
+        if cards:
+            card_ids = {card["card_id"] for card in cards}
+            self.recent_cards = (list(cards) + [
+                card for card in self.recent_cards
+                if card["card_id"] not in card_ids])[:MAX_RECENT_CARDS]
+        self.updated_at = time.time() if now is None else now
+
+    def state(self) -> dict:
+        """帶入 ADK session state 的內容（Agent 指令以 {key?} 引用）"""
+        recent = "、".join(
+            f"{card['name']}（card_id: {card['card_id']}）"
+            for card in self.recent_cards)
+        return {
+            "conversation_summary": self.summary or "無",
+            "recent_cards": recent or "無",
+        }
+
+
+class SessionStore(ABC):
+    """session store 介面：以 user_id 存取 Conversation.to_dict()"""
+
+    @abstractmethod
+    def get(self, user_id: str):
+        """讀取 session，沒有資料時回傳 None"""
+
+    @abstractmethod
+    def put(self, user_id: str, data: dict) -> None:
+        """寫入 session"""
+
+    @abstractmethod
+    def delete(self, user_id: str) -> None:
+        """刪除 session"""
+
+
+class MemorySessionStore(SessionStore):
+    """行程內的 session store（測試用）"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str):
+        with self._lock:
+            return self._data.get(user_id)
+
+    def put(self, user_id: str, data: dict) -> None:
+        with self._lock:
+            self._data[user_id] = data
+
+    def delete(self, user_id: str) -> None:
+        with self._lock:
+            self._data.pop(user_id, None)
+
+
+class SqliteSessionStore(SessionStore):
+    """本機 SQLite session store；寫入時順便清除過期的 session"""
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS agent_sessions "
+                "(user_id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                "updated_at REAL NOT NULL)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS agent_sessions_updated_at "
+                "ON agent_sessions (updated_at)")
+
+    def get(self, user_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM agent_sessions WHERE user_id = ?",
+                (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, user_id: str, data: dict) -> None:
+        expired_before = time.time() - config.AGENT_SESSION_TTL_SECONDS
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO agent_sessions "
+                "(user_id, data, updated_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(data, ensure_ascii=False),
+                 data.get("updated_at", 0.0)))
+            self._conn.execute(
+                "DELETE FROM agent_sessions WHERE updated_at < ?",
+                (expired_before,))
+
+    def delete(self, user_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM agent_sessions WHERE user_id = ?", (user_id,))
+
+
+class BackendSessionStore(SessionStore):
+    """存在資料層後端（例如 Firebase）的 session store，多個實例共用"""
+
+    def _path(self, user_id: str) -> str:
+        return f"{config.AGENT_SESSION_PATH}/{user_id}"
+
+    def get(self, user_id: str):
+        data = get_backend().get(self._path(user_id))
+        return json.loads(data) if data is not None else None
+
+    def put(self, user_id: str, data: dict) -> None:
+        # 整份存成 JSON 字串：RTDB 不保存空陣列，也可能把陣列讀回成 dict
+        get_backend().set(
+            self._path(user_id), json.dumps(data, ensure_ascii=False))
+
+    def delete(self, user_id: str) -> None:
+        get_backend().delete(self._path(user_id))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_store(name: str) -> SessionStore:
+    if name == "sqlite":
+        os.makedirs(
+            os.path.dirname(os.path.abspath(config.AGENT_SESSION_DB)),
+            exist_ok=True)
+        return SqliteSessionStore(config.AGENT_SESSION_DB)
+    if name == "memory":
+        return MemorySessionStore()
+    if name == "backend":
+        return BackendSessionStore()
+    raise ValueError(f"Unknown AGENT_SESSION_STORE: {name}")
+
+
+def get_store() -> SessionStore:
+    """取得目前設定的 session store（第一次使用時依 config 建立）"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store(config.AGENT_SESSION_STORE)
+    return _store
+
+
+def set_store(store: SessionStore) -> None:
+    """替換 session store（測試與效能量測用）"""
+    global _store
+    _store = store
+
+
+def load(user_id: str) -> Conversation:
+    """讀取使用者的對話紀錄；不存在或已過期時回傳新的空紀錄"""
+    try:
+        data = get_store().get(user_id)
+    except Exception as e:
+        print(f"Error loading agent session: {e}")
+        data = None
+    if data is None:
+        return Conversation()
+    conversation = Conversation.from_dict(data)
+    return Conversation() if conversation.is_expired() else conversation
+
+
+def save(user_id: str, conversation: Conversation) -> None:
+    try:
+        get_store().put(user_id, conversation.to_dict())
+    except Exception as e:
+        print(f"Error saving agent session: {e}")
+
+
+def reset(user_id: str) -> None:
+    """清除使用者的對話紀錄"""
+    try:
+        get_store().delete(user_id)
+    except Exception as e:
+        print(f"Error resetting agent session: {e}")
@@ -0,0 +1,203 @@
+"""Agent 執行追蹤與回合預算
+
+AgentTrace 記錄單則訊息交給 Agent 處理時的每一次模型呼叫（延遲、輸入與
+輸出 token 數）與工具呼叫（工具名稱、參數與回傳大小、耗時，以及工具內
+RTDB 讀取的次數與耗時），由 agent_runtime 註冊在 Agent 上的 ADK
+callback 填入。
+
+- 模型呼叫超過 AGENT_MAX_MODEL_CALLS 或工具呼叫超過 AGENT_MAX_TOOL_CALLS
+  時拋出 AgentBudgetExceeded 中止執行，由 handle_smart_query 改用本地
+  備援搜尋回覆，避免少數查詢拖到十幾秒
+- 每則訊息結束後以一行 log 輸出追蹤摘要，並累計到 AgentMetrics；
+  各工具與模型呼叫的統計可在健康檢查端點 `GET /` 的 `agent` 欄位查看
+- 修改類請求另外統計每項修改平均花費的模型回合數，以及使用者確認後
+  每項修改平均的 RTDB 寫入次數（`agent.edits`）
+"""
+import json
+import threading
+import time
+
+
+class AgentBudgetExceeded(RuntimeError):
+    """Agent 的模型或工具呼叫次數超過預算"""
+
+
+def _size(value) -> int:
+    """參數或回傳值序列化後的大小（bytes），估算送回模型的內容量"""
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str)
+                   .encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(str(value).encode("utf-8"))
+
+
+class AgentTrace:
+    """單則訊息的 Agent 執行追蹤"""
+
+    def __init__(self, max_model_calls: int, max_tool_calls: int,
+                 clock=time.perf_counter):
+        self.max_model_calls = max_model_calls
+        self.max_tool_calls = max_tool_calls
+        self._clock = clock
+        self.started_at = clock()
+        self.elapsed = 0.0
+        self.model_calls = []  # [{"ms", "prompt_tokens", "output_tokens"}]
+        self.tool_calls = []   # [{"tool", "args_bytes", "result_bytes", ...}]
+        self.aborted = None    # 超過預算時的原因
+        self.edits = 0         # 這次執行提出、等待使用者確認的修改數
+        self._model_started = None
+        self._model_requested = 0
+        self._tool_requested = 0
+        self._pending_tools = {}  # function_call_id -> (開始時間, reads, 秒)
+
+    def _abort(self, reason: str):
+        self.aborted = reason
+        raise AgentBudgetExceeded(reason)
+
+    def model_started(self) -> None:
+        self._model_requested += 1
+        if self._model_requested > self.max_model_calls:
+            self._abort(f"model calls exceeded {self.max_model_calls}")
+        self._model_started = self._clock()
+
+    def model_finished(self, usage) -> None:
+        if self._model_started is None:
+            return
+        self.model_calls.append({
+            "ms": (self._clock() - self._model_started) * 1000,
+            "prompt_tokens": getattr(usage, "prompt_token_count", None) or 0,
+            "output_tokens":
+                getattr(usage, "candidates_token_count", None) or 0,
+        })
+        self._model_started = None
+
+    def tool_started(self, call_id: str, reads: int = 0,
+                     read_seconds: float = 0.0) -> None:
+        self._tool_requested += 1
+        if self._tool_requested > self.max_tool_calls:
+            self._abort(f"tool calls exceeded {self.max_tool_calls}")
+        self._pending_tools[call_id] = (self._clock(), reads, read_seconds)
+
+    def tool_finished(self, call_id: str, tool: str, args, result,
+                      reads: int = 0, read_seconds: float = 0.0) -> None:
+        started = self._pending_tools.pop(call_id, None)
+        if started is None:
+            return
+        start, start_reads, start_read_seconds = started
+        self.tool_calls.append({
+            "tool": tool,
+            "ms": (self._clock() - start) * 1000,
+            "args_bytes": _size(args),
+            "result_bytes": _size(result),
+            "reads": reads - start_reads,
+            "read_ms": (read_seconds - start_read_seconds) * 1000,
+        })
+
+    def finish(self) -> None:
+        self.elapsed = self._clock() - self.started_at
+
+    def summary(self) -> dict:
+        return {
+            "total_ms": round(self.elapsed * 1000, 1),
+            "model_calls": len(self.model_calls),
+            "model_ms": round(sum(c["ms"] for c in self.model_calls), 1),
+            "prompt_tokens": sum(c["prompt_tokens"] for c in self.model_calls),
+            "output_tokens": sum(c["output_tokens"] for c in self.model_calls),
+            "tools": [
+                f"{c['tool']}({c['ms']:.0f}ms, {c['result_bytes']}B, "
+                f"{c['reads']} reads)"
+                for c in self.tool_calls
+            ],
+            "aborted": self.aborted,
+            "edits": self.edits,
+        }
+
+
+class AgentMetrics:
+    """所有請求累計的模型與各工具統計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.aborted = 0
+            self.model_calls = 0
+            self.model_seconds = 0.0
+            self.prompt_tokens = 0
+            self.output_tokens = 0
+            self.tools = {}  # 工具名稱 -> 累計數值
+            self.edits = 0             # Agent 提出的修改數
+            self.edit_model_calls = 0  # 提出修改的執行所用的模型呼叫數
+            self.applied_edits = 0     # 使用者確認後寫入的修改數
+            self.edit_writes = 0       # 寫入這些修改的 RTDB 寫入次數
+
+    def record(self, trace: AgentTrace) -> None:
+        with self._lock:
+            self.requests += 1
+            self.aborted += trace.aborted is not None
+            if trace.edits:
+                self.edits += trace.edits
+                self.edit_model_calls += len(trace.model_calls)
+            for call in trace.model_calls:
+                self.model_calls += 1
+                self.model_seconds += call["ms"] / 1000
+                self.prompt_tokens += call["prompt_tokens"]
+                self.output_tokens += call["output_tokens"]
+            for call in trace.tool_calls:
+                stats = self.tools.setdefault(call["tool"], {
+                    "calls": 0, "ms": 0.0, "max_ms": 0.0,
+                    "result_bytes": 0, "reads": 0, "read_ms": 0.0,
+                })
+                stats["calls"] += 1
+                stats["ms"] += call["ms"]
+                stats["max_ms"] = max(stats["max_ms"], call["ms"])
+                stats["result_bytes"] += call["result_bytes"]
+                stats["reads"] += call["reads"]
+                stats["read_ms"] += call["read_ms"]
+
+    def record_applied(self, edits: int, writes: int) -> None:
+        """記錄一次確認修改：寫入的修改數與 RTDB 寫入次數"""
+        with self._lock:
+            self.applied_edits += edits
+            self.edit_writes += writes
+
+    def summary(self) -> dict:
+        with self._lock:
+            calls = max(self.model_calls, 1)
+            return {
+                "requests": self.requests,
+                "aborted": self.aborted,
+                "model_calls_per_request":
+                    self.model_calls / self.requests if self.requests else 0.0,
+                "avg_model_ms": self.model_seconds * 1000 / calls,
+                "avg_prompt_tokens": self.prompt_tokens / calls,
+                "avg_output_tokens": self.output_tokens / calls,
+                "tools": {
+                    name: {
+                        "calls": stats["calls"],
+                        "avg_ms": stats["ms"] / stats["calls"],
+                        "max_ms": stats["max_ms"],
+                        "avg_result_bytes":
+                            stats["result_bytes"] / stats["calls"],
+                        "avg_reads": stats["reads"] / stats["calls"],
+                        "avg_read_ms": stats["read_ms"] / stats["calls"],
+                    }
+                    for name, stats in self.tools.items()
+                },
+                "edits": {
+                    "proposed": self.edits,
+                    "model_calls_per_edit":
+                        self.edit_model_calls / self.edits
+                        if self.edits else 0.0,
+                    "applied": self.applied_edits,
+                    "writes_per_edit":
+                        self.edit_writes / self.applied_edits
+                        if self.applied_edits else 0.0,
+                },
+            }
+
+
+metrics = AgentMetrics()
@@ -0,0 +1,285 @@
+"""跨文字系統的名片別名（中文 ↔ 英文／拼音）
+
+雙面掃描的名片姓名常是「王大明 David Wang」，單面名片卻只有一種文字，
+搜尋「David」找不到只寫「王大明」的名片。AliasIndex 在名片寫入索引時
+為每張名片補上另一種文字的別名，交給 CardIndex 當作一般 token 寫入
+倒排表，查詢時每個 token 仍是一次查表：
+
+- 拆開中英並列的姓名／公司，學習「王大明 ↔ david wang」這類對照，
+  套用到同一使用者只有其中一種寫法的其他名片
+- 常見姓氏的拼音（漢語拼音、威妥瑪、粵語、閩南語等）與反向對照
+- 公司簡稱：去除「股份有限公司」、「Co., Ltd.」等後綴取英文縮寫，
+  以及常見公司的中英文簡稱對照表
+"""
+import re
+
+from .text_utils import TOKEN_RE, normalize_text
+
+# 姓氏 -> 常見拼法（含簡體字）
+SURNAME_ROMANIZATIONS = {
+    "王": ("wang", "wong", "ong"), "陳": ("chen", "chan", "tan"),
+    "陈": ("chen", "chan", "tan"),
+    "林": ("lin", "lam", "lim"), "黃": ("huang", "hwang", "wong", "ng"),
+    "黄": ("huang", "hwang", "wong", "ng"),
+    "張": ("zhang", "chang", "cheung", "teo"),
+    "张": ("zhang", "chang", "cheung", "teo"),
+    "李": ("li", "lee"), "吳": ("wu", "ng", "goh"), "吴": ("wu", "ng", "goh"),
+    "劉": ("liu", "lau", "lao"), "刘": ("liu", "lau", "lao"),
+    "蔡": ("cai", "tsai", "choi", "chua"),
+    "楊": ("yang", "yeung", "yeo"), "杨": ("yang", "yeung", "yeo"),
+    "許": ("xu", "hsu", "hui", "koh"), "许": ("xu", "hsu", "hui", "koh"),
+    "鄭": ("zheng", "cheng", "tay"), "郑": ("zheng", "cheng", "tay"),
+    "謝": ("xie", "hsieh", "tse", "chia"), "谢": ("xie", "hsieh", "tse"),
+    "郭": ("guo", "kuo", "kwok"), "洪": ("hong", "hung"),
+    "曾": ("zeng", "tseng", "tsang"), "邱": ("qiu", "chiu", "yau"),
+    "廖": ("liao", "liu"), "賴": ("lai",), "周": ("zhou", "chou", "chow"),
+    "徐": ("xu", "hsu", "tsui"), "蘇": ("su", "so"), "苏": ("su", "so"),
+    "葉": ("ye", "yeh", "yip"), "叶": ("ye", "yeh", "yip"),
+    "莊": ("zhuang", "chuang", "chong"), "呂": ("lu", "lyu", "lui"),
+    "江": ("jiang", "chiang", "kong"), "何": ("he", "ho"),
+    "蕭": ("xiao", "hsiao", "siu"), "萧": ("xiao", "hsiao", "siu"),
+    "羅": ("luo", "lo", "law"), "罗": ("luo", "lo", "law"),
+    "高": ("gao", "kao", "ko"), "潘": ("pan", "poon"),
+    "簡": ("jian", "chien", "kan"), "朱": ("zhu", "chu"),
+    "鍾": ("zhong", "chung"), "鐘": ("zhong", "chung"),
+    "钟": ("zhong", "chung"), "彭": ("peng", "pang"),
+    "游": ("you", "yu", "yau"), "詹": ("zhan", "chan"),
+    "胡": ("hu", "woo", "wu"), "施": ("shi", "shih", "sze"),
+    "沈": ("shen", "shum", "sim"), "余": ("yu", "yue", "yee"),
+    "趙": ("zhao", "chao", "chiu"), "赵": ("zhao", "chao", "chiu"),
+    "盧": ("lu", "lo", "lou"), "卢": ("lu", "lo", "lou"),
+    "梁": ("liang", "leung"), "顏": ("yan", "yen", "ngan"),
+    "柯": ("ke", "ko", "kua"), "孫": ("sun", "suen"), "孙": ("sun", "suen"),
+    "魏": ("wei", "ngai"), "翁": ("weng", "yung", "ong"),
+    "戴": ("dai", "tai"), "范": ("fan",), "方": ("fang", "fong"),
+    "宋": ("song", "sung"), "鄧": ("deng", "teng", "tang"),
+    "邓": ("deng", "teng", "tang"), "杜": ("du", "tu", "to"),
+    "傅": ("fu", "foo"), "侯": ("hou", "hau"), "曹": ("cao", "tsao", "tso"),
+    "薛": ("xue", "hsueh", "sit"), "丁": ("ding", "ting"),
+    "卓": ("zhuo", "cho", "cheuk"), "馬": ("ma",), "马": ("ma",),
+    "阮": ("ruan", "juan", "yuen", "nguyen"), "董": ("dong", "tung"),
+    "唐": ("tang", "tong"), "溫": ("wen", "wan"), "温": ("wen", "wan"),
+    "藍": ("lan", "lam"), "石": ("shi", "shih", "shek"),
+    "蔣": ("jiang", "chiang", "cheung"), "蒋": ("jiang", "chiang"),
+    "古": ("gu", "ku", "koo"), "紀": ("ji", "chi", "kei"),
+    "姚": ("yao", "yiu"), "連": ("lian", "lien"), "馮": ("feng", "fung"),
+    "冯": ("feng", "fung"), "歐": ("ou", "au"), "程": ("cheng", "ching"),
+    "湯": ("tang", "tong"), "黎": ("li", "lai"), "田": ("tian", "tien"),
+    "康": ("kang", "hong"), "姜": ("jiang", "chiang", "keung"),
+    "白": ("bai", "pai", "pak"), "汪": ("wang", "wong"),
+    "鄒": ("zou", "tsou", "chau"), "尤": ("you", "yu", "yau"),
+    "巫": ("wu",), "涂": ("tu",), "龔": ("gong", "kung"),
+    "嚴": ("yan", "yen", "yim"), "袁": ("yuan", "yuen"),
+    "金": ("jin", "chin", "kim"), "陸": ("lu", "luk"),
+    "夏": ("xia", "hsia", "ha"), "崔": ("cui", "tsui", "choi"),
+    "孔": ("kong", "kung"), "毛": ("mao",), "韓": ("han", "hon"),
+    "韩": ("han", "hon"), "任": ("ren", "jen", "yam"),
+    "關": ("guan", "kuan", "kwan"), "关": ("guan", "kuan", "kwan"),
+    "譚": ("tan", "tam", "tham"), "谭": ("tan", "tam"),
+    "錢": ("qian", "chien", "chin"), "秦": ("qin", "chin"),
+    "史": ("shi", "shih", "sze"), "雷": ("lei", "lui"),
+    "邵": ("shao", "shiu"), "陶": ("tao", "to"), "段": ("duan", "tuan"),
+    "歐陽": ("ouyang", "auyeung"), "司馬": ("sima", "szeto"),
+    "上官": ("shangguan",), "諸葛": ("zhuge",),
+    "張簡": ("changchien",), "范姜": ("fanchiang",),
+}
+
+# 拼音 -> 姓氏（只對英文姓名補上中文姓氏）
+_SURNAMES_BY_ROMANIZATION = {}
+for _surname, _spellings in SURNAME_ROMANIZATIONS.items():
+    for _spelling in _spellings:
+        _SURNAMES_BY_ROMANIZATION.setdefault(_spelling, []).append(_surname)
+
+# 常見公司的中英文簡稱（同一組內互為別名）
+COMPANY_ALIAS_GROUPS = (
+    ("台積電", "台灣積體電路", "tsmc"),
+    ("鴻海", "富士康", "foxconn", "hon hai"),
+    ("聯發科", "mediatek"),
+    ("中華電信", "中華電", "chunghwa telecom"),
+    ("台達電", "台達電子", "delta electronics"),
+    ("聯電", "聯華電子", "umc"),
+    ("日月光", "ase technology"),
+    ("廣達", "quanta"),
+    ("華碩", "asus"),
+    ("宏碁", "acer"),
+    ("緯創", "wistron"),
+    ("仁寶", "compal"),
+    ("和碩", "pegatron"),
+    ("台塑", "台灣塑膠", "formosa plastics"),
+    ("長榮", "evergreen"),
+    ("華航", "中華航空", "china airlines"),
+    ("台灣大哥大", "taiwan mobile"),
+    ("遠傳", "far eastone", "fetnet"),
+    ("國泰金", "國泰金控", "cathay financial"),
+    ("富邦金", "富邦金控", "fubon financial"),
+    ("中信", "中國信託", "ctbc"),
+    ("玉山銀行", "e.sun", "esun"),
+    ("微軟", "microsoft"),
+    ("谷歌", "google"),
+    ("亞馬遜", "amazon", "aws"),
+    ("輝達", "nvidia"),
+    ("英特爾", "intel"),
+    ("三星電子", "samsung"),
+    ("索尼", "sony"),
+    ("台灣高鐵", "高鐵", "thsr"),
+    ("工研院", "工業技術研究院", "itri"),
+    ("資策會", "資訊工業策進會"),
+    ("中研院", "中央研究院", "academia sinica"),
+    ("台大", "台灣大學", "ntu"),
+    ("清大", "清華大學", "nthu"),
+    ("陽明交大", "陽明交通大學", "nycu"),
+)
+_COMPANY_GROUP_BY_ALIAS = {
+    alias: group for group in COMPANY_ALIAS_GROUPS for alias in group
+}
+_COMPANY_ALIAS_RE = re.compile("|".join(
+    re.escape(alias) if not alias.isascii()
+    else rf"\b{re.escape(alias)}\b"
+    for alias in sorted(_COMPANY_GROUP_BY_ALIAS, key=len, reverse=True)))
+
+# 取英文縮寫時略過的字與公司型態後綴
+_STOP_WORDS = frozenset(("of", "and", "the", "de"))
+_LEGAL_SUFFIXES = frozenset((
+    "co", "company", "corp", "corporation", "inc", "incorporated", "ltd",
+    "limited", "llc", "plc", "gmbh", "ag", "sa", "bv", "group", "holdings",
+))
+# 縮寫中可保留的後綴（例如 Taiwan Semiconductor Manufacturing Co. -> TSMC）
+_ACRONYM_SUFFIXES = frozenset(("co", "company", "corp", "corporation"))
+
+# 有別名的欄位
+ALIAS_FIELDS = ("name", "company")
+# 同一個寫法學到超過幾種對照就視為同名不同人，不再套用
+MAX_LEARNED_ALIASES = 2
+
+
+def split_scripts(text: str) -> tuple:
+    """把中英並列的欄位拆成 (中日韓文字部分, 英數字部分)，皆已正規化"""
+    cjk_parts, latin_parts = [], []
+    for cjk, word in TOKEN_RE.findall(normalize_text(text)):
+        if cjk:
+            cjk_parts.append(cjk)
+        else:
+            latin_parts.append(word)
+    return "".join(cjk_parts), " ".join(latin_parts)
+
+
+def name_aliases(name: str) -> set:
+    """姓名的姓氏拼音，或英文姓名的中文姓氏"""
+    cjk, latin = split_scripts(name)
+    aliases = set()
+    if cjk:
+        surname = cjk[:2] if cjk[:2] in SURNAME_ROMANIZATIONS else cjk[:1]
+        aliases.update(SURNAME_ROMANIZATIONS.get(surname, ()))
+    words = latin.split()
+    if words and not cjk:
+        # 英文姓名的姓氏可能在最前面（Wang Da-Ming）或最後面（David Wang）
+        for word in {words[0], words[-1]}:
+            aliases.update(_SURNAMES_BY_ROMANIZATION.get(word, ()))
+    return aliases
+
+
+def company_aliases(company: str) -> set:
+    """公司的簡稱對照與英文縮寫"""
+    text = normalize_text(company)
+    aliases = set()
+    for match in _COMPANY_ALIAS_RE.finditer(text):
+        aliases.update(_COMPANY_GROUP_BY_ALIAS[match.group(0)])
+    words = [w for w in split_scripts(text)[1].split()
+             if w not in _STOP_WORDS]
+    core = list(words)
+    while core and core[-1] in _LEGAL_SUFFIXES:
+        core.pop()
+    if len(core) >= 2:
+        aliases.add("".join(w[0] for w in core))
+        kept = words[len(core):len(core) + 1]
+        if kept and kept[0] in _ACRONYM_SUFFIXES:
+            aliases.add("".join(w[0] for w in core) + kept[0][0])
+    return aliases
+
+
+class AliasIndex:
+    """單一使用者名片的跨文字別名
+
+    learned 記錄從中英並列欄位學到的對照（例如姓名 王大明 <-> david wang），
+    其他只有其中一種寫法的名片也會得到另一種寫法作為別名。
+    """
+
+    def __init__(self):
+        self._learned = {}     # (欄位, 寫法) -> {另一種寫法: 名片數}
+        self._holders = {}     # (欄位, 寫法) -> {card_id}
+        self._card_keys = {}   # card_id -> [(欄位, 寫法)]
+        self._card_pairs = {}  # card_id -> [(欄位, 中文, 英文)]
+
+    def _adjust(self, field: str, cjk: str, latin: str, delta: int) -> set:
+        """增減一組對照，回傳別名因此改變的名片"""
+        affected = set()
+        for key, other in (((field, cjk), latin), ((field, latin), cjk)):
+            counts = self._learned.setdefault(key, {})
+            before = len(counts)
+            count = counts.get(other, 0) + delta
+            if count > 0:
+                counts[other] = count
+            else:
+                counts.pop(other, None)
+                if not counts:
+                    del self._learned[key]
+            # 對照種類改變且仍會（或原本會）套用時，持有這個寫法的名片
+            # 需要重新計算別名
+            if (len(counts) != before
+                    and min(before, len(counts)) <= MAX_LEARNED_ALIASES):
+                affected.update(self._holders.get(key, ()))
+        return affected
+
+    def add(self, card_id: str, card_data: dict) -> set:
+        """加入名片；回傳別名因新學到的對照而改變的其他名片"""
+        keys, pairs = [], []
+        for field in ALIAS_FIELDS:
+            value = card_data.get(field)
+            if not isinstance(value, str) or value == "N/A":
+                continue
+            cjk, latin = split_scripts(value)
+            keys.extend((field, part) for part in (cjk, latin) if part)
+            if cjk and latin:
+                pairs.append((field, cjk, latin))
+        self._card_keys[card_id] = keys
+        self._card_pairs[card_id] = pairs
+        for key in keys:
+            self._holders.setdefault(key, set()).add(card_id)
+        affected = set()
+        for field, cjk, latin in pairs:
+            affected |= self._adjust(field, cjk, latin, 1)
+        affected.discard(card_id)
+        return affected
+
+    def remove(self, card_id: str) -> set:
+        """移除名片；回傳別名因對照消失而改變的其他名片"""
+        for key in self._card_keys.pop(card_id, ()):
+            holders = self._holders.get(key)
+            if holders is not None:
+                holders.discard(card_id)
+                if not holders:
+                    del self._holders[key]
+        affected = set()
+        for field, cjk, latin in self._card_pairs.pop(card_id, ()):
+            affected |= self._adjust(field, cjk, latin, -1)
+        affected.discard(card_id)
+        return affected
+
+    def aliases(self, card_data: dict) -> dict:
+        """回傳名片的別名 {欄位: {別名文字}}（不含名片本身已有的寫法）"""
+        result = {}
+        for field in ALIAS_FIELDS:
+            value = card_data.get(field)
+            if not isinstance(value, str) or value == "N/A":
+                continue
+            own = set(split_scripts(value))
+            aliases = (name_aliases(value) if field == "name"
+                       else company_aliases(value))
+            for part in own:
+                learned = self._learned.get((field, part), ())
+                if part and len(learned) <= MAX_LEARNED_ALIASES:
+                    aliases.update(learned)
+            aliases -= own
+            if aliases:
+                result[field] = aliases
+        return result
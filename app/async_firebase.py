@@ -0,0 +1,240 @@
+"""以 aiohttp 實作的非同步 Firebase REST 用戶端
+
+Firebase Admin SDK 是同步的，且使用自己的 requests session；這個用戶端
+直接呼叫 RTDB / Cloud Storage 的 REST API，並與 LINE Bot API 共用
+bot_instance 中的 aiohttp ClientSession（共用連線池），讓 Firebase I/O
+可以在事件迴圈中直接 await。
+
+- RTDB：get（shallow / orderBy / limit / startAt / endAt）、set、
+  patch（含根節點多路徑更新）、push、delete，以及以 ETag 條件寫入實作的
+  transaction
+- Storage：以 media upload 上傳並設為公開讀取
+- 權杖：Application Default Credentials，到期前自動更新
+
+FirebaseBackend.get_async 以此用戶端讀取；webhook handler 以
+firebase_utils.prefetch_cards 先在 event loop 中並行讀取要用到的名片，
+之後的同步讀取直接由 CardContext 回應。
+"""
+import asyncio
+import json
+import time
+from urllib.parse import quote
+
+import aiohttp
+
+from . import config
+from .storage_backend import _order_key
+
+FIREBASE_SCOPES = [
+    "https://www.googleapis.com/auth/firebase.database",
+    "https://www.googleapis.com/auth/userinfo.email",
+    "https://www.googleapis.com/auth/devstorage.read_write",
+]
+STORAGE_URL = "https://storage.googleapis.com"
+# 權杖在到期前多少秒就先更新
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+TRANSACTION_MAX_RETRIES = 25
+
+_NO_BODY = object()
+
+
+class AsyncFirebaseError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Firebase REST error {status}: {message}")
+        self.status = status
+
+
+class PreconditionFailedError(AsyncFirebaseError):
+    """ETag 條件寫入失敗，附帶伺服器上目前的值與 ETag"""
+
+    def __init__(self, value, etag: str):
+        super().__init__(412, "ETag mismatch")
+        self.value = value
+        self.etag = etag
+
+
+class ADCTokenProvider:
+    """以 Application Default Credentials 取得並快取 OAuth2 存取權杖"""
+
+    def __init__(self, scopes: list = None):
+        self._scopes = scopes or FIREBASE_SCOPES
+        self._credentials = None
+        self._lock = asyncio.Lock()
+
+    def _refresh(self) -> None:
+        import google.auth
+        import google.auth.transport.requests
+        if self._credentials is None:
+            self._credentials, _ = google.auth.default(scopes=self._scopes)
+        self._credentials.refresh(google.auth.transport.requests.Request())
+
+    def _needs_refresh(self) -> bool:
+        credentials = self._credentials
+        if credentials is None or not credentials.token:
+            return True
+        if credentials.expiry is None:
+            return False
+        remaining = credentials.expiry.timestamp() - time.time()
+        return remaining < TOKEN_REFRESH_MARGIN_SECONDS
+
+    async def __call__(self) -> str:
+        async with self._lock:
+            if self._needs_refresh():
+                # google-auth 的更新是同步呼叫，僅在權杖快到期時才會發生
+                await asyncio.to_thread(self._refresh)
+            return self._credentials.token
+
+
+class AsyncFirebaseClient:
+    def __init__(self, database_url: str, session_provider,
+                 token_provider=None, bucket: str = None,
+                 storage_url: str = STORAGE_URL):
+        """
+        Args:
+            database_url: RTDB 網址，例如 https://xxx.firebaseio.com/
+            session_provider: 回傳共用 aiohttp.ClientSession 的函式
+            token_provider: 回傳存取權杖的 async 函式（預設使用 ADC）
+            bucket: Cloud Storage bucket 名稱
+            storage_url: Storage API 網址（測試時可指向本機替身）
+        """
+        self._database_url = database_url.rstrip("/")
+        self._session_provider = session_provider
+        self._token_provider = token_provider or ADCTokenProvider()
+        self._bucket = bucket
+        self._storage_url = storage_url.rstrip("/")
+
+    def _url(self, path: str) -> str:
+        path = "/".join(quote(part, safe="") for part in path.strip("/")
+                        .split("/") if part)
+        return f"{self._database_url}/{path}.json"
+
+    async def _request(self, method: str, url: str, *, params=None,
+                       data=None, json_body=_NO_BODY, headers=None,
+                       timeout: float = None):
+        token = await self._token_provider()
+        request_headers = {"Authorization": f"Bearer {token}"}
+        request_headers.update(headers or {})
+        kwargs = {"params": params, "headers": request_headers}
+        if json_body is not _NO_BODY:
+            kwargs["data"] = json.dumps(json_body, ensure_ascii=False)
+            request_headers["Content-Type"] = "application/json"
+        elif data is not None:
+            kwargs["data"] = data
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        session = self._session_provider()
+        async with session.request(method, url, **kwargs) as response:
+            body = await response.text()
+            try:
+                payload = json.loads(body) if body else None
+            except ValueError:
+                payload = None
+            if response.status == 412:
+                raise PreconditionFailedError(
+                    payload, response.headers.get("ETag"))
+            if response.status >= 400:
+                message = body
+                if isinstance(payload, dict) and "error" in payload:
+                    message = payload["error"]
+                raise AsyncFirebaseError(response.status, message)
+            return payload, response.headers.get("ETag")
+
+    # ---- Realtime Database ----
+
+    async def get(self, path: str, shallow: bool = False,
+                  order_by: str = None, start_at=None, end_at=None,
+                  limit_to_first: int = None, limit_to_last: int = None,
+                  etag: bool = False, timeout: float = None):
+        """讀取節點；etag=True 時回傳 (value, etag)"""
+        params = {}
+        if shallow:
+            params["shallow"] = "true"
+        if order_by is not None:
+            params["orderBy"] = json.dumps(order_by)
+        for name, value in (("startAt", start_at), ("endAt", end_at),
+                            ("limitToFirst", limit_to_first),
+                            ("limitToLast", limit_to_last)):
+            if value is not None:
+                params[name] = json.dumps(value, ensure_ascii=False)
+        headers = {"X-Firebase-ETag": "true"} if etag else None
+        value, response_etag = await self._request(
+            "GET", self._url(path), params=params, headers=headers,
+            timeout=timeout)
+        if order_by is not None and isinstance(value, dict):
+            # REST 回傳的 JSON 不保證順序，依 RTDB 規則重新排序
+            value = dict(sorted(
+                value.items(), key=lambda item: _order_key(item, order_by)))
+        return (value, response_etag) if etag else value
+
+    async def set(self, path: str, value, if_match: str = None,
+                  timeout: float = None) -> str:
+        """覆寫節點；指定 if_match 時為條件寫入，回傳新的 ETag"""
+        headers = {"X-Firebase-ETag": "true"}
+        if if_match is not None:
+            headers["if-match"] = if_match
+        _, etag = await self._request(
+            "PUT", self._url(path), json_body=value, headers=headers,
+            timeout=timeout)
+        return etag
+
+    async def patch(self, path: str, values: dict,
+                    timeout: float = None) -> None:
+        """更新子欄位；在根節點（path 為空）呼叫即為多路徑更新"""
+        await self._request(
+            "PATCH", self._url(path), json_body=values, timeout=timeout)
+
+    async def update(self, values: dict, timeout: float = None) -> None:
+        """以根節點 PATCH 一次寫入多個路徑"""
+        await self.patch("", values, timeout=timeout)
+
+    async def push(self, path: str, value, timeout: float = None) -> str:
+        result, _ = await self._request(
+            "POST", self._url(path), json_body=value, timeout=timeout)
+        return result["name"]
+
+    async def delete(self, path: str, timeout: float = None) -> None:
+        await self._request("DELETE", self._url(path), timeout=timeout)
+
+    async def transaction(self, path: str, update_fn,
+                          timeout: float = None):
+        """以 ETag 條件寫入實作的 transaction，衝突時以最新值重試"""
+        value, etag = await self.get(path, etag=True, timeout=timeout)
+        for _ in range(TRANSACTION_MAX_RETRIES):
+            new_value = update_fn(value)
+            try:
+                await self.set(path, new_value, if_match=etag,
+                               timeout=timeout)
+                return new_value
+            except PreconditionFailedError as e:
+                value, etag = e.value, e.etag
+        raise AsyncFirebaseError(409, "Transaction aborted after retries")
+
+    # ---- Cloud Storage ----
+
+    async def upload_blob(self, name: str, data: bytes, content_type: str,
+                          timeout: float = None) -> str:
+        """上傳檔案並設為公開讀取，回傳公開 URL"""
+        url = f"{self._storage_url}/upload/storage/v1/b/{self._bucket}/o"
+        params = {
+            "uploadType": "media",
+            "name": name,
+            "predefinedAcl": "publicRead",
+        }
+        await self._request(
+            "POST", url, params=params, data=data,
+            headers={"Content-Type": content_type}, timeout=timeout)
+        return f"{self._storage_url}/{self._bucket}/{quote(name)}"
+
+
+_client = None
+
+
+def get_client() -> AsyncFirebaseClient:
+    """取得與 LINE Bot API 共用 aiohttp session 的非同步 Firebase 用戶端"""
+    global _client
+    if _client is None:
+        from .bot_instance import get_http_session
+        _client = AsyncFirebaseClient(
+            config.FIREBASE_URL, get_http_session,
+            bucket=config.FIREBASE_STORAGE_BUCKET)
+    return _client
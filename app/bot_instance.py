@@ -1,8 +1,11 @@
 
+import functools
+import inspect
+
 import aiohttp
 from linebot import AsyncLineBotApi, WebhookParser
 from linebot.aiohttp_async_http_client import AiohttpAsyncHttpClient
-from . import config
+from . import config, deadline
 
 
 class LazyLineBotApi:
@@ -20,10 +23,38 @@ class LazyLineBotApi:
         return self._api
 
     def __getattr__(self, name):
-        return getattr(self._get_api(), name)
+        attr = getattr(self._get_api(), name)
+        if inspect.iscoroutinefunction(attr) and (
+                "timeout" in inspect.signature(attr).parameters):
+            return _with_deadline(attr)
+        return attr
+
+
+def _with_deadline(method):
+    """未指定 timeout 時，以請求剩餘的時間預算作為 LINE API 的逾時
+
+    預算已用完時不設逾時照常送出，reply token 是否仍有效交由 LINE 判斷。
+    """
+    @functools.wraps(method)
+    async def call(*args, **kwargs):
+        if kwargs.get("timeout") is None:
+            try:
+                kwargs["timeout"] = deadline.timeout(reserve=0)
+            except deadline.DeadlineExceeded:
+                kwargs["timeout"] = None
+        return await method(*args, **kwargs)
+    return call
 
 
 line_bot_api = LazyLineBotApi()
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """取得與 LINE Bot API 共用的 aiohttp session（共用連線池）"""
+    line_bot_api._get_api()
+    return line_bot_api.session
+
+
 parser = WebhookParser(config.CHANNEL_SECRET)
 
 user_states = {}
@@ -0,0 +1,347 @@
+"""使用者名片的本地倒排索引
+
+取代逐張比對 name / company 子字串的備援搜尋：所有欄位都會被切成 token
+（中日韓文字取單字與雙字 bigram，英數字取整個單字與其前綴），建立
+token -> {card_id: 權重} 的倒排表。查詢時只需查表，不必掃描整本通訊錄。
+
+- 多個查詢詞（以空白分隔）優先回傳符合所有查詢詞的名片；沒有時才依
+  符合的查詢詞數量與權重排序
+- strict 查詢的英數字查詢詞必須是名片上的完整單字，不以前綴比對
+- 欄位權重：姓名 > 公司 > 職稱 > 其他欄位
+- 名片新增、修改、刪除時由 firebase_utils 增量更新索引
+- 精確比對沒有結果時，可改用 fuzzy_search 容錯比對（見 fuzzy_match）
+- 看起來像電話號碼的查詢先以正規化後的號碼反查（見 phone_index）
+- 姓名與公司另外寫入另一種文字的別名（見 alias_index），例如以
+  「David」找到只寫「王大明」的名片、以「TSMC」找到台積電
+"""
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+from . import config
+from .alias_index import AliasIndex
+from .card_record import CardStore
+from .fuzzy_match import FuzzyMatcher
+from .phone_index import PhoneIndex, looks_like_phone
+from .text_utils import TOKEN_RE, normalize_text
+
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "company": 2.0,
+    "title": 1.5,
+    "email": 1.0,
+    "phone": 1.0,
+    "address": 1.0,
+    "memo": 1.0,
+}
+# 前綴 token 的權重折扣（完整單字優先）
+PREFIX_WEIGHT = 0.5
+# 別名 token 的權重折扣（名片上實際寫的文字優先）
+ALIAS_WEIGHT = 0.5
+# 英數字單字最多建立多長的前綴
+MAX_PREFIX_LENGTH = 20
+
+
+def index_tokens(text: str) -> dict:
+    """回傳欄位內容要寫入索引的 token -> 權重倍率"""
+    tokens = {}
+    for cjk, word in TOKEN_RE.findall(normalize_text(text)):
+        if cjk:
+            for ch in cjk:
+                tokens[ch] = 1.0
+            for i in range(len(cjk) - 1):
+                tokens[cjk[i:i + 2]] = 1.0
+        else:
+            word = word[:MAX_PREFIX_LENGTH]
+            for end in range(1, len(word)):
+                tokens.setdefault(word[:end], PREFIX_WEIGHT)
+            tokens[word] = 1.0
+    return tokens
+
+
+def latin_words(text: str) -> set:
+    """回傳文字中的英數字完整單字（截斷長度與索引相同）"""
+    return {
+        word[:MAX_PREFIX_LENGTH]
+        for _, word in TOKEN_RE.findall(normalize_text(text)) if word
+    }
+
+
+def query_tokens(term: str) -> list:
+    """回傳單一查詢詞要查表的 token（中日韓文字取 bigram，英數字取單字）"""
+    tokens = []
+    for cjk, word in TOKEN_RE.findall(normalize_text(term)):
+        if cjk:
+            if len(cjk) == 1:
+                tokens.append(cjk)
+            else:
+                tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        else:
+            tokens.append(word[:MAX_PREFIX_LENGTH])
+    return list(dict.fromkeys(tokens))
+
+
+def _required_matches(token_count: int) -> int:
+    """一個查詢詞至少要命中幾個 token 才算符合
+
+    短查詢詞需全部命中；較長的中文查詢（例如「幫我查王大明電話」）只要
+    命中兩個 bigram 即可，避免查詢中夾帶的非名片文字讓結果落空，
+    命中比例較低的名片會在排序時落後。
+    """
+    return min(token_count, 2)
+
+
+class CardIndex:
+    """單一使用者的名片倒排索引"""
+
+    def __init__(self, cards: dict = None):
+        self.store = CardStore()
+        self._postings = {}    # token -> {card_id: 權重}
+        self._card_tokens = {}  # card_id -> {token: 權重}，移除時使用
+        self._card_words = {}   # card_id -> 英數字完整單字，strict 查詢使用
+        self._fuzzy = FuzzyMatcher()
+        self._phones = PhoneIndex()
+        self._aliases = AliasIndex()
+        self._lock = threading.RLock()
+        cards = cards or {}
+        # 先學完所有別名對照再建立 token，避免逐張加入時反覆重算別名
+        for card_id, card_data in cards.items():
+            self._aliases.add(card_id, card_data)
+        for card_id, card_data in cards.items():
+            self._insert(card_id, card_data)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def _tokens_for_card(self, card_data: dict) -> tuple:
+        """回傳 ({token: 權重}, 英數字完整單字集合)"""
+        weights = {}
+        words = set()
+
+        def add(text, field_weight):
+            words.update(latin_words(text))
+            for token, factor in index_tokens(text).items():
+                weight = field_weight * factor
+                if weights.get(token, 0) < weight:
+                    weights[token] = weight
+
+        for field, field_weight in FIELD_WEIGHTS.items():
+            value = card_data.get(field)
+            if isinstance(value, str) and value != "N/A":
+                add(value, field_weight)
+        for field, aliases in self._aliases.aliases(card_data).items():
+            for alias in aliases:
+                add(alias, FIELD_WEIGHTS[field] * ALIAS_WEIGHT)
+        return weights, words
+
+    def _set_tokens(self, card_id: str, tokens: dict, words: set) -> None:
+        self._clear_tokens(card_id)
+        self._card_tokens[card_id] = tokens
+        self._card_words[card_id] = words
+        for token, weight in tokens.items():
+            self._postings.setdefault(token, {})[card_id] = weight
+
+    def _clear_tokens(self, card_id: str) -> None:
+        self._card_words.pop(card_id, None)
+        for token in self._card_tokens.pop(card_id, {}):
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.pop(card_id, None)
+                if not posting:
+                    del self._postings[token]
+
+    def _reindex_aliases(self, card_ids) -> None:
+        """別名對照改變後，重新計算受影響名片的 token"""
+        for card_id in card_ids:
+            card_data = self.store.get_dict(card_id)
+            if card_data is not None:
+                self._set_tokens(card_id, *self._tokens_for_card(card_data))
+
+    def _insert(self, card_id: str, card_data: dict) -> None:
+        self.store.put(card_id, card_data)
+        self._set_tokens(card_id, *self._tokens_for_card(card_data))
+        self._fuzzy.add(card_id, card_data)
+        phone = card_data.get("phone")
+        if isinstance(phone, str):
+            self._phones.add(card_id, phone)
+
+    def _remove(self, card_id: str) -> set:
+        self.store.remove(card_id)
+        self._fuzzy.remove(card_id)
+        self._phones.remove(card_id)
+        self._clear_tokens(card_id)
+        return self._aliases.remove(card_id)
+
+    def put(self, card_id: str, card_data: dict) -> None:
+        """新增或覆寫一張名片；card_data 為 None 時移除"""
+        with self._lock:
+            affected = self._remove(card_id)
+            if card_data is not None:
+                affected |= self._aliases.add(card_id, card_data)
+                self._insert(card_id, card_data)
+            affected.discard(card_id)
+            self._reindex_aliases(affected)
+
+    def update(self, card_id: str, values: dict) -> None:
+        """套用部分欄位更新；索引中沒有這張名片時忽略"""
+        with self._lock:
+            record = self.store.get(card_id)
+            if record is not None:
+                self.put(card_id, {**record.to_dict(), **values})
+
+    def remove(self, card_id: str) -> None:
+        with self._lock:
+            self._reindex_aliases(self._remove(card_id))
+
+    def _prepare_term(self, tokens: list, strict: bool = False) -> tuple:
+        """回傳單一查詢詞的 (postings, 至少命中數, 候選 card_id 集合)"""
+        postings = sorted(
+            (self._postings.get(token, {}) for token in tokens), key=len)
+        required = (len(postings) if strict
+                    else _required_matches(len(postings)))
+        if required == len(postings):
+            # 必須全部命中時直接取交集
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            # 至少命中 required 個 token 的名片，必定出現在最稀有的
+            # len - required + 1 個 token 中，候選集合只需從這幾個取聯集
+            candidates = set()
+            for posting in postings[:len(postings) - required + 1]:
+                candidates.update(posting)
+        return postings, required, candidates
+
+    @staticmethod
+    def _score_term(postings: list, required: int, candidates) -> dict:
+        """回傳候選名片中符合查詢詞者的 {card_id: 分數}"""
+        scores = {}
+        for card_id in candidates:
+            matched = 0
+            score = 0.0
+            for posting in postings:
+                weight = posting.get(card_id)
+                if weight is not None:
+                    matched += 1
+                    score += weight
+            if matched >= required:
+                scores[card_id] = score * matched / len(postings)
+        return scores
+
+    def _score(self, terms: list, restrict: set = None) -> tuple:
+        matched_terms = {}
+        scores = {}
+        for postings, required, candidates in terms:
+            if restrict is not None:
+                candidates = restrict
+            for card_id, score in self._score_term(
+                    postings, required, candidates).items():
+                matched_terms[card_id] = matched_terms.get(card_id, 0) + 1
+                scores[card_id] = scores.get(card_id, 0.0) + score
+        return matched_terms, scores
+
+    def search(self, query: str, limit: int = None,
+               strict: bool = False) -> list:
+        """依相關度回傳 [(card_id, 分數), ...]
+
+        strict=True 時只回傳每個查詢詞的所有 token 都命中、且英數字查詢詞
+        都是名片上完整單字的名片。查詢為電話號碼且反查有結果時，直接回傳
+        反查結果。
+        """
+        if looks_like_phone(query):
+            results = self.phone_search(query, limit)
+            if results:
+                return results
+        with self._lock:
+            terms = [self._prepare_term(tokens, strict)
+                     for tokens in map(query_tokens, query.split()) if tokens]
+            if not terms:
+                return []
+            scores = {}
+            if len(terms) > 1:
+                # 有名片符合所有查詢詞時只回傳這些名片，只需為交集計分，
+                # 不必處理只符合部分查詢詞的大量名片
+                common = set.intersection(*(c for _, _, c in terms))
+                matched_terms, scores = self._score(terms, common)
+                scores = {card_id: score for card_id, score in scores.items()
+                          if matched_terms[card_id] == len(terms)}
+            if not scores and not (strict and len(terms) > 1):
+                matched_terms, scores = self._score(terms)
+            if strict:
+                words = latin_words(query)
+                scores = {card_id: score for card_id, score in scores.items()
+                          if words <= self._card_words[card_id]}
+
+        def rank(card_id):
+            return -matched_terms[card_id], -scores[card_id], card_id
+
+        if limit is not None:
+            ranked = heapq.nsmallest(limit, scores, key=rank)
+        else:
+            ranked = sorted(scores, key=rank)
+        return [(card_id, scores[card_id]) for card_id in ranked]
+
+    def phone_search(self, query: str, limit: int = None) -> list:
+        """以完整或末幾碼反查電話，回傳 [(card_id, 分數), ...]
+
+        分數為 FIELD_WEIGHTS["phone"]，完整號碼相符者排在前面。
+        """
+        with self._lock:
+            card_ids = self._phones.search(query)
+        weight = FIELD_WEIGHTS["phone"]
+        return [(card_id, weight) for card_id in card_ids[:limit]]
+
+    def fuzzy_search(self, query: str, limit: int = None) -> list:
+        """容錯比對姓名、公司、職稱，依相似度回傳 [(card_id, 分數), ...]"""
+        with self._lock:
+            return self._fuzzy.search(query, limit)
+
+
+_indexes = OrderedDict()  # u_id -> (CardIndex, 建立時間)，依最近使用排序
+_registry_lock = threading.Lock()
+
+
+def get_index(u_id: str, load_cards) -> CardIndex:
+    """取得使用者的索引；尚未建立或已過期時以 load_cards(u_id) 重新建立
+
+    load_cards 讀取失敗時必須拋出例外（而不是回傳空 dict），例外會直接
+    傳給呼叫端，不會把空的索引快取到 TTL 到期。
+    """
+    now = time.time()
+    with _registry_lock:
+        entry = _indexes.get(u_id)
+        ttl = config.CARD_INDEX_TTL_SECONDS
+        if entry is not None and now - entry[1] < ttl:
+            _indexes.move_to_end(u_id)
+            return entry[0]
+    index = CardIndex(load_cards(u_id))
+    with _registry_lock:
+        _indexes[u_id] = (index, now)
+        _indexes.move_to_end(u_id)
+        while len(_indexes) > config.CARD_INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _loaded_index(u_id: str) -> CardIndex:
+    with _registry_lock:
+        entry = _indexes.get(u_id)
+    return entry[0] if entry is not None else None
+
+
+def card_written(u_id: str, card_id: str, card_data: dict) -> None:
+    """名片新增／覆寫（card_data 為 None 表示刪除）後更新已載入的索引"""
+    index = _loaded_index(u_id)
+    if index is not None:
+        index.put(card_id, card_data)
+
+
+def card_updated(u_id: str, card_id: str, values: dict) -> None:
+    """名片部分欄位更新後更新已載入的索引"""
+    index = _loaded_index(u_id)
+    if index is not None:
+        index.update(card_id, values)
+
+
+def clear() -> None:
+    with _registry_lock:
+        _indexes.clear()
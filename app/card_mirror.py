@@ -0,0 +1,242 @@
+"""熱門使用者名片的本地鏡像
+
+MirroredBackend 包裝實際的資料層後端：對近期頻繁互動的使用者，以
+`listen()`（RTDB 為 Reference.listen 串流）訂閱其名片節點，將收到的
+put / patch 事件套用到本地鏡像，之後該使用者的名片讀取（含 shallow 與
+排序查詢）直接由記憶體回應。其他實例寫入的資料也會經由串流同步進來，
+因此多個實例之間不會讀到過期資料。
+
+- 閒置超過 CARD_MIRROR_IDLE_SECONDS 的監聽會被關閉
+- 同時開啟的監聽數量不超過 CARD_MIRROR_MAX_LISTENERS（依最近使用淘汰）
+- 初始快照尚未送達前，讀取一律直接轉給實際後端
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from . import config
+from .storage_backend import (
+    MemoryBackend, StorageBackend, _join, get_backend
+)
+
+
+class _UserMirror:
+    def __init__(self, u_id: str):
+        self.u_id = u_id
+        self.root = _join(config.NAMECARD_PATH, u_id)
+        self.tree = MemoryBackend()
+        self.ready = False
+        self.registration = None
+        self.last_access = time.time()
+
+    def apply_event(self, event) -> None:
+        """套用 RTDB 串流事件（path 相對於使用者名片節點）"""
+        if event.event_type == "put":
+            self.tree.set(event.path, event.data)
+            if event.path.strip("/") == "":
+                self.ready = True
+        elif event.event_type == "patch":
+            self.tree.update(event.path, event.data or {})
+
+    def relative(self, path: str) -> str:
+        """回傳相對於鏡像根節點的路徑；不在鏡像範圍內時回傳 None"""
+        path = _join(path)
+        if path == self.root:
+            return ""
+        if path.startswith(self.root + "/"):
+            return path[len(self.root) + 1:]
+        return None
+
+
+class MirroredBackend(StorageBackend):
+    """在實際後端前加上熱門使用者名片鏡像的資料層後端"""
+
+    def __init__(self, inner: StorageBackend, clock=time.time):
+        self.inner = inner
+        self._clock = clock
+        self._mirrors = OrderedDict()  # u_id -> _UserMirror，依最近使用排序
+        self._activity = {}            # u_id -> [事件時間]
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    # ---- 鏡像生命週期 ----
+
+    def touch(self, u_id: str) -> None:
+        """記錄使用者活動；達到熱門門檻時開啟監聽，並關閉閒置的監聽"""
+        now = self._clock()
+        self.sweep_idle(now)
+        with self._lock:
+            if u_id in self._mirrors:
+                self._mirrors[u_id].last_access = now
+                self._mirrors.move_to_end(u_id)
+                return
+            recent = [
+                t for t in self._activity.get(u_id, [])
+                if now - t < config.CARD_MIRROR_IDLE_SECONDS
+            ] + [now]
+            self._activity[u_id] = recent
+            if len(recent) < config.CARD_MIRROR_HOT_THRESHOLD:
+                return
+            del self._activity[u_id]
+            if config.CARD_MIRROR_MAX_LISTENERS <= 0:
+                return
+            while len(self._mirrors) >= config.CARD_MIRROR_MAX_LISTENERS:
+                _, evicted = self._mirrors.popitem(last=False)
+                self._close(evicted)
+            mirror = _UserMirror(u_id)
+            mirror.last_access = now
+            self._mirrors[u_id] = mirror
+        self._open(mirror)
+
+    def _open(self, mirror: _UserMirror) -> None:
+        def on_event(event):
+            with self._lock:
+                if self._mirrors.get(mirror.u_id) is mirror:
+                    mirror.apply_event(event)
+
+        try:
+            mirror.registration = self.inner.listen(mirror.root, on_event)
+        except Exception as e:
+            print(f"Error opening card mirror listener: {e}")
+            with self._lock:
+                if self._mirrors.get(mirror.u_id) is mirror:
+                    del self._mirrors[mirror.u_id]
+
+    def _close(self, mirror: _UserMirror) -> None:
+        mirror.ready = False
+        if mirror.registration is not None:
+            try:
+                mirror.registration.close()
+            except Exception as e:
+                print(f"Error closing card mirror listener: {e}")
+
+    def sweep_idle(self, now: float = None) -> None:
+        """關閉閒置過久的監聽，並清除過期的活動紀錄"""
+        now = now if now is not None else self._clock()
+        idle = config.CARD_MIRROR_IDLE_SECONDS
+        with self._lock:
+            expired = [
+                mirror for mirror in self._mirrors.values()
+                if now - mirror.last_access >= idle
+            ]
+            for mirror in expired:
+                del self._mirrors[mirror.u_id]
+            for u_id in [
+                u_id for u_id, times in self._activity.items()
+                if now - times[-1] >= idle
+            ]:
+                del self._activity[u_id]
+        for mirror in expired:
+            self._close(mirror)
+
+    def close_all(self) -> None:
+        with self._lock:
+            mirrors = list(self._mirrors.values())
+            self._mirrors.clear()
+        for mirror in mirrors:
+            self._close(mirror)
+
+    def listener_count(self) -> int:
+        return len(self._mirrors)
+
+    def _find(self, path: str) -> tuple:
+        """回傳 (已就緒的鏡像, 相對路徑)；不適用時回傳 (None, None)"""
+        parts = _join(path).split("/")
+        if len(parts) < 2 or parts[0] != config.NAMECARD_PATH:
+            return None, None
+        mirror = self._mirrors.get(parts[1])
+        if mirror is None or not mirror.ready:
+            return None, None
+        return mirror, mirror.relative(path)
+
+    # ---- 讀取：命中鏡像時由記憶體回應 ----
+
+    def get(self, path: str, shallow: bool = False):
+        with self._lock:
+            mirror, relative = self._find(path)
+            if mirror is not None:
+                self.hits += 1
+                return mirror.tree.get(relative, shallow=shallow)
+            self.misses += 1
+        return self.inner.get(path, shallow=shallow)
+
+    async def get_async(self, path: str, shallow: bool = False):
+        with self._lock:
+            mirror, relative = self._find(path)
+            if mirror is not None:
+                self.hits += 1
+                return mirror.tree.get(relative, shallow=shallow)
+            self.misses += 1
+        return await self.inner.get_async(path, shallow=shallow)
+
+    def query(self, path: str, order_by: str, start_at=None, end_at=None,
+              limit_to_first: int = None, limit_to_last: int = None):
+        with self._lock:
+            mirror, relative = self._find(path)
+            if mirror is not None:
+                self.hits += 1
+                return mirror.tree.query(
+                    relative, order_by, start_at, end_at,
+                    limit_to_first, limit_to_last)
+            self.misses += 1
+        return self.inner.query(
+            path, order_by, start_at, end_at, limit_to_first, limit_to_last)
+
+    # ---- 寫入：寫入實際後端，並立即套用到鏡像（不必等串流回送） ----
+
+    def _apply_local(self, path: str, value) -> None:
+        with self._lock:
+            mirror, relative = self._find(path)
+            if mirror is not None:
+                mirror.tree.set(relative, value)
+
+    def set(self, path: str, value) -> None:
+        self.inner.set(path, value)
+        self._apply_local(path, value)
+
+    def update(self, path: str, values: dict) -> None:
+        self.inner.update(path, values)
+        for key, value in values.items():
+            self._apply_local(_join(path, key), value)
+
+    def push(self, path: str, value) -> str:
+        key = self.inner.push(path, value)
+        self._apply_local(_join(path, key), value)
+        return key
+
+    def delete(self, path: str) -> None:
+        self.inner.delete(path)
+        self._apply_local(path, None)
+
+    def transaction(self, path: str, update_fn):
+        new_value = self.inner.transaction(path, update_fn)
+        self._apply_local(path, new_value)
+        return new_value
+
+    @property
+    def supports_listen(self) -> bool:
+        return self.inner.supports_listen
+
+    def listen(self, path: str, callback):
+        return self.inner.listen(path, callback)
+
+    def upload_blob(self, name: str, data: bytes, content_type: str) -> str:
+        return self.inner.upload_blob(name, data, content_type)
+
+    def get_blob(self, name: str) -> tuple:
+        return self.inner.get_blob(name)
+
+
+def touch(u_id: str) -> None:
+    """記錄使用者活動（未啟用鏡像時不做任何事）"""
+    backend = get_backend()
+    if isinstance(backend, MirroredBackend):
+        backend.touch(u_id)
+
+
+def close_all() -> None:
+    """關閉所有鏡像監聽（服務關閉時呼叫）"""
+    backend = get_backend()
+    if isinstance(backend, MirroredBackend):
+        backend.close_all()
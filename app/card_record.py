@@ -0,0 +1,126 @@
+"""記憶體內名片快取用的精簡名片紀錄
+
+一般的 dict 每張名片都要帶一份 hash table 與重複的欄位名稱；在行程內快取
+整本通訊錄時，改用固定欄位的 __slots__ 物件保存，並將重複出現的公司、
+職稱字串 intern 成同一個物件。需要交給 flex_messages 或 ADK 工具時，
+再以 to_dict() 轉回原本的 dict 形狀。
+"""
+import sys
+
+# 名片固定欄位（與 OCR 結果、RTDB 中的名片節點一致）
+CARD_FIELDS = (
+    "name", "title", "company", "address", "phone", "email", "memo",
+    "created_at",
+)
+# 在大量名片間常重複出現、值得 intern 的欄位
+INTERNED_FIELDS = frozenset(("title", "company"))
+
+
+class CardRecord:
+    """單張名片；未出現的欄位以 None 表示，轉回 dict 時會省略"""
+
+    __slots__ = ("card_id",) + CARD_FIELDS + ("extra",)
+
+    def __init__(self, card_id: str, **fields):
+        self.card_id = card_id
+        extra = None
+        for field in CARD_FIELDS:
+            setattr(self, field, None)
+        for field, value in fields.items():
+            if field in INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            if field in CARD_FIELDS:
+                setattr(self, field, value)
+            elif value is not None:
+                # 保留非預期的欄位，避免轉回 dict 時遺失資料
+                if extra is None:
+                    extra = {}
+                extra[field] = value
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, card_id: str, card_data: dict) -> "CardRecord":
+        return cls(card_id, **(card_data or {}))
+
+    def get(self, field: str, default=None):
+        """與 dict.get 相同的讀取介面"""
+        if field in CARD_FIELDS:
+            value = getattr(self, field)
+        elif field == "card_id":
+            value = self.card_id
+        else:
+            value = (self.extra or {}).get(field)
+        return default if value is None else value
+
+    def to_dict(self, with_id: bool = False) -> dict:
+        """轉回 get_namecard_flex_msg 使用的 dict；with_id=True 時附上 card_id"""
+        card_data = {}
+        for field in CARD_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                card_data[field] = value
+        if self.extra:
+            card_data.update(self.extra)
+        if with_id:
+            card_data["card_id"] = self.card_id
+        return card_data
+
+    def summary(self) -> dict:
+        """get_namecard_list_flex_msg 清單項目所需的摘要欄位"""
+        return {
+            "card_id": self.card_id,
+            "name": self.get("name", "N/A"),
+            "company": self.get("company", "N/A"),
+            "title": self.get("title", "N/A"),
+        }
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CardRecord):
+            return NotImplemented
+        return (self.card_id == other.card_id
+                and self.to_dict() == other.to_dict())
+
+    def __repr__(self) -> str:
+        return f"CardRecord({self.card_id!r}, {self.to_dict()!r})"
+
+
+class CardStore:
+    """單一使用者的名片快取（card_id -> CardRecord）"""
+
+    __slots__ = ("_records",)
+
+    def __init__(self, cards: dict = None):
+        self._records = {}
+        for card_id, card_data in (cards or {}).items():
+            self.put(card_id, card_data)
+
+    def put(self, card_id: str, card_data: dict) -> CardRecord:
+        record = CardRecord.from_dict(card_id, card_data)
+        self._records[card_id] = record
+        return record
+
+    def remove(self, card_id: str) -> CardRecord:
+        return self._records.pop(card_id, None)
+
+    def get(self, card_id: str) -> CardRecord:
+        return self._records.get(card_id)
+
+    def get_dict(self, card_id: str) -> dict:
+        record = self._records.get(card_id)
+        return record.to_dict() if record else None
+
+    def to_dicts(self) -> dict:
+        """轉回 get_all_cards 的形狀：{card_id: card_data}"""
+        return {
+            card_id: record.to_dict()
+            for card_id, record in self._records.items()
+        }
+
+    def __contains__(self, card_id: str) -> bool:
+        return card_id in self._records
+
+    def __iter__(self):
+        return iter(self._records.values())
+
+    def __len__(self) -> int:
+        return len(self._records)
@@ -0,0 +1,156 @@
+"""Vertex AI（Gemini 與 ADK）呼叫的熔斷器
+
+Vertex AI 故障或達到配額限制時，每則智慧查詢仍要等 ADK 呼叫逾時才會
+改用本地備援搜尋，名片辨識也會慢慢失敗。CircuitBreaker 以滑動時間窗
+（CIRCUIT_WINDOW_SECONDS）統計呼叫的失敗率與慢呼叫比例：
+
+- closed：正常呼叫；窗內至少 CIRCUIT_MIN_CALLS 次呼叫，且失敗率達
+  CIRCUIT_ERROR_RATE 或超過 CIRCUIT_SLOW_CALL_SECONDS 的比例達
+  CIRCUIT_SLOW_CALL_RATE 時轉為 open
+- open：直接拋出 CircuitOpenError，不呼叫 Vertex AI；文字查詢立即改用
+  本地搜尋，名片圖片延後辨識（見 deferred_scans）。經過
+  CIRCUIT_OPEN_SECONDS 後轉為 half_open
+- half_open：只放行 CIRCUIT_HALF_OPEN_PROBES 個試探呼叫，成功即恢復
+  closed，失敗或過慢則重新 open
+
+狀態可在健康檢查端點 `GET /` 的 `circuit` 欄位查看。
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from . import config
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """熔斷器開啟中，呼叫未送出"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, clock=time.monotonic):
+        self.name = name
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._calls = deque()  # (結束時間, 是否失敗, 是否過慢)
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened_count = 0
+        self.rejected = 0
+
+    def _trim(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > (
+                config.CIRCUIT_WINDOW_SECONDS):
+            self._calls.popleft()
+
+    def _rates(self) -> tuple:
+        count = len(self._calls)
+        if not count:
+            return 0, 0.0, 0.0
+        failed = sum(1 for _, fail, _ in self._calls if fail)
+        slow = sum(1 for _, _, is_slow in self._calls if is_slow)
+        return count, failed / count, slow / count
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self._probes = 0
+        self.opened_count += 1
+
+    def _refresh(self, now: float) -> None:
+        if self.state == OPEN and now - self._opened_at >= (
+                config.CIRCUIT_OPEN_SECONDS):
+            self.state = HALF_OPEN
+            self._probes = 0
+
+    def is_open(self) -> bool:
+        """目前是否拒絕呼叫（open，且尚未到試探時間）"""
+        with self._lock:
+            self._refresh(self._clock())
+            return self.state == OPEN
+
+    def _acquire(self) -> None:
+        with self._lock:
+            self._refresh(self._clock())
+            if self.state == HALF_OPEN and (
+                    self._probes < config.CIRCUIT_HALF_OPEN_PROBES):
+                self._probes += 1
+                return
+            if self.state != CLOSED:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit is {self.state}")
+
+    def _record(self, failed: bool, seconds: float) -> None:
+        with self._lock:
+            now = self._clock()
+            slow = seconds >= config.CIRCUIT_SLOW_CALL_SECONDS
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._calls.clear()
+                return
+            if self.state == OPEN:
+                return  # 開啟前已送出的呼叫，結果不影響狀態
+            self._calls.append((now, failed, slow))
+            self._trim(now)
+            count, error_rate, slow_rate = self._rates()
+            if count >= config.CIRCUIT_MIN_CALLS and (
+                    error_rate >= config.CIRCUIT_ERROR_RATE
+                    or slow_rate >= config.CIRCUIT_SLOW_CALL_RATE):
+                self._open(now)
+
+    @contextmanager
+    def guard(self, ignore: tuple = ()):
+        """包住一次 Vertex AI 呼叫；熔斷時拋出 CircuitOpenError
+
+        ignore 中的例外（例如 Agent 超過回合預算）不是服務故障，
+        視為成功的呼叫。
+        """
+        self._acquire()
+        start = self._clock()
+        try:
+            yield
+        except ignore:
+            self._record(False, self._clock() - start)
+            raise
+        except BaseException:
+            self._record(True, self._clock() - start)
+            raise
+        self._record(False, self._clock() - start)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls.clear()
+            self.state = CLOSED
+            self._probes = 0
+            self.opened_count = 0
+            self.rejected = 0
+
+    def summary(self) -> dict:
+        with self._lock:
+            now = self._clock()
+            self._refresh(now)
+            self._trim(now)
+            count, error_rate, slow_rate = self._rates()
+            summary = {
+                "state": self.state,
+                "window_calls": count,
+                "error_rate": error_rate,
+                "slow_rate": slow_rate,
+                "opened_count": self.opened_count,
+                "rejected": self.rejected,
+            }
+            if self.state == OPEN:
+                summary["retry_in_seconds"] = max(
+                    config.CIRCUIT_OPEN_SECONDS - (now - self._opened_at), 0)
+            return summary
+
+
+vertex = CircuitBreaker("vertex")
@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 
@@ -23,6 +24,147 @@ LOCATION = os.getenv("LOCATION", "global")
 FIREBASE_URL = os.environ.get("FIREBASE_URL")
 FIREBASE_STORAGE_BUCKET = os.environ.get("FIREBASE_STORAGE_BUCKET")
 NAMECARD_PATH = "namecard"
+NAMECARD_STATS_PATH = "namecard_stats"
+NAMECARD_SUMMARY_PATH = "namecard_summary"
+
+# =====================
+# 資料層後端設定
+# =====================
+# firebase（正式環境）、memory（測試／效能量測）、sqlite（本機開發替身）
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "firebase")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "data/namecard.db")
+# memory / sqlite 後端的 blob 由本服務的 /blobs/ 路由提供，需為對外網址
+LOCAL_BLOB_BASE_URL = os.environ.get(
+    "LOCAL_BLOB_BASE_URL", "http://localhost:8080")
+# QR Code 圖片的 blob 名稱前綴；/blobs/ 路由只提供這個前綴下的 blob
+QRCODE_BLOB_PREFIX = "qrcodes"
+
+# 熱門使用者名片的本地鏡像（以 RTDB 串流監聽保持同步）
+CARD_MIRROR_ENABLED = os.environ.get("CARD_MIRROR_ENABLED", "") == "1"
+# 閒置多久（秒）後關閉監聽
+CARD_MIRROR_IDLE_SECONDS = int(os.environ.get("CARD_MIRROR_IDLE_SECONDS", 600))
+# 同時開啟的監聽數量上限（全域）
+CARD_MIRROR_MAX_LISTENERS = int(
+    os.environ.get("CARD_MIRROR_MAX_LISTENERS", 50))
+# 閒置期間內收到幾個事件才視為熱門使用者並開啟監聽
+CARD_MIRROR_HOT_THRESHOLD = int(
+    os.environ.get("CARD_MIRROR_HOT_THRESHOLD", 3))
+
+# 本地名片搜尋索引（行程內，依使用者建立）
+# 同時保留索引的使用者數量上限（依最近使用淘汰）
+CARD_INDEX_MAX_USERS = int(os.environ.get("CARD_INDEX_MAX_USERS", 200))
+# 索引建立後多久（秒）重新載入，以納入其他實例寫入的名片
+CARD_INDEX_TTL_SECONDS = int(os.environ.get("CARD_INDEX_TTL_SECONDS", 300))
+# 單純的姓名／公司查詢直接由本地索引回覆，不經過 Agent（設為 0 關閉）
+INTENT_ROUTER_ENABLED = os.environ.get("INTENT_ROUTER_ENABLED", "1") == "1"
+# 查詢類訊息交給 Agent 時同時以本地搜尋避險：超過軟性期限（秒）仍未完成
+# 就先回覆本地結果（設為 1 開啟）
+HEDGED_SEARCH_ENABLED = os.environ.get("HEDGED_SEARCH_ENABLED", "0") == "1"
+HEDGE_SOFT_DEADLINE_SECONDS = float(
+    os.environ.get("HEDGE_SOFT_DEADLINE_SECONDS", 5))
+# 先回覆本地結果後 Agent 的處理：cancel（取消）或 push（完成後推送回答，
+# 每次推送都計入 LINE 官方帳號每月的訊息額度）
+HEDGE_LATE_ANSWER = os.environ.get("HEDGE_LATE_ANSWER", "cancel")
+# 每次 webhook 請求的時間預算（秒，見 deadline），需短於 reply token 的
+# 有效時間；外部呼叫的逾時預留 DEADLINE_REPLY_RESERVE_SECONDS 給回覆，
+# 剩餘時間不足 DEADLINE_LOW_SECONDS 時改用較快的做法
+REPLY_DEADLINE_SECONDS = float(os.environ.get("REPLY_DEADLINE_SECONDS", 30))
+DEADLINE_REPLY_RESERVE_SECONDS = float(
+    os.environ.get("DEADLINE_REPLY_RESERVE_SECONDS", 3))
+DEADLINE_LOW_SECONDS = float(os.environ.get("DEADLINE_LOW_SECONDS", 5))
+
+# 名片語意搜尋（embedding 向量索引）
+# embedding 產生器：hashing（預設，本機計算）或 vertex（Vertex AI，語意
+# 品質較好，但每張新名片都會呼叫一次 embedding API）
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "hashing")
+EMBEDDING_MODEL = os.environ.get(
+    "EMBEDDING_MODEL", "text-multilingual-embedding-002")
+EMBEDDING_DIMENSION = int(os.environ.get("EMBEDDING_DIMENSION", 768))
+# 每次呼叫 embedding API 最多送出的文字段數
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 100))
+# 各使用者向量矩陣的保存目錄（重新啟動後只需為變動的名片產生向量）
+EMBEDDING_DIR = os.environ.get("EMBEDDING_DIR", "data/embeddings")
+# 同時保留向量索引的使用者數量上限（依最近使用淘汰）
+VECTOR_INDEX_MAX_USERS = int(os.environ.get("VECTOR_INDEX_MAX_USERS", 50))
+
+# Agent 多輪對話 session
+# session store：sqlite（單機）、memory（測試）、backend（存在資料層後端，
+# 多個實例共用）
+AGENT_SESSION_STORE = os.environ.get("AGENT_SESSION_STORE", "sqlite")
+AGENT_SESSION_DB = os.environ.get(
+    "AGENT_SESSION_DB", "data/agent_sessions.db")
+AGENT_SESSION_PATH = "agent_session"
+# 多久（秒）沒有對話就重新開始
+AGENT_SESSION_TTL_SECONDS = int(
+    os.environ.get("AGENT_SESSION_TTL_SECONDS", 1800))
+# 保留完整內容的最近對話輪數，更早的對話壓縮成摘要
+AGENT_SESSION_MAX_TURNS = int(os.environ.get("AGENT_SESSION_MAX_TURNS", 4))
+# 摘要長度上限（字）
+AGENT_SESSION_SUMMARY_CHARS = int(
+    os.environ.get("AGENT_SESSION_SUMMARY_CHARS", 300))
+# 單則訊息的模型與工具呼叫次數上限，超過時中止並改用本地備援搜尋
+AGENT_MAX_MODEL_CALLS = int(os.environ.get("AGENT_MAX_MODEL_CALLS", 8))
+AGENT_MAX_TOOL_CALLS = int(os.environ.get("AGENT_MAX_TOOL_CALLS", 12))
+
+# 唯讀 Agent 查詢的回覆快取（設為 0 關閉）
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(
+    os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+RESPONSE_CACHE_TTL_SECONDS = int(
+    os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 300))
+
+# =====================
+# Gemini 模型分級
+# =====================
+# 各等級使用的模型
+MODEL_TIERS = {
+    "lite": os.environ.get("MODEL_TIER_LITE", "gemini-2.5-flash-lite"),
+    "standard": os.environ.get(
+        "MODEL_TIER_STANDARD", "gemini-3-flash-preview"),
+}
+# 各任務的起始等級，預設全部使用 standard；改用 lite 的任務在結果不理想時
+# 升級為 standard（見 model_router）。可用 MODEL_POLICY 環境變數（JSON）
+# 覆寫部分任務，例如 {"agent_query": "lite", "ocr_single": "lite"}
+MODEL_POLICY = {
+    "agent_query": "standard",  # 查詢、疑問句
+    "agent_edit": "standard",   # 含修改、新增、刪除的多步驟操作
+    "ocr_single": "standard",   # 單面名片辨識
+    "ocr_double": "standard",   # 雙面名片合併辨識
+    **json.loads(os.environ.get("MODEL_POLICY", "{}")),
+}
+# 各等級每百萬 token 的價格（美元，[輸入, 輸出]），用於成本估算；
+# 可用 MODEL_PRICES 環境變數（JSON）覆寫
+MODEL_PRICES = {
+    "lite": [0.10, 0.40],
+    "standard": [0.50, 3.00],
+    **json.loads(os.environ.get("MODEL_PRICES", "{}")),
+}
+# 單面名片辨識結果有幾個以上欄位為 N/A 時，改用 standard 重新辨識
+OCR_ESCALATE_NA_FIELDS = int(os.environ.get("OCR_ESCALATE_NA_FIELDS", 3))
+
+# Vertex AI 熔斷器（見 circuit_breaker）
+# 統計失敗率與慢呼叫比例的滑動時間窗（秒）與最少呼叫次數
+CIRCUIT_WINDOW_SECONDS = int(os.environ.get("CIRCUIT_WINDOW_SECONDS", 60))
+CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", 5))
+CIRCUIT_ERROR_RATE = float(os.environ.get("CIRCUIT_ERROR_RATE", 0.5))
+# 超過多少秒視為慢呼叫，以及慢呼叫比例門檻
+CIRCUIT_SLOW_CALL_SECONDS = float(
+    os.environ.get("CIRCUIT_SLOW_CALL_SECONDS", 20))
+CIRCUIT_SLOW_CALL_RATE = float(os.environ.get("CIRCUIT_SLOW_CALL_RATE", 0.8))
+# 開啟多久（秒）後放行試探呼叫，以及同時放行的試探呼叫數
+CIRCUIT_OPEN_SECONDS = int(os.environ.get("CIRCUIT_OPEN_SECONDS", 30))
+CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get("CIRCUIT_HALF_OPEN_PROBES", 1))
+# 熔斷期間延後辨識的名片圖片：每位使用者的上限與保留時間（秒）
+DEFERRED_SCAN_MAX_PER_USER = int(
+    os.environ.get("DEFERRED_SCAN_MAX_PER_USER", 5))
+DEFERRED_SCAN_TTL_SECONDS = int(
+    os.environ.get("DEFERRED_SCAN_TTL_SECONDS", 3600))
+
+# Gemini 呼叫排程（見 vertex_scheduler）：每分鐘請求數與 token 數配額，
+# 以及各優先權尚無實際用量時預扣的 token 數
+VERTEX_QPM = int(os.environ.get("VERTEX_QPM", 600))
+VERTEX_TPM = int(os.environ.get("VERTEX_TPM", 2_000_000))
+VERTEX_TOKEN_ESTIMATE = int(os.environ.get("VERTEX_TOKEN_ESTIMATE", 2000))
 
 # =====================
 # Gemini Prompt 設定
@@ -54,6 +196,6 @@ if CHANNEL_ACCESS_TOKEN is None:
 if PROJECT_ID is None:
     print("Specify PROJECT_ID as environment variable.")
     sys.exit(1)
-if FIREBASE_URL is None:
+if FIREBASE_URL is None and STORAGE_BACKEND == "firebase":
     print("Specify FIREBASE_URL as environment variable.")
     sys.exit(1)
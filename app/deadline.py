@@ -0,0 +1,119 @@
+"""Webhook 請求範圍的時間預算
+
+LINE 的 reply token 只在收到 webhook 後的一段時間內有效，但處理事件時
+每個外部呼叫（Gemini、Firebase、Storage、LINE）原本都沒有時間上限；
+一次慢的 Firebase 讀取接著一次慢的 Gemini 呼叫，就可能把 reply token
+的期限用完，使用者什麼都收不到。
+
+handle_callback 以 request_deadline() 開啟 REPLY_DEADLINE_SECONDS 的
+預算，存放在 ContextVar 中（會隨 asyncio task 與 asyncio.to_thread
+複製），各層依剩餘時間設定逾時：
+
+- wait_for()：以剩餘時間（預留 DEADLINE_REPLY_RESERVE_SECONDS 給回覆）
+  等待 Agent 與 Gemini 呼叫，逾時拋出 DeadlineExceeded，由
+  line_handlers 改用本地搜尋回覆，或先回覆「處理中」之後再 push
+- timeout()：提供給支援逾時參數的呼叫（LINE Bot API）
+- check()：不支援逾時參數的同步呼叫（Firebase Admin SDK、Vertex AI
+  SDK）在開始前確認還有預算，避免在 reply token 失效後才開始讀取
+
+背景工作（push message、延後辨識）以 unbounded() 建立，不受請求預算
+限制。
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from . import config
+
+
+class DeadlineExceeded(TimeoutError):
+    """請求的時間預算已用完"""
+
+
+class Deadline:
+    def __init__(self, seconds: float, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - self._clock(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_deadline: ContextVar = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def request_deadline(seconds: float = None):
+    """開啟請求範圍的時間預算（預設 REPLY_DEADLINE_SECONDS），離開時還原"""
+    deadline = Deadline(
+        config.REPLY_DEADLINE_SECONDS if seconds is None else seconds)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def unbounded():
+    """在不受請求預算限制的範圍內執行（例如建立背景 task）"""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current() -> Deadline:
+    """目前的時間預算；不在請求範圍內時回傳 None"""
+    return _deadline.get()
+
+
+def timeout(reserve: float = None) -> float:
+    """剩餘時間扣掉 reserve（預設 DEADLINE_REPLY_RESERVE_SECONDS）
+
+    不在請求範圍內時回傳 None（不設逾時）；已沒有剩餘時間時拋出
+    DeadlineExceeded。
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    if reserve is None:
+        reserve = config.DEADLINE_REPLY_RESERVE_SECONDS
+    remaining = deadline.remaining() - reserve
+    if remaining <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return remaining
+
+
+def check(reserve: float = None) -> None:
+    """沒有剩餘時間時拋出 DeadlineExceeded"""
+    timeout(reserve)
+
+
+def running_low() -> bool:
+    """剩餘時間是否已不足 DEADLINE_LOW_SECONDS，應改用較快的做法"""
+    deadline = _deadline.get()
+    return deadline is not None and (
+        deadline.remaining() - config.DEADLINE_REPLY_RESERVE_SECONDS
+        < config.DEADLINE_LOW_SECONDS)
+
+
+async def wait_for(awaitable, reserve: float = None):
+    """以剩餘時間等待 awaitable，逾時拋出 DeadlineExceeded"""
+    try:
+        seconds = timeout(reserve)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    if seconds is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError as e:
+        raise DeadlineExceeded("request deadline exceeded") from e
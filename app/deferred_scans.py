@@ -0,0 +1,63 @@
+"""熔斷期間延後辨識的名片圖片
+
+Vertex AI 熔斷器開啟時（見 circuit_breaker），收到的名片圖片不送出
+辨識，而是保留在行程內的佇列；熔斷器恢復後由
+line_handlers.process_deferred_scans 辨識、存檔，並以 push message
+通知使用者。
+
+- 每位使用者最多保留 DEFERRED_SCAN_MAX_PER_USER 張
+- 超過 DEFERRED_SCAN_TTL_SECONDS 仍未處理的圖片直接捨棄
+"""
+import threading
+import time
+from collections import namedtuple
+
+from . import config
+
+Job = namedtuple(
+    "Job", ["user_id", "image_bytes", "front_image_bytes", "queued_at"])
+
+
+class DeferredScans:
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._jobs = []
+
+    def _drop_expired(self) -> None:
+        now = self._clock()
+        self._jobs = [
+            job for job in self._jobs
+            if now - job.queued_at < config.DEFERRED_SCAN_TTL_SECONDS
+        ]
+
+    def add(self, user_id: str, image_bytes: bytes,
+            front_image_bytes: bytes = None) -> bool:
+        """保留一張圖片；該使用者已達上限時回傳 False"""
+        with self._lock:
+            self._drop_expired()
+            pending = sum(1 for job in self._jobs if job.user_id == user_id)
+            if pending >= config.DEFERRED_SCAN_MAX_PER_USER:
+                return False
+            self._jobs.append(
+                Job(user_id, image_bytes, front_image_bytes, self._clock()))
+            return True
+
+    def pop_all(self) -> list:
+        """取出所有未過期的圖片（依保留順序）"""
+        with self._lock:
+            self._drop_expired()
+            jobs, self._jobs = self._jobs, []
+            return jobs
+
+    def requeue(self, jobs: list) -> None:
+        """把尚未處理的圖片放回佇列前端"""
+        with self._lock:
+            self._jobs = list(jobs) + self._jobs
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+
+queue = DeferredScans()
@@ -0,0 +1,154 @@
+"""名片語意搜尋使用的文字向量（embedding）產生器
+
+- VertexEmbedder：正式環境使用 Vertex AI 文字 embedding 模型
+- HashingEmbedder：以 feature hashing 在本機產生向量，不需網路，
+  供測試與效能量測使用
+
+兩者都回傳 L2 正規化後的 float32 矩陣（每列一段文字），內積即為 cosine
+相似度。使用哪一個由 config.EMBEDDING_BACKEND 決定，測試可以
+set_embedder() 替換。
+"""
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from . import config
+from .text_utils import TOKEN_RE, normalize_text
+
+# 用來產生名片 embedding 的欄位（電話、Email 等不具語意，不列入）
+EMBEDDED_FIELDS = ("name", "title", "company", "address", "memo")
+
+
+def card_text(card: dict) -> str:
+    """組合名片要產生 embedding 的文字"""
+    return "\n".join(
+        value for value in (card.get(field) for field in EMBEDDED_FIELDS)
+        if isinstance(value, str) and value and value != "N/A")
+
+
+def text_digest(text: str) -> str:
+    """名片文字的摘要值，用來判斷已保存的向量是否過期"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class Embedder(ABC):
+    """embedding 產生器介面"""
+
+    name = ""
+    dimension = 0
+    remote = False  # 是否呼叫 Vertex AI（需經過排程與熔斷器）
+
+    @abstractmethod
+    def embed(self, texts: list, query: bool = False) -> np.ndarray:
+        """回傳 (len(texts), dimension) 的 float32 矩陣
+
+        query=True 表示輸入為查詢句，否則為名片內容（部分模型會區分兩者）。
+        """
+
+
+class HashingEmbedder(Embedder):
+    """以 token 雜湊到固定維度的本機 embedding
+
+    中日韓文字取單字與 bigram，英數字取整個單字，每個 token 依雜湊值
+    決定維度與正負號。只能反映字面重疊，不具真正的語意理解。
+    """
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}"
+
+    def _tokens(self, text: str) -> list:
+        tokens = []
+        for cjk, word in TOKEN_RE.findall(normalize_text(text)):
+            if cjk:
+                tokens.extend(cjk)
+                tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            else:
+                tokens.append(word)
+        return tokens
+
+    def embed(self, texts: list, query: bool = False) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in self._tokens(text):
+                digest = hashlib.blake2b(
+                    token.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                sign = 1.0 if value & 1 else -1.0
+                matrix[row, (value >> 1) % self.dimension] += sign
+        return normalize_rows(matrix)
+
+
+class VertexEmbedder(Embedder):
+    """Vertex AI 文字 embedding 模型（依 EMBEDDING_BATCH_SIZE 分批呼叫）"""
+
+    remote = True
+
+    def __init__(self, model_name: str = None):
+        self.name = model_name or config.EMBEDDING_MODEL
+        self.dimension = config.EMBEDDING_DIMENSION
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import vertexai
+                    from vertexai.language_models import TextEmbeddingModel
+                    vertexai.init(
+                        project=config.PROJECT_ID, location=config.LOCATION)
+                    self._model = TextEmbeddingModel.from_pretrained(
+                        self.name)
+        return self._model
+
+    def embed(self, texts: list, query: bool = False) -> np.ndarray:
+        from vertexai.language_models import TextEmbeddingInput
+        model = self._get_model()
+        task_type = "RETRIEVAL_QUERY" if query else "RETRIEVAL_DOCUMENT"
+        vectors = []
+        for start in range(0, len(texts), config.EMBEDDING_BATCH_SIZE):
+            batch = texts[start:start + config.EMBEDDING_BATCH_SIZE]
+            embeddings = model.get_embeddings(
+                [TextEmbeddingInput(text, task_type) for text in batch],
+                output_dimensionality=self.dimension)
+            vectors.extend(embedding.values for embedding in embeddings)
+        if not vectors:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def create_embedder(name: str) -> Embedder:
+    if name == "vertex":
+        return VertexEmbedder()
+    if name == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {name}")
+
+
+def get_embedder() -> Embedder:
+    """取得目前設定的 embedding 產生器（第一次使用時依 config 建立）"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = create_embedder(config.EMBEDDING_BACKEND)
+    return _embedder
+
+
+def set_embedder(embedder: Embedder) -> None:
+    """替換 embedding 產生器（測試與效能量測用）"""
+    global _embedder
+    _embedder = embedder
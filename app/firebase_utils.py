@@ -1,30 +1,198 @@
-from firebase_admin import db, storage
-from . import config
+from . import (
+    card_index, config, deadline, response_cache, stats_utils, vector_index
+)
+from .storage_backend import get_backend
 from io import BytesIO
 from datetime import datetime
-from collections import Counter
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+BULK_FETCH_MAX_WORKERS = 8
+
+# 反正規化摘要節點只保留清單／消歧義畫面需要的欄位
+SUMMARY_FIELDS = ("name", "company", "title", "created_at")
+# 使用者（或 Agent）可以修改的名片欄位
+EDITABLE_FIELDS = (
+    "name", "title", "company", "address", "phone", "email", "memo")
+
+
+class CardContext:
+    """單一 webhook 事件範圍內的名片 identity map。
+
+    同一個事件中，每個名片路徑最多只向 RTDB 讀取一次；
+    寫入後直接套用到本地快取，不再重新讀取。
+    `reads` 記錄此事件實際發出的 RTDB 讀取次數，供回歸測試使用；
+    `read_seconds` 為其中單筆讀取（_fetch）的累計耗時，供 Agent 追蹤使用；
+    `writes` 記錄名片、摘要與統計節點的寫入次數。
+    """
+
+    def __init__(self):
+        self.cards = {}      # (u_id, card_id) -> dict 或 None（確認不存在）
+        self.all_cards = {}  # u_id -> {card_id: dict}
+        self.reads = 0
+        self.read_seconds = 0.0
+        self.writes = 0
+
+    def lookup(self, u_id: str, card_id: str):
+        """回傳 (是否命中, 名片資料)"""
+        if (u_id, card_id) in self.cards:
+            return True, self.cards[(u_id, card_id)]
+        if u_id in self.all_cards:
+            return True, self.all_cards[u_id].get(card_id)
+        return False, None
+
+    def store_card(self, u_id: str, card_id: str, card: dict) -> None:
+        self.cards[(u_id, card_id)] = card
+        if u_id in self.all_cards:
+            if card is None:
+                self.all_cards[u_id].pop(card_id, None)
+            else:
+                self.all_cards[u_id][card_id] = card
+
+    def apply_update(self, u_id: str, card_id: str, values: dict) -> None:
+        """將已寫入 RTDB 的欄位套用到快取（未快取的名片不做部分快取）"""
+        hit, card = self.lookup(u_id, card_id)
+        if hit and card is not None:
+            card = {**card, **values}
+            self.store_card(u_id, card_id, card)
+
+
+_card_context: ContextVar = ContextVar("card_context", default=None)
+
+
+@contextmanager
+def card_context():
+    """開啟一個請求範圍的 CardContext，離開時自動還原"""
+    ctx = CardContext()
+    token = _card_context.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _card_context.reset(token)
+
+
+def get_card_context() -> CardContext:
+    """取得目前的 CardContext；不在請求範圍內時回傳 None"""
+    return _card_context.get()
+
+
+def _fetch(path: str):
+    """實際向 RTDB 讀取資料，並累計目前事件的讀取次數
+
+    Firebase Admin SDK 不支援單次呼叫的逾時，請求的時間預算用完後不再
+    開始新的讀取（拋出 deadline.DeadlineExceeded）。
+    """
+    deadline.check(reserve=0)
+    ctx = _card_context.get()
+    if ctx is None:
+        return get_backend().get(path)
+    ctx.reads += 1
+    start = time.perf_counter()
+    try:
+        return get_backend().get(path)
+    finally:
+        ctx.read_seconds += time.perf_counter() - start
+
+
+def _wrote(count: int = 1) -> None:
+    """累計目前事件對 RTDB 發出的寫入次數"""
+    ctx = _card_context.get()
+    if ctx is not None:
+        ctx.writes += count
+
+
+def _fetch_card(u_id: str, card_id: str) -> dict:
+    """讀取單張名片，同一事件中重複讀取會直接使用快取"""
+    ctx = _card_context.get()
+    if ctx is not None:
+        hit, card = ctx.lookup(u_id, card_id)
+        if hit:
+            return dict(card) if card is not None else None
+    card = _fetch(f"{config.NAMECARD_PATH}/{u_id}/{card_id}")
+    if ctx is not None:
+        ctx.store_card(u_id, card_id, card)
+        return dict(card) if card is not None else None
+    return card
+
+
+async def prefetch_cards(u_id: str, card_ids: list) -> None:
+    """在 event loop 中並行讀取名片放入 CardContext，之後的同步讀取直接命中
+
+    Firebase 後端以非同步 REST 讀取（見 async_firebase），不阻塞 event
+    loop。讀取失敗時不做任何事，由之後的同步讀取處理。
+    """
+    ctx = _card_context.get()
+    if ctx is None:
+        return
+    missing = [card_id for card_id in dict.fromkeys(card_ids)
+               if card_id and not ctx.lookup(u_id, card_id)[0]]
+    if not missing:
+        return
+    try:
+        deadline.check(reserve=0)
+        start = time.perf_counter()
+        cards = await asyncio.gather(*(
+            get_backend().get_async(
+                f"{config.NAMECARD_PATH}/{u_id}/{card_id}")
+            for card_id in missing))
+    except Exception as e:
+        print(f"Error prefetching namecards: {e}")
+        return
+    ctx.reads += len(missing)
+    ctx.read_seconds += time.perf_counter() - start
+    for card_id, card in zip(missing, cards):
+        ctx.store_card(u_id, card_id, card)
+
+
+def load_all_cards(u_id: str) -> dict:
+    """取得使用者所有名片資料；讀取失敗時直接拋出例外
+
+    供索引等會快取結果的呼叫端使用，失敗的讀取不會被當成空的名片簿。
+    """
+    ctx = _card_context.get()
+    if ctx is not None and u_id in ctx.all_cards:
+        return dict(ctx.all_cards[u_id])
+    namecard_data = _fetch(f"{config.NAMECARD_PATH}/{u_id}") or {}
+    if ctx is not None:
+        ctx.all_cards[u_id] = dict(namecard_data)
+        return dict(namecard_data)
+    return namecard_data
 
 
 def get_all_cards(u_id: str) -> dict:
     """取得使用者所有名片資料"""
     try:
-        ref = db.reference(f"{config.NAMECARD_PATH}/{u_id}")
-        namecard_data = ref.get()
-        return namecard_data or {}
+        return load_all_cards(u_id)
+    except deadline.DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error fetching namecards: {e}")
         return {}
 
 
 def add_namecard(namecard_obj: dict, u_id: str) -> str:
-    """新增名片資料到 Firebase 並回傳 card_id"""
+    """新增名片資料並回傳 card_id"""
     try:
         # 加入建立時間戳記
         namecard_obj['created_at'] = datetime.now().isoformat()
-
-        ref = db.reference(f"{config.NAMECARD_PATH}/{u_id}")
-        new_card_ref = ref.push(namecard_obj)
-        return new_card_ref.key  # 回傳新資料的唯一 ID
+        has_summaries = _backfill_card_summaries(u_id)
+
+        card_id = get_backend().push(
+            f"{config.NAMECARD_PATH}/{u_id}", namecard_obj)
+        _wrote()
+        ctx = _card_context.get()
+        if ctx is not None:
+            ctx.store_card(u_id, card_id, dict(namecard_obj))
+        card_index.card_written(u_id, card_id, namecard_obj)
+        response_cache.cache.invalidate(u_id)
+        vector_index.card_written(u_id, card_id, namecard_obj)
+        if has_summaries:
+            _write_summary(u_id, card_id, namecard_obj)
+        _update_statistics(u_id, None, namecard_obj)
+        return card_id  # 回傳新資料的唯一 ID
     except Exception as e:
         print(f"Error adding namecard: {e}")
         return None
@@ -32,27 +200,29 @@ def add_namecard(namecard_obj: dict, u_id: str) -> str:
 
 def update_namecard_memo(card_id: str, u_id: str, memo: str) -> bool:
     """更新指定名片的備忘錄"""
-    try:
-        ref = db.reference(f"{config.NAMECARD_PATH}/{u_id}/{card_id}")
-        ref.update({"memo": memo})
-        return True
-    except Exception as e:
-        print(f"Error updating memo: {e}")
-        return False
+    return update_namecard_fields(u_id, {card_id: {"memo": memo}})
 
 
 def remove_redundant_data(u_id: str) -> None:
     """移除重複 email 的名片資料"""
     try:
-        ref = db.reference(f"{config.NAMECARD_PATH}/{u_id}")
-        namecard_data = ref.get()
+        namecard_data = get_all_cards(u_id)
         if namecard_data:
             email_map = {}
+            ctx = _card_context.get()
             for key, value in namecard_data.items():
                 email = value.get("email")
                 if email:
                     if email in email_map:
-                        ref.child(key).delete()
+                        get_backend().delete(
+                            f"{config.NAMECARD_PATH}/{u_id}/{key}")
+                        _write_summary(u_id, key, None)
+                        if ctx is not None:
+                            ctx.store_card(u_id, key, None)
+                        card_index.card_written(u_id, key, None)
+                        response_cache.cache.invalidate(u_id)
+                        vector_index.card_written(u_id, key, None)
+                        _update_statistics(u_id, value, None)
                     else:
                         email_map[email] = key
     except Exception as e:
@@ -65,13 +235,15 @@ def check_if_card_exists(namecard_obj: dict, u_id: str) -> str:
         email = namecard_obj.get("email")
         if not email:
             return None
-        ref = db.reference(f"{config.NAMECARD_PATH}/{u_id}")
-        namecard_data = ref.get()
+        namecard_data = get_all_cards(u_id)
         if namecard_data:
             for card_id, value in namecard_data.items():
                 if value.get("email") == email:
                     return card_id  # 回傳已存在名片的 ID
         return None
+    except deadline.DeadlineExceeded:
+        # 無法確認時不可當成不存在，否則會重複新增名片
+        raise
     except Exception as e:
         print(f"Error checking if namecard exists: {e}")
         return None
@@ -80,8 +252,7 @@ def check_if_card_exists(namecard_obj: dict, u_id: str) -> str:
 def get_name_from_card(u_id: str, card_id: str) -> str:
     """從 Firebase 取得名片主人的名字"""
     try:
-        ref = db.reference(f"{config.NAMECARD_PATH}/{u_id}/{card_id}")
-        card_doc = ref.get()
+        card_doc = _fetch_card(u_id, card_id)
         if not card_doc:
             return None
         return card_doc.get('name', '這位聯絡人')
@@ -93,29 +264,359 @@ def get_name_from_card(u_id: str, card_id: str) -> str:
 def get_card_by_id(u_id: str, card_id: str) -> dict:
     """用 card_id 取得名片"""
     try:
-        ref = db.reference(f"{config.NAMECARD_PATH}/{u_id}/{card_id}")
-        return ref.get()
+        return _fetch_card(u_id, card_id)
     except Exception as e:
         print(f"Error getting card by id: {e}")
         return None
 
 
+def get_cards_by_ids(u_id: str, card_ids: list) -> dict:
+    """一次取得多張名片，回傳 {card_id: 名片資料}（依 card_ids 順序，略過不存在者）
+
+    優先使用本次事件已載入的名片（例如 Agent 呼叫過 get_namecard_by_id），
+    缺少的名片才以多執行緒並行讀取，避免逐筆串行的 N+1 讀取。
+    """
+    ctx = _card_context.get()
+    cards = {}
+    missing = []
+    for card_id in dict.fromkeys(card_ids):
+        hit, card = ctx.lookup(u_id, card_id) if ctx else (False, None)
+        if hit:
+            cards[card_id] = card
+        else:
+            missing.append(card_id)
+
+    if missing:
+        deadline.check(reserve=0)
+        paths = [f"{config.NAMECARD_PATH}/{u_id}/{card_id}"
+                 for card_id in missing]
+        if ctx is not None:
+            ctx.reads += len(paths)
+
+        def fetch(path):
+            try:
+                return get_backend().get(path)
+            except Exception as e:
+                print(f"Error getting card {path}: {e}")
+                return None
+
+        workers = min(BULK_FETCH_MAX_WORKERS, len(paths))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fetched = list(executor.map(fetch, paths))
+        for card_id, card in zip(missing, fetched):
+            cards[card_id] = card
+            if ctx is not None:
+                ctx.store_card(u_id, card_id, card)
+
+    return {
+        card_id: dict(cards[card_id])
+        for card_id in dict.fromkeys(card_ids)
+        if cards.get(card_id) is not None
+    }
+
+
+def search_cards(u_id: str, query: str, limit: int = None,
+                 strict: bool = False) -> dict:
+    """以本地倒排索引搜尋名片，依相關度回傳 {card_id: card_data}
+
+    索引首次使用（或過期）時才會下載整本通訊錄建立，之後的查詢與名片
+    寫入都在記憶體中完成。strict=True 時只回傳完全符合所有查詢詞的名片。
+    """
+    try:
+        index = card_index.get_index(u_id, load_all_cards)
+        return {
+            card_id: index.store.get_dict(card_id)
+            for card_id, _ in index.search(query, limit, strict=strict)
+        }
+    except Exception as e:
+        print(f"Error searching namecards: {e}")
+        return {}
+
+
+def fuzzy_search_cards(u_id: str, query: str, limit: int = 8) -> list:
+    """容錯比對姓名、公司、職稱，回傳相似度最高的名片摘要清單
+
+    回傳格式與 get_card_summaries 相同，可直接用於清單 Flex Message。
+    """
+    try:
+        index = card_index.get_index(u_id, load_all_cards)
+        return [
+            index.store.get(card_id).summary()
+            for card_id, _ in index.fuzzy_search(query, limit)
+        ]
+    except Exception as e:
+        print(f"Error fuzzy searching namecards: {e}")
+        return []
+
+
+def search_card_summaries(u_id: str, query: str, limit: int = 10) -> list:
+    """搜尋名片並回傳前 limit 筆摘要；關鍵字沒有相符時改用容錯比對"""
+    try:
+        index = card_index.get_index(u_id, load_all_cards)
+        results = (index.search(query, limit)
+                   or index.fuzzy_search(query, limit))
+        return [index.store.get(card_id).summary() for card_id, _ in results]
+    except Exception as e:
+        print(f"Error searching namecard summaries: {e}")
+        return []
+
+
+async def semantic_search_cards(u_id: str, description: str,
+                                limit: int = 5) -> list:
+    """以描述文字做語意搜尋，回傳最相近的名片摘要（附 score 相似度）"""
+    try:
+        index = card_index.get_index(u_id, load_all_cards)
+        results = (await vector_index.search(
+            u_id, [description], load_all_cards, limit))[0]
+        return [
+            {**index.store.get(card_id).summary(), "score": round(score, 3)}
+            for card_id, score in results if card_id in index.store
+        ]
+    except Exception as e:
+        print(f"Error semantic searching namecards: {e}")
+        return []
+
+
+def card_summary(card: dict) -> dict:
+    """從完整名片擷取摘要欄位"""
+    return {
+        field: card[field] for field in SUMMARY_FIELDS if card.get(field)
+    }
+
+
+def _write_summary(u_id: str, card_id: str, card: dict) -> None:
+    """同步寫入（card 為 None 時刪除）名片的反正規化摘要"""
+    try:
+        get_backend().set(
+            f"{config.NAMECARD_SUMMARY_PATH}/{u_id}/{card_id}",
+            card_summary(card) if card is not None else None)
+        _wrote()
+    except Exception as e:
+        print(f"Error writing card summary: {e}")
+
+
+def _backfill_card_summaries(u_id: str) -> bool:
+    """摘要節點尚未建立（舊資料）時先從完整名片補建，回傳是否可寫入摘要
+
+    須在名片寫入之前呼叫：只有單張名片或部分欄位的摘要節點會被
+    get_card_summary_page 當成完整清單。補建失敗時回傳 False，呼叫端
+    不寫入摘要，由 get_card_summary_page 之後補建。
+    """
+    path = f"{config.NAMECARD_SUMMARY_PATH}/{u_id}"
+    try:
+        ctx = _card_context.get()
+        if ctx is not None:
+            ctx.reads += 1
+        # 只查詢一筆確認節點存在，不下載整個摘要節點
+        if get_backend().query(path, "created_at", limit_to_first=1):
+            return True
+        summaries = {
+            card_id: card_summary(card)
+            for card_id, card in load_all_cards(u_id).items()
+        }
+        if summaries:
+            get_backend().set(path, summaries)
+            _wrote()
+        return True
+    except Exception as e:
+        print(f"Error backfilling card summaries: {e}")
+        return False
+
+
+def rebuild_card_summaries(u_id: str) -> int:
+    """從完整名片重建摘要節點，回傳摘要筆數"""
+    try:
+        summaries = {
+            card_id: card_summary(card)
+            for card_id, card in load_all_cards(u_id).items()
+        }
+        get_backend().set(
+            f"{config.NAMECARD_SUMMARY_PATH}/{u_id}", summaries)
+        return len(summaries)
+    except Exception as e:
+        print(f"Error rebuilding card summaries: {e}")
+        return 0
+
+
+def count_cards(u_id: str) -> int:
+    """以 shallow 查詢只取得 key 來計算名片數量，不下載名片內容"""
+    try:
+        ctx = _card_context.get()
+        if ctx is not None and u_id in ctx.all_cards:
+            return len(ctx.all_cards[u_id])
+        if ctx is not None:
+            ctx.reads += 1
+        keys = get_backend().get(
+            f"{config.NAMECARD_PATH}/{u_id}", shallow=True)
+        return len(keys or {})
+    except Exception as e:
+        print(f"Error counting namecards: {e}")
+        return 0
+
+
+def _query_page(path: str, order_by: str, limit: int,
+                cursor: tuple, descending: bool) -> tuple:
+    """依子欄位排序取得一頁資料，回傳 ([(key, value)], next_cursor)
+
+    cursor 為上一頁最後一筆的 (排序值, key)。RTDB 的 start_at / end_at
+    只接受排序值，同值的資料須在本地依 key 略過，必要時擴大讀取量。
+    """
+    fetch_size = limit + 1
+    while True:
+        bound = cursor[0] if cursor else None
+        if descending:
+            result = get_backend().query(
+                path, order_by, end_at=bound, limit_to_last=fetch_size)
+            items = list(result.items())[::-1]
+        else:
+            result = get_backend().query(
+                path, order_by, start_at=bound, limit_to_first=fetch_size)
+            items = list(result.items())
+        ctx = _card_context.get()
+        if ctx is not None:
+            ctx.reads += 1
+
+        exhausted = len(result) < fetch_size
+        if cursor:
+            value, key = cursor
+            items = [
+                (k, v) for k, v in items
+                if (v or {}).get(order_by) != value
+                or (k < key if descending else k > key)
+            ]
+        if len(items) > limit or exhausted:
+            break
+        fetch_size *= 2
+
+    page = items[:limit]
+    next_cursor = None
+    if len(items) > limit:
+        last_key, last_value = page[-1]
+        next_cursor = ((last_value or {}).get(order_by), last_key)
+    return page, next_cursor
+
+
+def get_card_summary_page(
+        u_id: str, order_by: str = "created_at", limit: int = 8,
+        cursor: tuple = None, descending: bool = None) -> tuple:
+    """分頁讀取名片摘要（name/company/title），回傳 ([摘要], next_cursor)
+
+    order_by 可為 created_at（預設新到舊）或 name（預設依筆劃／字母排序）。
+    """
+    if descending is None:
+        descending = order_by == "created_at"
+    path = f"{config.NAMECARD_SUMMARY_PATH}/{u_id}"
+    try:
+        page, next_cursor = _query_page(
+            path, order_by, limit, cursor, descending)
+        if not page and not cursor and count_cards(u_id):
+            # 舊資料尚未建立摘要節點，補建後重新查詢
+            rebuild_card_summaries(u_id)
+            page, next_cursor = _query_page(
+                path, order_by, limit, cursor, descending)
+        summaries = [
+            {"card_id": card_id, **(summary or {})}
+            for card_id, summary in page
+        ]
+        return summaries, next_cursor
+    except Exception as e:
+        print(f"Error querying card summaries: {e}")
+        return [], None
+
+
+def get_card_summaries(u_id: str, card_ids: list) -> list:
+    """取得指定名片的摘要（依 card_ids 順序），只讀取摘要節點"""
+    ctx = _card_context.get()
+    if ctx is not None and u_id in ctx.all_cards:
+        cards = get_cards_by_ids(u_id, card_ids)
+        return [
+            {"card_id": card_id, **card_summary(card)}
+            for card_id, card in cards.items()
+        ]
+
+    card_ids = list(dict.fromkeys(card_ids))
+    if not card_ids:
+        return []
+    if ctx is not None:
+        ctx.reads += len(card_ids)
+
+    def fetch(card_id):
+        try:
+            return get_backend().get(
+                f"{config.NAMECARD_SUMMARY_PATH}/{u_id}/{card_id}")
+        except Exception as e:
+            print(f"Error getting card summary {card_id}: {e}")
+            return None
+
+    workers = min(BULK_FETCH_MAX_WORKERS, len(card_ids))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        fetched = list(executor.map(fetch, card_ids))
+    return [
+        {"card_id": card_id, **summary}
+        for card_id, summary in zip(card_ids, fetched) if summary
+    ]
+
+
 def update_namecard_field(
         u_id: str, card_id: str, field: str, value: str) -> bool:
     """更新指定名片的特定欄位"""
+    return update_namecard_fields(u_id, {card_id: {field: value}})
+
+
+def update_namecard_fields(u_id: str, changes: dict) -> bool:
+    """一次更新多張名片的多個欄位，changes 為 {card_id: {欄位: 新值}}
+
+    所有名片欄位與摘要以單一多路徑更新寫入；公司有變動的名片才讀取
+    舊資料，以增量更新統計彙總。舊資料尚未建立摘要節點時先完整補建，
+    不寫入只有部分欄位的摘要。
+    """
     try:
-        ref = db.reference(f"{config.NAMECARD_PATH}/{u_id}/{card_id}")
-        ref.update({field: value})
+        old_cards = {
+            card_id: _fetch_card(u_id, card_id)
+            for card_id, values in changes.items() if "company" in values
+        }
+        has_summaries = not any(
+            field in SUMMARY_FIELDS
+            for values in changes.values() for field in values
+        ) or _backfill_card_summaries(u_id)
+        updates = {}
+        for card_id, values in changes.items():
+            for field, value in values.items():
+                updates[
+                    f"{config.NAMECARD_PATH}/{u_id}/{card_id}/{field}"
+                ] = value
+                if field in SUMMARY_FIELDS and has_summaries:
+                    updates[
+                        f"{config.NAMECARD_SUMMARY_PATH}/{u_id}/{card_id}"
+                        f"/{field}"
+                    ] = value
+        get_backend().update("", updates)
+        _wrote()
+        ctx = _card_context.get()
+        if ctx is not None:
+            for card_id, values in changes.items():
+                ctx.apply_update(u_id, card_id, values)
+        rebuilt = False
+        for card_id, values in changes.items():
+            old_card = old_cards.get(card_id)
+            if old_card is not None and not rebuilt:
+                rebuilt = _update_statistics(
+                    u_id, old_card, {**old_card, **values})
+            card_index.card_updated(u_id, card_id, values)
+            vector_index.card_updated(
+                u_id, card_id, values,
+                lambda card_id=card_id: _fetch_card(u_id, card_id))
+        response_cache.cache.invalidate(u_id)
         return True
     except Exception as e:
-        print(f"Error updating {field}: {e}")
+        print(f"Error updating namecards: {e}")
         return False
 
 
 def upload_qrcode_to_storage(
         image_bytes: BytesIO, user_id: str, card_id: str) -> str:
     """
-    上傳 QR Code 圖片到 Firebase Storage 並回傳公開 URL
+    上傳 QR Code 圖片到 Storage（依設定的資料層後端）並回傳公開 URL
 
     Args:
         image_bytes: QR Code 圖片的 BytesIO 物件
@@ -126,27 +627,80 @@ def upload_qrcode_to_storage(
         圖片的公開 URL，若失敗則回傳 None
     """
     try:
-        bucket = storage.bucket()
-        blob_name = f"qrcodes/{user_id}/{card_id}.png"
-        blob = bucket.blob(blob_name)
+        deadline.check(reserve=0)
+        blob_name = f"{config.QRCODE_BLOB_PREFIX}/{user_id}/{card_id}.png"
 
-        # 上傳圖片
+        # 上傳圖片並回傳公開 URL
         image_bytes.seek(0)  # 重置指標到開頭
-        blob.upload_from_file(image_bytes, content_type='image/png')
-
-        # 設定為公開可讀取
-        blob.make_public()
-
-        # 回傳公開 URL
-        return blob.public_url
+        return get_backend().upload_blob(
+            blob_name, image_bytes.read(), 'image/png')
     except Exception as e:
         print(f"Error uploading QR code to storage: {e}")
         return None
 
 
+def _update_statistics(u_id: str, old_card: dict, new_card: dict) -> bool:
+    """以單一 transaction 增量更新使用者的統計彙總節點
+
+    總數、各月份與各公司的計數及衍生的 top_company 在同一個 transaction
+    中一起更新，不會只套用到部分計數器。須在名片寫入之後呼叫：彙總節點
+    尚未建立（舊資料）時改為從所有名片完整重建（不套用增量），並回傳
+    True；同一次寫入的其他名片已包含在重建結果中，不可再套用增量。
+    """
+    delta = stats_utils.stats_delta(old_card, new_card)
+    if stats_utils.is_empty_delta(delta):
+        return False
+    rebuilt = False
+
+    def apply(current):
+        nonlocal rebuilt
+        rebuilt = current is None
+        if rebuilt:
+            return stats_utils.compute_statistics(load_all_cards(u_id))
+        return stats_utils.apply_stats_delta(current, delta)
+
+    try:
+        ctx = _card_context.get()
+        if ctx is not None:
+            ctx.reads += 1
+        get_backend().transaction(
+            f"{config.NAMECARD_STATS_PATH}/{u_id}", apply)
+        _wrote()
+    except Exception as e:
+        # 彙總更新失敗不影響名片寫入，之後由 rebuild_namecard_statistics 修復
+        print(f"Error updating statistics: {e}")
+    return rebuilt
+
+
+def rebuild_namecard_statistics(u_id: str) -> bool:
+    """從所有名片重算統計彙總並覆寫，回傳原彙總是否與實際資料不一致"""
+    try:
+        stats = stats_utils.compute_statistics(load_all_cards(u_id))
+        path = f"{config.NAMECARD_STATS_PATH}/{u_id}"
+        current = get_backend().get(path) or {}
+        get_backend().set(path, stats)
+        # RTDB 不會保存空的子節點，比較前先去除
+        return current != {k: v for k, v in stats.items() if v != {}}
+    except Exception as e:
+        print(f"Error rebuilding statistics: {e}")
+        return False
+
+
+def reconcile_all_statistics() -> list:
+    """修復所有使用者的統計彙總漂移，回傳有漂移並已修正的使用者 ID"""
+    user_ids = get_backend().get(config.NAMECARD_PATH, shallow=True) or {}
+    repaired = []
+    for u_id in user_ids:
+        rebuild_card_summaries(u_id)
+        if rebuild_namecard_statistics(u_id):
+            repaired.append(u_id)
+    return repaired
+
+
 def get_namecard_statistics(u_id: str) -> dict:
     """
-    取得名片統計資訊
+    取得名片統計資訊（只讀取增量維護的統計彙總中的總數、當月計數與
+    top_company，不讀取各公司計數）
 
     Returns:
         {
@@ -155,55 +709,25 @@ def get_namecard_statistics(u_id: str) -> dict:
             "top_company": 最常聯絡公司名稱
         }
     """
+    base = f"{config.NAMECARD_STATS_PATH}/{u_id}"
     try:
-        all_cards = get_all_cards(u_id)
-        if not all_cards:
-            return {
-                "total": 0,
-                "this_month": 0,
-                "top_company": "無"
-            }
-
-        # 1. 計算總數
-        total = len(all_cards)
-
-        # 2. 計算本月新增
         now = datetime.now()
-        this_month_count = 0
-
-        for card in all_cards.values():
-            created_at = card.get('created_at')
-            if created_at:  # 只計算有時間戳的名片
-                try:
-                    created_date = datetime.fromisoformat(created_at)
-                    if (created_date.year == now.year
-                            and created_date.month == now.month):
-                        this_month_count += 1
-                except ValueError:
-                    continue  # 忽略格式錯誤的時間戳
-
-        # 3. 找出最常聯絡公司（名片數量最多的公司）
-        companies = [
-            card.get('company', '').strip()
-            for card in all_cards.values()
-            if card.get('company')
-            and card.get('company') != 'N/A'
-            and card.get('company').strip()
-        ]
-
-        if companies:
-            company_counter = Counter(companies)
-            top_company, count = company_counter.most_common(1)[0]
-            top_company = f"{top_company} ({count}張)"
-        else:
-            top_company = "無"
-
-        return {
+        total = _fetch(f"{base}/total")
+        if total is None:
+            # 尚未建立彙總節點（舊資料），先完整重算一次
+            stats = stats_utils.compute_statistics(load_all_cards(u_id))
+            get_backend().set(base, stats)
+            return stats_utils.summarize_statistics(stats, now)
+        month = now.strftime("%Y-%m")
+        stats = {
             "total": total,
-            "this_month": this_month_count,
-            "top_company": top_company
+            "months": {month: _fetch(f"{base}/months/{month}") or 0},
+            "top_company": _fetch(f"{base}/top_company"),
         }
-
+        if stats["top_company"] is None and total:
+            # 尚未寫入 top_company 的舊彙總節點，改從各公司計數找出
+            stats["companies"] = _fetch(f"{base}/companies")
+        return stats_utils.summarize_statistics(stats, now)
     except Exception as e:
         print(f"Error getting statistics: {e}")
         return {
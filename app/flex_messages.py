@@ -1,5 +1,8 @@
 from linebot.models import FlexSendMessage
 
+# 清單最多顯示的筆數，確保符合 LINE 訊息長度限制
+LIST_MAX_ITEMS = 8
+
 
 def get_namecard_flex_msg(card_data: dict, card_id: str) -> FlexSendMessage:
     # 確保基本資料存在
@@ -191,13 +194,18 @@ def get_edit_options_flex_msg(card_id: str, card_name: str) -> FlexSendMessage:
 
 
 def get_namecard_list_flex_msg(
-    cards: list, title_text: str = "🔍 找到多個相符的名片"
+    cards: list, title_text: str = "🔍 找到多個相符的名片",
+    total: int = None, next_page_data: str = None
 ) -> FlexSendMessage:
-    """產生一個包含聯絡人清單的 Flex Message，點擊其中一筆可顯示詳細名片卡片。"""
+    """產生一個包含聯絡人清單的 Flex Message，點擊其中一筆可顯示詳細名片卡片。
+
+    total 為相符資料總數（預設為 len(cards)）；
+    提供 next_page_data 時會加上「下一頁」按鈕。
+    """
     contents = []
 
-    # 限制清單最多顯示 8 筆，確保符合 LINE 訊息長度限制
-    for card in cards[:8]:
+    # 限制清單最多顯示 LIST_MAX_ITEMS 筆，確保符合 LINE 訊息長度限制
+    for card in cards[:LIST_MAX_ITEMS]:
         card_id = card.get("card_id")
         name = card.get("name", "N/A")
         company = card.get("company", "N/A")
@@ -279,7 +287,7 @@ def get_namecard_list_flex_msg(
                 {
                     "type": "text",
                     "text": (
-                        f"共找到 {len(cards)} 筆相符資料，"
+                        f"共找到 {total or len(cards)} 筆相符資料，"
                         "請點選要查看的名片："
                     ),
                     "size": "xs",
@@ -296,6 +304,23 @@ def get_namecard_list_flex_msg(
             ]
         }
     }
+    if next_page_data:
+        flex_msg["footer"] = {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "button",
+                    "style": "link",
+                    "action": {
+                        "type": "postback",
+                        "label": "下一頁 ❯",
+                        "data": next_page_data,
+                        "displayText": "下一頁"
+                    }
+                }
+            ]
+        }
 
     return FlexSendMessage(alt_text=title_text, contents=flex_msg)
 
@@ -0,0 +1,164 @@
+"""容錯（打錯字）的姓名／公司／職稱比對
+
+精確索引找不到結果時使用，例如「Davd Wang」、「台績電」。名片的姓名、
+公司、職稱會切成詞彙（英數字單字、連續中文字段），查詢詞先以 n-gram
+前篩出候選詞彙，再以編輯距離（含相鄰字元對調）驗證：
+
+- 英數字：與整個單字比較，以前後補位的 trigram 前篩
+- 中文：允許出現在詞彙中的任何位置（例如「台績電」對「台積電股份有限
+  公司」），以單字前篩
+
+依 q-gram 引理，編輯距離在 d 以內的字串至少共有 |grams| - q*d 個 gram，
+因此只有共有 gram 數量足夠的詞彙才需要計算編輯距離。
+"""
+import heapq
+
+from .text_utils import is_cjk, split_terms
+
+FUZZY_FIELD_WEIGHTS = {"name": 3.0, "company": 2.0, "title": 1.5}
+TRIGRAM = 3
+
+
+def max_distance(term: str) -> int:
+    """查詢詞可容忍的編輯距離（太短的詞不做容錯，避免大量誤判）"""
+    if is_cjk(term):
+        return 0 if len(term) <= 2 else 1 if len(term) <= 5 else 2
+    return 0 if len(term) <= 3 else 1 if len(term) <= 7 else 2
+
+
+def edit_distance(query: str, target: str, limit: int,
+                  substring: bool = False) -> int:
+    """回傳編輯距離（相鄰字元對調算一次），超過 limit 時回傳 limit + 1
+
+    substring=True 時 query 可以對齊 target 中的任何一段（前後多出的
+    字元不計成本）。
+    """
+    if not substring and abs(len(query) - len(target)) > limit:
+        return limit + 1
+    width = len(target) + 1
+    previous2 = None
+    previous = [0] * width if substring else list(range(width))
+    for i in range(1, len(query) + 1):
+        current = [i] + [0] * len(target)
+        qc = query[i - 1]
+        for j in range(1, width):
+            tc = target[j - 1]
+            cost = 0 if qc == tc else 1
+            value = min(previous[j] + 1, current[j - 1] + 1,
+                        previous[j - 1] + cost)
+            if (previous2 is not None and j > 1 and qc == target[j - 2]
+                    and query[i - 2] == tc):
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    distance = min(previous) if substring else previous[-1]
+    return distance if distance <= limit else limit + 1
+
+
+def _grams(term: str) -> set:
+    if is_cjk(term):
+        return set(term)
+    padded = f"  {term}  "
+    return {padded[i:i + TRIGRAM] for i in range(len(padded) - TRIGRAM + 1)}
+
+
+class FuzzyMatcher:
+    """單一使用者名片姓名、公司、職稱詞彙的容錯比對"""
+
+    def __init__(self):
+        self._terms = {}       # 詞彙 -> {card_id: 欄位權重}
+        self._grams = {}       # gram -> set(詞彙)
+        self._card_terms = {}  # card_id -> set(詞彙)，移除時使用
+
+    def add(self, card_id: str, card_data: dict) -> None:
+        terms = set()
+        for field, weight in FUZZY_FIELD_WEIGHTS.items():
+            value = card_data.get(field)
+            if not isinstance(value, str) or value == "N/A":
+                continue
+            for term in split_terms(value):
+                owners = self._terms.get(term)
+                if owners is None:
+                    owners = self._terms[term] = {}
+                    for gram in _grams(term):
+                        self._grams.setdefault(gram, set()).add(term)
+                if owners.get(card_id, 0) < weight:
+                    owners[card_id] = weight
+                terms.add(term)
+        self._card_terms[card_id] = terms
+
+    def remove(self, card_id: str) -> None:
+        for term in self._card_terms.pop(card_id, ()):
+            owners = self._terms.get(term)
+            if owners is None:
+                continue
+            owners.pop(card_id, None)
+            if not owners:
+                del self._terms[term]
+                for gram in _grams(term):
+                    bucket = self._grams.get(gram)
+                    if bucket is not None:
+                        bucket.discard(term)
+                        if not bucket:
+                            del self._grams[gram]
+
+    def _similar_terms(self, term: str) -> dict:
+        """回傳 {詞彙: 相似度 0~1}"""
+        limit = max_distance(term)
+        cjk = is_cjk(term)
+        grams = _grams(term)
+        # q-gram 引理：至少要共有這麼多個 gram 才可能在距離 limit 內
+        needed = max(len(grams) - (1 if cjk else TRIGRAM) * limit, 1)
+        buckets = sorted(
+            (self._grams.get(gram, set()) for gram in grams), key=len)
+        # 共有 needed 個 gram 的詞彙必定出現在最稀有的
+        # len - needed + 1 個 gram 中，常見 gram 只用來計數
+        candidates = set()
+        for bucket in buckets[:len(buckets) - needed + 1]:
+            candidates.update(bucket)
+        similar = {}
+        for candidate in candidates:
+            if is_cjk(candidate) != cjk:
+                continue
+            shared = sum(1 for bucket in buckets if candidate in bucket)
+            if shared < needed:
+                continue
+            distance = edit_distance(term, candidate, limit, substring=cjk)
+            if distance <= limit:
+                similar[candidate] = 1 - distance / (len(term) + 1)
+        return similar
+
+    def search(self, query: str, limit: int = None) -> list:
+        """依相似度回傳 [(card_id, 分數), ...]，名片需符合所有查詢詞"""
+        terms = split_terms(query)
+        if not terms:
+            return []
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for candidate, similarity in self._similar_terms(term).items():
+                for card_id, weight in self._terms[candidate].items():
+                    score = weight * similarity
+                    if term_scores.get(card_id, 0) < score:
+                        term_scores[card_id] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    card_id: score + term_scores[card_id]
+                    for card_id, score in scores.items()
+                    if card_id in term_scores
+                }
+            if not scores:
+                return []
+
+        def rank(card_id):
+            return -scores[card_id], card_id
+
+        if limit is not None:
+            ranked = heapq.nsmallest(limit, scores, key=rank)
+        else:
+            ranked = sorted(scores, key=rank)
+        return [(card_id, scores[card_id]) for card_id in ranked]
@@ -2,7 +2,7 @@ import vertexai
 from vertexai.generative_models import GenerativeModel, Part
 import PIL.Image
 from io import BytesIO
-from . import config
+from . import config, deadline
 
 # Initialize Vertex AI
 vertexai.init(project=config.PROJECT_ID, location=config.LOCATION)
@@ -14,15 +14,23 @@ def pil_to_bytes(img: PIL.Image.Image) -> bytes:
     return img_byte_arr.getvalue()
 
 
-def generate_gemini_text_complete(messages: list) -> object:
+def _model_name(model_name: str = None) -> str:
+    """未指定模型時使用 standard 等級的模型（見 model_router）"""
+    return model_name or config.MODEL_TIERS["standard"]
+
+
+def generate_gemini_text_complete(messages: list,
+                                  model_name: str = None) -> object:
     """Gemini 文字生成，強制要求結構化 JSON 輸出"""
     model = GenerativeModel(
-        "gemini-3-flash-preview",
+        _model_name(model_name),
         generation_config={"response_mime_type": "application/json"},
     )
     # Convert list of dicts message format to prompt string if needed
     # line_handlers.py sends [{"role": "user", "parts": [smart_query_prompt]}]
     prompt = messages[0]["parts"][0]
+    # Vertex AI SDK 不支援逾時參數，只能在送出前確認還有時間預算
+    deadline.check()
     response = model.generate_content(prompt, labels={"client_id": "namecard"})
     return response
 
@@ -62,15 +70,17 @@ NAMECARD_SCHEMA = {
 }
 
 
-def generate_json_from_image(img: PIL.Image.Image, prompt: str) -> object:
+def generate_json_from_image(img: PIL.Image.Image, prompt: str,
+                             model_name: str = None) -> object:
     model = GenerativeModel(
-        "gemini-3-flash-preview",
+        _model_name(model_name),
         generation_config={
             "response_mime_type": "application/json",
             "response_schema": NAMECARD_SCHEMA
         },
     )
     img_part = Part.from_data(data=pil_to_bytes(img), mime_type="image/jpeg")
+    deadline.check()
     response = model.generate_content(
         [prompt, img_part],
         stream=False,
@@ -82,9 +92,10 @@ def generate_json_from_image(img: PIL.Image.Image, prompt: str) -> object:
 def generate_json_from_two_images(
         front_img: PIL.Image.Image,
         back_img: PIL.Image.Image,
-        prompt: str) -> object:
+        prompt: str,
+        model_name: str = None) -> object:
     model = GenerativeModel(
-        "gemini-3-flash-preview",
+        _model_name(model_name),
         generation_config={
             "response_mime_type": "application/json",
             "response_schema": NAMECARD_SCHEMA
@@ -94,6 +105,7 @@ def generate_json_from_two_images(
         data=pil_to_bytes(front_img), mime_type="image/jpeg")
     back_part = Part.from_data(
         data=pil_to_bytes(back_img), mime_type="image/jpeg")
+    deadline.check()
     response = model.generate_content(
         [prompt, front_part, back_part],
         stream=False,
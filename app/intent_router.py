@@ -0,0 +1,122 @@
+"""智慧查詢前的規則式意圖判斷
+
+大部分文字訊息只是姓名或公司名稱（例如「王大明」、「LINE Taiwan」），
+不需要讓 Agent 經過多輪模型呼叫才能回答。route() 以簡單規則判斷訊息是否
+為單純的名片查詢：
+
+- 含修改、新增、刪除等編輯用語 -> 交給 Agent
+- 含疑問、統計、時間範圍等需要推理的用語 -> 交給 Agent
+- 其他短訊息去掉「幫我查」、「的名片」等常見前後綴後，視為查詢關鍵字；
+  過短的英數字訊息（例如「hi」、「ok」）多半是閒聊 -> 交給 Agent
+
+是否真的由本地回覆，還要看本地索引是否找得到完全相符的名片（見
+line_handlers.handle_local_lookup）。RouterStats 記錄本地回覆比例與
+節省的時間。
+"""
+import re
+import threading
+from collections import namedtuple
+
+from .text_utils import is_cjk, normalize_text, split_terms
+
+Route = namedtuple("Route", ["kind", "query"])
+LOOKUP = "lookup"
+AGENT = "agent"
+
+# 查詢關鍵字的長度與詞數上限，超過時多半是需要理解的句子
+MAX_LOOKUP_LENGTH = 30
+MAX_LOOKUP_TERMS = 4
+# 不含中日韓文字的查詢關鍵字至少要幾個字元才由本地回覆
+MIN_LATIN_LOOKUP_LENGTH = 3
+
+EDIT_WORDS = (
+    "改", "更新", "換成", "設為", "設定", "新增", "加上", "加入",
+    "刪除", "移除", "備忘", "備註", "記下", "記得",
+)
+QUESTION_WORDS = (
+    "?", "誰", "哪", "幾", "多少", "什麼", "甚麼", "嗎", "怎麼", "為何",
+    "所有", "全部", "最近", "上次", "上個", "這個月", "今年", "去年", "統計",
+    "比較", "還有", "以外", "除了", "或是", "他", "她", "它",
+)
+_EDIT_LATIN_RE = re.compile(
+    r"\b(change|update|edit|set|delete|remove|add|memo)\b")
+_QUESTION_LATIN_RE = re.compile(
+    r"\b(who|what|which|when|where|why|how|list|all)\b")
+_PREFIX_RE = re.compile(
+    r"^(請|麻煩)?(幫我|幫忙)?(查一下|找一下|查詢|搜尋|搜索|查|找|顯示|看一下|看)"
+    r"|^(search|find|show|lookup)\s+")
+_SUFFIX_RE = re.compile(
+    r"(的)?(名片|資料|聯絡資訊|聯絡方式|聯絡人|電話|手機|email|e-mail|地址)$")
+
+
+def is_edit(msg: str) -> bool:
+    """訊息是否含修改、新增、刪除等編輯用語"""
+    text = normalize_text(msg)
+    return (any(word in text for word in EDIT_WORDS)
+            or _EDIT_LATIN_RE.search(text) is not None)
+
+
+def route(msg: str) -> Route:
+    """判斷訊息要由本地查詢（LOOKUP）或 Agent（AGENT）處理"""
+    text = normalize_text(msg).strip()
+    if not text:
+        return Route(AGENT, None)
+    if is_edit(text):
+        return Route(AGENT, None)
+    if (any(word in text for word in QUESTION_WORDS)
+            or _QUESTION_LATIN_RE.search(text)):
+        return Route(AGENT, None)
+
+    query = _PREFIX_RE.sub("", text).strip()
+    query = _SUFFIX_RE.sub("", query).strip()
+    if (not query or len(query) > MAX_LOOKUP_LENGTH
+            or len(query.split()) > MAX_LOOKUP_TERMS):
+        return Route(AGENT, None)
+    if (len(query) < MIN_LATIN_LOOKUP_LENGTH
+            and not any(map(is_cjk, split_terms(query)))):
+        return Route(AGENT, None)
+    return Route(LOOKUP, query)
+
+
+class RouterStats:
+    """本地回覆與 Agent 處理的次數與耗時，用來估算節省的延遲"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.local_count = 0
+        self.local_seconds = 0.0
+        self.agent_count = 0
+        self.agent_seconds = 0.0
+        self.hedged_count = 0  # Agent 逾時、先以本地搜尋回覆的次數
+
+    def record(self, served_locally: bool, seconds: float) -> None:
+        with self._lock:
+            if served_locally:
+                self.local_count += 1
+                self.local_seconds += seconds
+            else:
+                self.agent_count += 1
+                self.agent_seconds += seconds
+
+    def record_hedged(self) -> None:
+        with self._lock:
+            self.hedged_count += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            total = self.local_count + self.agent_count
+            avg_local = self.local_seconds / max(self.local_count, 1)
+            avg_agent = self.agent_seconds / max(self.agent_count, 1)
+            saved = (self.local_count * max(avg_agent - avg_local, 0)
+                     if self.agent_count else 0.0)
+            return {
+                "queries": total,
+                "local_share": self.local_count / total if total else 0.0,
+                "avg_local_ms": avg_local * 1000,
+                "avg_agent_ms": avg_agent * 1000,
+                "saved_seconds": saved,
+                "hedged": self.hedged_count,
+            }
+
+
+stats = RouterStats()
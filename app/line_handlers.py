@@ -1,5 +1,6 @@
+import asyncio
 import time
-from urllib.parse import parse_qsl
+from urllib.parse import parse_qsl, urlencode
 from linebot.models import (
     PostbackEvent, MessageEvent, TextSendMessage, ImageSendMessage,
     QuickReply, QuickReplyButton, PostbackAction
@@ -8,18 +9,15 @@ from io import BytesIO
 import PIL.Image
 
 from . import (
-    firebase_utils, gemini_utils, utils, flex_messages, config, qrcode_utils
+    firebase_utils, utils, flex_messages, config, qrcode_utils,
+    intent_router, agent_runtime, agent_trace, model_router, circuit_breaker,
+    deadline, deferred_scans, vertex_scheduler
 )
 from .bot_instance import line_bot_api, user_states
-from google.adk import Agent, Runner
-from google.adk.sessions.in_memory_session_service import (
-    InMemorySessionService
-)
-from google.genai.types import GenerateContentConfig
 
 FIELD_LABELS = {
     "name": "姓名", "title": "職稱", "company": "公司",
-    "address": "地址", "phone": "電話", "email": "Email"
+    "address": "地址", "phone": "電話", "email": "Email", "memo": "備忘錄"
 }
 
 PENDING_BACKSIDE_TIMEOUT_SECONDS = 300
@@ -85,6 +83,21 @@ def sweep_expired_states() -> None:
         del user_states[user_id]
 
 
+_background_tasks = set()
+
+
+def _run_in_background(coro) -> asyncio.Task:
+    """在背景執行 coroutine，並保留參照避免 task 在完成前被回收
+
+    背景工作以 push message 通知使用者，不受 webhook 請求的時間預算限制。
+    """
+    with deadline.unbounded():
+        task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
 async def handle_postback_event(event: PostbackEvent, user_id: str):
     postback_data = dict(parse_qsl(event.postback.data))
     action = postback_data.get('action')
@@ -107,14 +120,34 @@ async def handle_postback_event(event: PostbackEvent, user_id: str):
         return
 
     elif action == 'show_list':
-        all_cards = firebase_utils.get_all_cards(user_id)
-        list_text = f"📋 總共有 {len(all_cards)} 張名片資料。"
-        await line_bot_api.reply_message(
-            event.reply_token,
-            TextSendMessage(
-                text=list_text, quick_reply=get_quick_reply_items()
-            ),
-        )
+        # 只計算 key 數量並讀取一頁摘要，成本與名片總數無關
+        total = firebase_utils.count_cards(user_id)
+        cursor = None
+        if 'after_key' in postback_data:
+            cursor = (
+                postback_data.get('after_value'), postback_data['after_key'])
+        summaries, next_cursor = firebase_utils.get_card_summary_page(
+            user_id, limit=flex_messages.LIST_MAX_ITEMS, cursor=cursor)
+        reply_msgs = []
+        if summaries:
+            next_page_data = None
+            if next_cursor:
+                next_page_params = {'action': 'show_list',
+                                    'after_key': next_cursor[1]}
+                if next_cursor[0] is not None:
+                    next_page_params['after_value'] = next_cursor[0]
+                next_page_data = urlencode(next_page_params)
+            reply_msgs.append(flex_messages.get_namecard_list_flex_msg(
+                cards=summaries,
+                title_text="📋 名片列表",
+                total=total,
+                next_page_data=next_page_data
+            ))
+        list_text = f"📋 總共有 {total} 張名片資料。"
+        reply_msgs.append(TextSendMessage(
+            text=list_text, quick_reply=get_quick_reply_items()
+        ))
+        await line_bot_api.reply_message(event.reply_token, reply_msgs)
         return
 
     elif action == 'show_test':
@@ -147,35 +180,37 @@ async def handle_postback_event(event: PostbackEvent, user_id: str):
     elif action == 'confirm_update':
         state = user_states.get(user_id, {})
         if state.get('action') == 'pending_update':
-            update_type = state.get('update_type')
-            card_id = state.get('card_id')
+            changes = state.get('changes', [])
+            grouped = {}
+            for change in changes:
+                grouped.setdefault(change['card_id'], {})[
+                    change['field']] = change['value']
+            await firebase_utils.prefetch_cards(user_id, list(grouped))
             card_name = firebase_utils.get_name_from_card(
-                user_id, card_id
+                user_id, next(iter(grouped), None)
             ) or "聯絡人"
-            success = False
 
-            if update_type == 'field':
-                field = state.get('field')
-                value = state.get('value')
-                success = firebase_utils.update_namecard_field(
-                    user_id, card_id, field, value
-                )
-            elif update_type == 'memo':
-                memo = state.get('memo')
-                success = firebase_utils.update_namecard_memo(
-                    card_id, user_id, memo
-                )
+            # 所有修改以單一多路徑更新寫入
+            card_ctx = firebase_utils.get_card_context()
+            writes = card_ctx.writes if card_ctx is not None else 0
+            success = firebase_utils.update_namecard_fields(user_id, grouped)
+            if card_ctx is not None:
+                agent_trace.metrics.record_applied(
+                    len(changes), card_ctx.writes - writes)
 
             if success:
-                updated_card = firebase_utils.get_card_by_id(user_id, card_id)
+                if len(grouped) == 1:
+                    text = f"「{card_name}」的資料已成功更新！"
+                else:
+                    text = f"已成功更新 {len(grouped)} 張名片的資料！"
                 reply_msgs = [TextSendMessage(
-                    text=f"「{card_name}」的資料已成功更新！",
-                    quick_reply=get_quick_reply_items()
-                )]
-                if updated_card:
+                    text=text, quick_reply=get_quick_reply_items())]
+                updated_cards = firebase_utils.get_cards_by_ids(
+                    user_id, list(grouped)[:4])
+                for card_id, card_data in updated_cards.items():
                     reply_msgs.append(
                         flex_messages.get_namecard_flex_msg(
-                            updated_card, card_id
+                            card_data, card_id
                         )
                     )
                 await line_bot_api.reply_message(event.reply_token, reply_msgs)
@@ -252,6 +287,7 @@ async def handle_postback_event(event: PostbackEvent, user_id: str):
         return
 
     # 處理需要 card_id 的 action
+    await firebase_utils.prefetch_cards(user_id, [card_id])
     card_name = firebase_utils.get_name_from_card(user_id, card_id)
     if not card_name:
         await line_bot_api.reply_message(
@@ -362,8 +398,10 @@ async def handle_text_event(event: MessageEvent, user_id: str) -> None:
                 quick_reply=get_quick_reply_items()
             )],
         )
-    else:
+    elif not await handle_local_lookup(event, user_id, msg):
+        start = time.perf_counter()
         await handle_smart_query(event, user_id, msg)
+        intent_router.stats.record(False, time.perf_counter() - start)
 
 
 async def handle_add_memo_state(event: MessageEvent, user_id: str, msg: str):
@@ -421,262 +459,293 @@ async def handle_edit_field_state(event: MessageEvent, user_id: str, msg: str):
     del user_states[user_id]
 
 
-def make_adk_tools(user_id: str, found_card_ids: list):
-    """為特定使用者動態建立專屬的 Firebase 資料存取與操作工具"""
-    def get_all_namecards() -> list[dict]:
-        """取得當前使用者在 Firebase 資料庫中所有的名片資料列表。
-        每張名片資料都包含唯一的 card_id 欄位。"""
-        cards_dict = firebase_utils.get_all_cards(user_id)
-        all_cards_list = []
-        for card_id, card_data in cards_dict.items():
-            card_data_with_id = card_data.copy()
-            card_data_with_id['card_id'] = card_id
-            all_cards_list.append(card_data_with_id)
-        return all_cards_list
-
-    def get_namecard_by_id(card_id: str) -> dict:
-        """透過特定的 card_id 取得單張名片的詳細欄位與資料。"""
-        return firebase_utils.get_card_by_id(user_id, card_id)
-
-    def display_namecard(card_id: str) -> str:
-        """顯示特定名片給使用者看。
-        當找到與搜尋相匹配的名片時，務必調用此工具。"""
-        if card_id not in found_card_ids:
-            found_card_ids.append(card_id)
-        return f"已將名片 ID 標記為顯示：{card_id}"
-
-    def update_namecard_memo(card_id: str, memo: str) -> bool:
-        """更新特定名片的備忘錄／記事資訊。"""
-        user_states[user_id] = {
-            'action': 'pending_update',
-            'update_type': 'memo',
-            'card_id': card_id,
-            'memo': memo
-        }
-        return True
-
-    def update_namecard_field(card_id: str, field: str, value: str) -> bool:
-        """更新特定名片的指定欄位（可選欄位有：name、title、company、address、phone、email）。"""
-        user_states[user_id] = {
-            'action': 'pending_update',
-            'update_type': 'field',
-            'card_id': card_id,
-            'field': field,
-            'value': value
+def get_card_result_msgs(cards: dict, list_title: str) -> list:
+    """將搜尋結果 {card_id: card_data} 轉成回覆訊息
+
+    4 張以內逐張顯示詳細名片，超過時以清單 Flex Message 顯示前幾筆。
+    """
+    if len(cards) <= 4:
+        return [
+            flex_messages.get_namecard_flex_msg(card_data, card_id)
+            for card_id, card_data in cards.items()
+        ]
+    cards_list = [
+        {
+            "card_id": card_id,
+            "name": card_data.get("name", "N/A"),
+            "company": card_data.get("company", "N/A"),
+            "title": card_data.get("title", "N/A")
         }
-        return True
-
-    return [
-        get_all_namecards,
-        get_namecard_by_id,
-        display_namecard,
-        update_namecard_memo,
-        update_namecard_field
+        for card_id, card_data in list(cards.items())[
+            :flex_messages.LIST_MAX_ITEMS]
+    ]
+    return [flex_messages.get_namecard_list_flex_msg(
+        cards=cards_list, title_text=list_title, total=len(cards))]
+
+
+async def handle_local_lookup(
+        event: MessageEvent, user_id: str, msg: str) -> bool:
+    """單純的姓名／公司查詢直接以本地索引回覆，不經過 Agent
+
+    回傳 False 表示訊息需要交給 Agent（編輯、疑問句，或本地找不到
+    完全相符的名片）。
+    """
+    if not config.INTENT_ROUTER_ENABLED:
+        return False
+    start = time.perf_counter()
+    intent = intent_router.route(msg)
+    if intent.kind != intent_router.LOOKUP:
+        return False
+    cards = firebase_utils.search_cards(user_id, intent.query, strict=True)
+    if not cards:
+        return False
+
+    reply_msgs = [TextSendMessage(
+        text=f"為您找到 {len(cards)} 張相符的名片：",
+        quick_reply=get_quick_reply_items()
+    )]
+    reply_msgs.extend(get_card_result_msgs(cards, "🔍 找到多個相符的名片"))
+    await line_bot_api.reply_message(event.reply_token, reply_msgs)
+    elapsed = time.perf_counter() - start
+    intent_router.stats.record(True, elapsed)
+    print(f"Smart query served locally in {elapsed * 1000:.1f} ms")
+    return True
+
+
+def _pending_changes_text(user_id: str, changes: list) -> str:
+    """確認畫面上列出所有待確認修改的文字"""
+    names = {}
+    for change in changes:
+        card_id = change['card_id']
+        if card_id not in names:
+            names[card_id] = firebase_utils.get_name_from_card(
+                user_id, card_id) or "聯絡人"
+
+    if len(changes) == 1:
+        change = changes[0]
+        field_label = FIELD_LABELS.get(change['field'], change['field'])
+        return (
+            f"請問您是否確定要將「{names[change['card_id']]}」的"
+            f"【{field_label}】修改為：\n\n「{change['value']}」？"
+        )
+    lines = [
+        f"・「{names[change['card_id']]}」的"
+        f"【{FIELD_LABELS.get(change['field'], change['field'])}】："
+        f"「{change['value']}」"
+        for change in changes
     ]
+    return (f"請問您是否確定要進行以下 {len(changes)} 項修改？\n\n"
+            + "\n".join(lines))
 
 
-async def handle_smart_query(event: MessageEvent, user_id: str, msg: str):
-    found_card_ids = []
-    tools = make_adk_tools(user_id, found_card_ids)
-
-    agent = Agent(
-        name="namecard_agent",
-        model="gemini-3-flash-preview",
-        instruction=(
-            "你是一個聰明且親切的 LINE 名片助理。你的工作是幫助使用者管理名片資料。\n"
-            "你可以使用合適的工具來讀取或修改 Firebase 資料庫中的名片記錄。\n\n"
-            "【核心操作準則】\n"
-            "1. 【查詢】當使用者查詢某人或某公司的名片時，"
-            "請先調用 get_all_namecards 取得所有資料，並在背後進行分析比對。\n"
-            "2. 【顯示】只要找到了符合條件的名片，"
-            "『務必』調用 display_namecard 工具將該名片的 card_id "
-            "標記為顯示，以便系統繪製並呈現在 LINE 畫面上。\n"
-            "3. 【修改】如果使用者想修改名片（例如電話、Email、備註），"
-            "請先比對找出 card_id，然後調用相對應的更新工具"
-            "（如 update_namecard_field 或 update_namecard_memo）"
-            "進行修改，修改成功後請『務必』再次調用 display_namecard "
-            "顯示更新後的名片，讓使用者進行確認。\n"
-            "4. 【回覆】最後請以親切、精簡的繁體中文口吻"
-            "向使用者回覆操作結果或搜尋進度。"
-        ),
-        tools=tools,
-        generate_content_config=GenerateContentConfig(
-            labels={"client_id": "namecard"}
-        ),
-    )
+async def _agent_reply_msgs(user_id: str, msg: str) -> list:
+    """執行 Agent，回傳要回覆使用者的訊息（文字回覆與確認修改／名片）"""
+    with agent_runtime.agent_request(user_id) as request:
+        final_text = await agent_runtime.run_agent(user_id, msg)
+    found_card_ids = request.found_card_ids
 
-    runner = Runner(
-        app_name="namecard_bot_app",
-        agent=agent,
-        session_service=InMemorySessionService()
-    )
+    if not final_text:
+        final_text = "為您完成處理。"
 
-    try:
-        events = await runner.run_debug(
-            msg, user_id=user_id, session_id=user_id
-        )
+    reply_msgs = [TextSendMessage(
+        text=final_text,
+        quick_reply=get_quick_reply_items()
+    )]
 
-        # 組合 Agent 的文字回覆
-        final_text = ""
-        for ev in events:
-            if ev.content and ev.content.parts:
-                for part in ev.content.parts:
-                    if part.text:
-                        final_text += part.text
+    # 1. 檢查是否有待確認的修改操作
+    state = user_states.get(user_id, {})
+    if state.get('action') == 'pending_update':
+        confirm_msg = flex_messages.get_confirm_update_flex_msg(
+            message_text=_pending_changes_text(user_id, state['changes']),
+            confirm_data="action=confirm_update",
+            cancel_data="action=cancel_update"
+        )
+        reply_msgs.append(confirm_msg)
+
+    # 2. 如果沒有 pending update，才處理名片顯示
+    elif found_card_ids:
+        if len(found_card_ids) <= 4:
+            # 數量小於等於 4，直接顯示 Carousel 詳細名片卡片
+            # 一次批次取得，優先使用 Agent 執行期間已載入的名片快照
+            found_cards = firebase_utils.get_cards_by_ids(
+                user_id, found_card_ids)
+            for card_id, card_data in found_cards.items():
+                reply_msgs.append(
+                    flex_messages.get_namecard_flex_msg(
+                        card_data, card_id
+                    )
+                )
+        else:
+            # 數量大於 4，以清單 Flex Message 顯示進行消歧義，
+            # 只讀取實際會顯示的那幾筆摘要
+            cards_list = firebase_utils.get_card_summaries(
+                user_id, found_card_ids[:flex_messages.LIST_MAX_ITEMS])
+            if cards_list:
+                list_msg = flex_messages.get_namecard_list_flex_msg(
+                    cards=cards_list,
+                    title_text="🔍 找到多個相符的名片",
+                    total=len(found_card_ids)
+                )
+                reply_msgs.append(list_msg)
+    return reply_msgs
 
-        final_text = final_text.strip()
-        if not final_text:
-            final_text = "為您完成處理。"
 
-        reply_msgs = [TextSendMessage(
-            text=final_text,
-            quick_reply=get_quick_reply_items()
-        )]
+def _fallback_msgs(user_id: str, msg: str, unavailable: bool = True) -> list:
+    """備援搜尋機制：當 Vertex AI 或 ADK API 異常時，自動啟用本機關鍵字過濾搜尋，確保服務不中斷
 
-        # 1. 檢查是否有待確認的修改操作
-        state = user_states.get(user_id, {})
-        if state.get('action') == 'pending_update':
-            card_id = state.get('card_id')
-            card_name = firebase_utils.get_name_from_card(
-                user_id, card_id
-            ) or "聯絡人"
-            update_type = state.get('update_type')
-
-            if update_type == 'field':
-                field = state.get('field')
-                value = state.get('value')
-                field_label = FIELD_LABELS.get(field, field)
-                msg_text = (
-                    f"請問您是否確定要將「{card_name}」的【{field_label}】"
-                    f"修改為：\n\n「{value}」？"
-                )
-            else:  # memo
-                memo = state.get('memo')
-                msg_text = (
-                    f"請問您是否確定要將「{card_name}」的【備忘錄】"
-                    f"修改為：\n\n「{memo}」？"
+    unavailable=False 用於不是服務異常、而是刻意略過 Agent 的情況（例如
+    請求的時間預算不足），回覆文字不提及服務無法使用。
+    """
+    try:
+        # 以本地倒排索引搜尋所有欄位，結果依相關度排序
+        fallback_matches = list(
+            firebase_utils.search_cards(user_id, msg).items())
+
+        if fallback_matches:
+            suffix = "：" if len(fallback_matches) <= 4 else "清單："
+            if unavailable:
+                text = ("「智慧搜尋」服務暫時無法取得，"
+                        "已自動啟用「關鍵字備援搜尋」為您找到以下相關名片")
+                title = "🔍 關鍵字備援搜尋結果"
+            else:
+                text = "為您列出關鍵字搜尋找到的相關名片"
+                title = "🔍 關鍵字搜尋結果"
+            reply_msgs = [TextSendMessage(
+                text=text + suffix,
+                quick_reply=get_quick_reply_items()
+            )]
+            reply_msgs.extend(get_card_result_msgs(
+                dict(fallback_matches), title))
+            return reply_msgs
+
+        # 沒有完全相符的名片時，改以容錯比對找出拼寫相近的名片
+        similar_cards = firebase_utils.fuzzy_search_cards(
+            user_id, msg, limit=flex_messages.LIST_MAX_ITEMS)
+        if similar_cards:
+            text = "找不到完全相符的名片，以下是拼寫相近的名片："
+            if unavailable:
+                text = "「智慧搜尋」服務暫時無法取得，" + text
+            return [
+                TextSendMessage(
+                    text=text,
+                    quick_reply=get_quick_reply_items()
+                ),
+                flex_messages.get_namecard_list_flex_msg(
+                    cards=similar_cards,
+                    title_text="🔍 您要找的是不是："
                 )
+            ]
+    except Exception as fallback_err:
+        print(f"Fallback search also failed: {fallback_err}")
 
-            confirm_msg = flex_messages.get_confirm_update_flex_msg(
-                message_text=msg_text,
-                confirm_data="action=confirm_update",
-                cancel_data="action=cancel_update"
-            )
-            reply_msgs.append(confirm_msg)
-
-        # 2. 如果沒有 pending update，才處理名片顯示
-        elif found_card_ids:
-            if len(found_card_ids) <= 4:
-                # 數量小於等於 4，直接顯示 Carousel 詳細名片卡片
-                for card_id in found_card_ids:
-                    card_data = firebase_utils.get_card_by_id(user_id, card_id)
-                    if card_data:
-                        reply_msgs.append(
-                            flex_messages.get_namecard_flex_msg(
-                                card_data, card_id
-                            )
-                        )
-            else:
-                # 數量大於 4，以清單 Flex Message 顯示進行消歧義
-                cards_list = []
-                for card_id in found_card_ids:
-                    card_data = firebase_utils.get_card_by_id(user_id, card_id)
-                    if card_data:
-                        cards_list.append({
-                            "card_id": card_id,
-                            "name": card_data.get("name", "N/A"),
-                            "company": card_data.get("company", "N/A"),
-                            "title": card_data.get("title", "N/A")
-                        })
-                if cards_list:
-                    list_msg = flex_messages.get_namecard_list_flex_msg(
-                        cards=cards_list,
-                        title_text="🔍 找到多個相符的名片"
-                    )
-                    reply_msgs.append(list_msg)
+    return [TextSendMessage(
+        text="處理您的查詢時發生錯誤，請稍後再試。",
+        quick_reply=get_quick_reply_items()
+    )]
 
-        await line_bot_api.reply_message(event.reply_token, reply_msgs)
 
+async def _smart_query_msgs(user_id: str, msg: str) -> tuple:
+    """回傳 (回覆訊息, 是否由 Agent 回答)；Agent 失敗時改用備援搜尋"""
+    try:
+        return await _agent_reply_msgs(user_id, msg), True
     except Exception as e:
         print(f"Error executing ADK smart query: {e}")
-        # 備援搜尋機制：當 Vertex AI 或 ADK API 異常時，自動啟用本機關鍵字過濾搜尋，確保服務不中斷
-        try:
-            all_cards_dict = firebase_utils.get_all_cards(user_id)
-            fallback_matches = []
-            if all_cards_dict:
-                for card_id, card_data in all_cards_dict.items():
-                    name = card_data.get("name", "").lower()
-                    company = card_data.get("company", "").lower()
-                    query_lower = msg.lower()
-                    if query_lower in name or query_lower in company:
-                        fallback_matches.append((card_id, card_data))
-
-            if fallback_matches:
-                if len(fallback_matches) <= 4:
-                    reply_msgs = [TextSendMessage(
-                        text="「智慧搜尋」服務暫時無法取得，"
-                             "已自動啟用「關鍵字備援搜尋」為您找到以下相關名片：",
-                        quick_reply=get_quick_reply_items()
-                    )]
-                    for card_id, card_data in fallback_matches:
-                        reply_msgs.append(
-                            flex_messages.get_namecard_flex_msg(
-                                card_data, card_id
-                            )
-                        )
-                else:
-                    reply_msgs = [TextSendMessage(
-                        text="「智慧搜尋」服務暫時無法取得，"
-                             "已自動啟用「關鍵字備援搜尋」為您找到以下相關名片清單：",
-                        quick_reply=get_quick_reply_items()
-                    )]
-                    cards_list = []
-                    for card_id, card_data in fallback_matches:
-                        cards_list.append({
-                            "card_id": card_id,
-                            "name": card_data.get("name", "N/A"),
-                            "company": card_data.get("company", "N/A"),
-                            "title": card_data.get("title", "N/A")
-                        })
-                    list_msg = flex_messages.get_namecard_list_flex_msg(
-                        cards=cards_list,
-                        title_text="🔍 關鍵字備援搜尋結果"
-                    )
-                    reply_msgs.append(list_msg)
+        return _fallback_msgs(user_id, msg), False
+
+
+async def _push_late_answer(user_id: str, agent_task: asyncio.Task) -> None:
+    """已先以本地搜尋回覆後，等 Agent 完成再以 push message 補上回答"""
+    try:
+        reply_msgs, answered_by_agent = await agent_task
+        if answered_by_agent:
+            await line_bot_api.push_message(user_id, reply_msgs)
+    except Exception as e:
+        print(f"Error pushing late agent answer: {e}")
+
+
+async def _reply_hedged(event: MessageEvent, user_id: str, msg: str,
+                        agent_task: asyncio.Task) -> bool:
+    """Agent 超過軟性期限時先以本地搜尋結果回覆
+
+    本地找不到名片時回傳 False，繼續等待 Agent。已回覆時依
+    HEDGE_LATE_ANSWER 取消 Agent（cancel）或完成後推送回答（push）。
+    """
+    intent = intent_router.route(msg)
+    query = intent.query if intent.kind == intent_router.LOOKUP else msg
+    cards = firebase_utils.search_cards(user_id, query)
+    if not cards:
+        return False
+
+    push = config.HEDGE_LATE_ANSWER == "push"
+    text = "智慧搜尋仍在處理中，先為您列出關鍵字搜尋找到的名片："
+    if push:
+        text = "智慧搜尋仍在處理中，完成後會再通知您。先為您列出關鍵字搜尋找到的名片："
+    reply_msgs = [TextSendMessage(
+        text=text, quick_reply=get_quick_reply_items())]
+    reply_msgs.extend(get_card_result_msgs(cards, "🔍 關鍵字搜尋結果"))
+    await line_bot_api.reply_message(event.reply_token, reply_msgs)
+    intent_router.stats.record_hedged()
+
+    if push:
+        _run_in_background(_push_late_answer(user_id, agent_task))
+    else:
+        agent_task.cancel()
+    return True
 
-                await line_bot_api.reply_message(event.reply_token, reply_msgs)
-                return
-        except Exception as fallback_err:
-            print(f"Fallback search also failed: {fallback_err}")
 
+async def handle_smart_query(event: MessageEvent, user_id: str, msg: str):
+    """交給 Agent 處理；查詢類訊息同時以本地搜尋避險
+
+    啟用 HEDGED_SEARCH_ENABLED 時，非編輯類訊息的 Agent 超過
+    HEDGE_SOFT_DEADLINE_SECONDS 仍未完成，就先回覆本地搜尋結果，
+    避免少數慢查詢拖過 LINE reply token 的期限。請求的時間預算已所剩
+    不多時不執行 Agent，直接以本地搜尋回覆。
+
+    避險後推送回答（HEDGE_LATE_ANSWER=push）時，Agent 不受請求的時間
+    預算限制，才能在回覆後繼續執行並推送；等待回覆時仍以預算為上限。
+    """
+    if deadline.running_low():
+        print(f"Deadline running low, skipping agent for {user_id}")
         await line_bot_api.reply_message(
             event.reply_token,
-            [TextSendMessage(
-                text="處理您的查詢時發生錯誤，請稍後再試。",
-                quick_reply=get_quick_reply_items()
-            )]
-        )
+            _fallback_msgs(user_id, msg, unavailable=False))
+        return
+    hedge = config.HEDGED_SEARCH_ENABLED and not intent_router.is_edit(msg)
+    push = hedge and config.HEDGE_LATE_ANSWER == "push"
+    if push:
+        with deadline.unbounded():
+            agent_task = asyncio.create_task(_smart_query_msgs(user_id, msg))
+    else:
+        agent_task = asyncio.create_task(_smart_query_msgs(user_id, msg))
+    if hedge:
+        done, _ = await asyncio.wait(
+            {agent_task}, timeout=config.HEDGE_SOFT_DEADLINE_SECONDS)
+        if not done and await _reply_hedged(event, user_id, msg, agent_task):
+            return
+    if push:
+        try:
+            reply_msgs, _ = await deadline.wait_for(
+                asyncio.shield(agent_task))
+        except deadline.DeadlineExceeded:
+            agent_task.cancel()
+            reply_msgs = _fallback_msgs(user_id, msg)
+    else:
+        reply_msgs, _ = await agent_task
+    await line_bot_api.reply_message(event.reply_token, reply_msgs)
 
 
-async def _finalize_and_save_card(
-        card_obj: dict,
-        event: MessageEvent | PostbackEvent,
-        user_id: str) -> None:
-    """執行重複檢查、存檔並回覆使用者（單面與正反面合併後共用）"""
+def _save_card_messages(card_obj: dict, user_id: str) -> list:
+    """執行重複檢查並存檔，回傳要回覆使用者的訊息"""
     existing_card_id = firebase_utils.check_if_card_exists(card_obj, user_id)
     if existing_card_id:
         existing_card_data = firebase_utils.get_card_by_id(
             user_id, existing_card_id)
         reply_msg = flex_messages.get_namecard_flex_msg(
             existing_card_data, existing_card_id)
-        await line_bot_api.reply_message(
-            event.reply_token,
-            [TextSendMessage(
-                text="這個名片已經存在資料庫中。",
-                quick_reply=get_quick_reply_items()
-            ), reply_msg],
-        )
-        return
+        return [TextSendMessage(
+            text="這個名片已經存在資料庫中。",
+            quick_reply=get_quick_reply_items()
+        ), reply_msg]
 
     card_id = firebase_utils.add_namecard(card_obj, user_id)
     if card_id:
@@ -685,15 +754,172 @@ async def _finalize_and_save_card(
             text="名片資料已經成功加入資料庫。",
             quick_reply=get_quick_reply_items()
         )
-        await line_bot_api.reply_message(
-            event.reply_token, [reply_msg, chinese_reply_msg])
+        return [reply_msg, chinese_reply_msg]
+    return [TextSendMessage(
+        text="儲存名片時發生錯誤。",
+        quick_reply=get_quick_reply_items()
+    )]
+
+
+SAVE_PENDING_TEXT = "⏳ 名片資料儲存中，完成後會再通知您。"
+
+
+async def _finalize_and_save_card(
+        card_obj: dict,
+        event: MessageEvent | PostbackEvent,
+        user_id: str) -> None:
+    """執行重複檢查、存檔並回覆使用者（單面與正反面合併後共用）
+
+    請求的時間預算不足以完成重複檢查時，先回覆處理中，
+    改在背景存檔後以 push message 通知，暫存狀態已清除也不會遺失名片。
+    """
+    try:
+        messages = _save_card_messages(card_obj, user_id)
+    except deadline.DeadlineExceeded:
+        _run_in_background(_push_saved_card(card_obj, user_id))
+        messages = TextSendMessage(text=SAVE_PENDING_TEXT,
+                                   quick_reply=get_quick_reply_items())
+    await line_bot_api.reply_message(event.reply_token, messages)
+
+
+async def _push_saved_card(card_obj: dict, user_id: str) -> None:
+    """在背景完成名片存檔並推送結果"""
+    try:
+        messages = _save_card_messages(card_obj, user_id)
+    except Exception as e:
+        print(f"Error finishing namecard save: {e}")
+        messages = [TextSendMessage(text="儲存名片時發生錯誤，請重新傳送名片。")]
+    await line_bot_api.push_message(user_id, messages)
+
+
+def _parse_card_result(result) -> tuple:
+    """解析 Gemini 名片辨識結果，回傳 (card_obj, 錯誤訊息)"""
+    card_obj = utils.parse_gemini_result_to_json(result.text)
+    if not card_obj:
+        return None, f"無法解析這張名片，請再試一次。 錯誤資訊: {result.text}"
+
+    # Gemini Pro Vision API might return a list of objects, take the first one.
+    if isinstance(card_obj, list):
+        if not card_obj:
+            return None, (
+                f"無法解析這張名片，Gemini 回傳了空的資料。 資訊: {result.text}")
+        card_obj = card_obj[0]
+
+    return {k.lower(): v for k, v in card_obj.items()}, None
+
+
+SCAN_PENDING_TEXT = "⏳ 名片辨識需要較長的時間，完成後會再通知您。"
+
+
+async def _defer_scan(event: MessageEvent, user_id: str, image_bytes: bytes,
+                      front_image_bytes: bytes = None,
+                      timed_out: bool = False) -> None:
+    """保留圖片，之後再辨識並以 push message 通知
+
+    辨識服務熔斷中時等服務恢復；請求的時間預算不足以完成辨識時
+    （timed_out）立即在背景辨識。
+    """
+    if deferred_scans.queue.add(user_id, image_bytes, front_image_bytes):
+        if timed_out:
+            text = SCAN_PENDING_TEXT
+        else:
+            text = ("⏳ 名片辨識服務暫時無法使用，已保留這張名片，"
+                    "服務恢復後會自動辨識並通知您。")
     else:
-        await line_bot_api.reply_message(
-            event.reply_token,
-            [TextSendMessage(
-                text="儲存名片時發生錯誤。",
-                quick_reply=get_quick_reply_items()
-            )])
+        text = "名片辨識服務暫時無法使用，請稍後再傳送名片。"
+    await line_bot_api.reply_message(
+        event.reply_token,
+        TextSendMessage(text=text, quick_reply=get_quick_reply_items()))
+
+
+async def _scan_deferred(job) -> list:
+    """辨識一筆延後的名片圖片並存檔，回傳要通知使用者的訊息"""
+    img = PIL.Image.open(BytesIO(job.image_bytes))
+    if job.front_image_bytes is not None:
+        front_img = PIL.Image.open(BytesIO(job.front_image_bytes))
+        result = await model_router.recognize_two_sided_card(
+            front_img, img, config.DOUBLE_SIDED_IMAGE_PROMPT, job.user_id,
+            vertex_scheduler.BACKGROUND)
+    else:
+        result = await model_router.recognize_card(
+            img, config.IMGAGE_PROMPT, job.user_id,
+            vertex_scheduler.BACKGROUND)
+    return _recognized_card_messages(result, job.user_id)
+
+
+def _recognized_card_messages(result, user_id: str) -> list:
+    """解析辨識結果並存檔，回傳要通知使用者的訊息"""
+    card_obj, error_msg = _parse_card_result(result)
+    if error_msg:
+        return [TextSendMessage(text=error_msg)]
+    return _save_card_messages(card_obj, user_id)
+
+
+def _ask_for_backside(user_id: str, card_obj: dict,
+                      front_image_bytes: bytes) -> TextSendMessage:
+    """暫存正面辨識結果，回傳詢問這張名片是否還有背面的訊息"""
+    user_states[user_id] = {
+        'action': 'pending_backside_confirm',
+        'card_obj': card_obj,
+        'front_image_bytes': front_image_bytes,
+        'expires_at': time.time() + PENDING_BACKSIDE_TIMEOUT_SECONDS
+    }
+    return TextSendMessage(
+        text="📇 已辨識正面資料，這張名片還有背面嗎？",
+        quick_reply=get_backside_confirm_quick_reply()
+    )
+
+
+async def _push_scan_result(user_id: str, recognition: asyncio.Task,
+                            pending_front_image: bytes = None) -> None:
+    """請求的時間預算用完後繼續等待進行中的辨識，完成後推送結果
+
+    沿用原本的辨識，不重新送出，避免同一張名片辨識兩次或存成兩筆。
+    正面辨識（傳入 pending_front_image）與即時回覆相同，先詢問是否
+    還有背面；正反面合併辨識則直接存檔。
+    """
+    try:
+        result = await recognition
+        if pending_front_image is None:
+            messages = _recognized_card_messages(result, user_id)
+        else:
+            card_obj, error_msg = _parse_card_result(result)
+            if error_msg:
+                messages = [TextSendMessage(text=error_msg)]
+            else:
+                messages = [_ask_for_backside(
+                    user_id, card_obj, pending_front_image)]
+    except Exception as e:
+        print(f"Error finishing namecard scan: {e}")
+        messages = [TextSendMessage(text="辨識名片時發生錯誤，請重新傳送名片。")]
+    await line_bot_api.push_message(user_id, messages)
+
+
+async def process_deferred_scans() -> int:
+    """辨識熔斷期間延後的名片圖片，回傳處理的數量
+
+    熔斷器再次開啟時，尚未處理的圖片放回佇列等待下次處理。
+    """
+    jobs = deferred_scans.queue.pop_all()
+    for i, job in enumerate(jobs):
+        try:
+            messages = await _scan_deferred(job)
+        except circuit_breaker.CircuitOpenError:
+            deferred_scans.queue.requeue(jobs[i:])
+            return i
+        except Exception as e:
+            print(f"Error scanning deferred namecard: {e}")
+            messages = [TextSendMessage(
+                text="辨識先前保留的名片時發生錯誤，請重新傳送名片。")]
+        await line_bot_api.push_message(job.user_id, messages)
+    return len(jobs)
+
+
+def schedule_deferred_scans() -> None:
+    """有延後的名片且辨識服務未熔斷時，在背景開始處理"""
+    if not deferred_scans.queue or circuit_breaker.vertex.is_open():
+        return
+    _run_in_background(process_deferred_scans())
 
 
 async def handle_image_event(event: MessageEvent, user_id: str) -> None:
@@ -709,57 +935,64 @@ async def handle_image_event(event: MessageEvent, user_id: str) -> None:
         and state.get('expires_at', 0) > time.time()
     )
 
-    if is_awaiting_backside:
-        front_img = PIL.Image.open(BytesIO(state['front_image_bytes']))
-        result = gemini_utils.generate_json_from_two_images(
-            front_img, img, config.DOUBLE_SIDED_IMAGE_PROMPT)
-        del user_states[user_id]
-    else:
-        # 只清除跟背面辨識流程有關的殘留狀態，
-        # 不動其他無關的 pending 狀態（例如 adding_memo、editing_field）
-        if state.get('action') in (
-            'pending_backside_confirm', 'awaiting_backside_image'
-        ):
+    # 辨識在不受請求時間預算限制的 task 中執行，逾時後交給背景繼續等待
+    recognition = None
+    try:
+        if deadline.running_low():
+            raise deadline.DeadlineExceeded("not enough time left for OCR")
+        if is_awaiting_backside:
+            front_img = PIL.Image.open(BytesIO(state['front_image_bytes']))
+            recognition = _run_in_background(
+                model_router.recognize_two_sided_card(
+                    front_img, img, config.DOUBLE_SIDED_IMAGE_PROMPT,
+                    user_id))
+            result = await deadline.wait_for(asyncio.shield(recognition))
             del user_states[user_id]
-        result = gemini_utils.generate_json_from_image(
-            img, config.IMGAGE_PROMPT)
+        else:
+            # 只清除跟背面辨識流程有關的殘留狀態，
+            # 不動其他無關的 pending 狀態（例如 adding_memo、editing_field）
+            if state.get('action') in (
+                'pending_backside_confirm', 'awaiting_backside_image'
+            ):
+                del user_states[user_id]
+            recognition = _run_in_background(model_router.recognize_card(
+                img, config.IMGAGE_PROMPT, user_id))
+            result = await deadline.wait_for(asyncio.shield(recognition))
+    except (circuit_breaker.CircuitOpenError,
+            deadline.DeadlineExceeded) as e:
+        front_image_bytes = None
+        if is_awaiting_backside:
+            front_image_bytes = user_states.pop(user_id)['front_image_bytes']
+        timed_out = isinstance(e, deadline.DeadlineExceeded)
+        if timed_out and recognition is not None:
+            pending_front_image = None
+            if not is_awaiting_backside:
+                pending_front_image = image_content
+            _run_in_background(_push_scan_result(
+                user_id, recognition, pending_front_image))
+            await line_bot_api.reply_message(
+                event.reply_token,
+                TextSendMessage(text=SCAN_PENDING_TEXT,
+                                quick_reply=get_quick_reply_items()))
+            return
+        await _defer_scan(event, user_id, image_content, front_image_bytes,
+                          timed_out)
+        if timed_out:
+            schedule_deferred_scans()
+        return
 
-    card_obj = utils.parse_gemini_result_to_json(result.text)
-    if not card_obj:
-        error_msg = f"無法解析這張名片，請再試一次。 錯誤資訊: {result.text}"
+    card_obj, error_msg = _parse_card_result(result)
+    if error_msg:
         await line_bot_api.reply_message(
             event.reply_token,
             [TextSendMessage(text=error_msg)]
         )
         return
 
-    # Gemini Pro Vision API might return a list of objects, take the first one.
-    if isinstance(card_obj, list):
-        if not card_obj:
-            error_msg = f"無法解析這張名片，Gemini 回傳了空的資料。 資訊: {result.text}"
-            await line_bot_api.reply_message(
-                event.reply_token,
-                [TextSendMessage(text=error_msg)]
-            )
-            return
-        card_obj = card_obj[0]
-
-    card_obj = {k.lower(): v for k, v in card_obj.items()}
-
     if is_awaiting_backside:
         await _finalize_and_save_card(card_obj, event, user_id)
         return
 
-    user_states[user_id] = {
-        'action': 'pending_backside_confirm',
-        'card_obj': card_obj,
-        'front_image_bytes': image_content,
-        'expires_at': time.time() + PENDING_BACKSIDE_TIMEOUT_SECONDS
-    }
     await line_bot_api.reply_message(
         event.reply_token,
-        TextSendMessage(
-            text="📇 已辨識正面資料，這張名片還有背面嗎？",
-            quick_reply=get_backside_confirm_quick_reply()
-        )
-    )
+        _ask_for_backside(user_id, card_obj, image_content))
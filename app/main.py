@@ -1,45 +1,23 @@
-from fastapi import Request, FastAPI, HTTPException
+from fastapi import Request, FastAPI, HTTPException, Response
 from linebot.models import MessageEvent, PostbackEvent
 from linebot.exceptions import InvalidSignatureError
-import firebase_admin
-from firebase_admin import credentials
-import os
-import json
 
-from . import config
+from . import (
+    agent_trace, card_mirror, circuit_breaker, config, deadline,
+    deferred_scans, firebase_utils, intent_router, model_router,
+    response_cache, vertex_scheduler
+)
 from .line_handlers import (
     handle_text_event, handle_image_event, handle_postback_event,
-    sweep_expired_states)
+    schedule_deferred_scans, sweep_expired_states)
 from .bot_instance import close_session, parser
+from .storage_backend import get_backend, init_storage
 
 # =====================
 # 初始化區塊
 # =====================
-
-# Firebase 初始化
-firebase_config = {
-    "databaseURL": config.FIREBASE_URL,
-}
-# 如果設定了 Storage Bucket，則加入配置
-if config.FIREBASE_STORAGE_BUCKET:
-    firebase_config["storageBucket"] = config.FIREBASE_STORAGE_BUCKET
-
-try:
-    cred = credentials.ApplicationDefault()
-    firebase_admin.initialize_app(cred, firebase_config)
-    print("Firebase Admin SDK initialized successfully.")
-except Exception as e:
-    # 在 Heroku 上，GOOGLE_APPLICATION_CREDENTIALS 可能不是一個有效的檔案路徑
-    # 此時需要從環境變數解析 JSON
-    gac_str = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-    if gac_str:
-        cred_json = json.loads(gac_str)
-        cred = credentials.Certificate(cred_json)
-        firebase_admin.initialize_app(cred, firebase_config)
-        print("Firebase Admin SDK initialized successfully from ENV VAR.")
-    else:
-        print(f"Firebase initialization failed: {e}")
-        # 可以選擇在這裡 sys.exit(1) 或讓程式繼續，但 Firebase 功能會失效
+# Firebase 初始化（僅在使用 Firebase 資料層後端時）
+init_storage()
 
 
 # FastAPI 初始化
@@ -58,8 +36,19 @@ async def handle_callback(request: Request):
     except InvalidSignatureError:
         raise HTTPException(status_code=400, detail="Invalid signature")
     sweep_expired_states()
-    for event in events:
-        user_id = event.source.user_id
+    schedule_deferred_scans()
+    # 同一次 webhook 的所有事件共用 reply token 的時間預算
+    with deadline.request_deadline():
+        for event in events:
+            await dispatch_event(event)
+    return "OK"
+
+
+async def dispatch_event(event) -> int:
+    """在單一事件的 CardContext 中處理事件，回傳此事件的 RTDB 讀取次數"""
+    user_id = event.source.user_id
+    card_mirror.touch(user_id)
+    with firebase_utils.card_context() as card_ctx:
         if isinstance(event, MessageEvent):
             if event.message.type == "text":
                 await handle_text_event(event, user_id)
@@ -67,15 +56,46 @@ async def handle_callback(request: Request):
                 await handle_image_event(event, user_id)
         elif isinstance(event, PostbackEvent):
             await handle_postback_event(event, user_id)
-    return "OK"
+    print(f"RTDB reads/writes for {type(event).__name__}: "
+          f"{card_ctx.reads}/{card_ctx.writes}")
+    return card_ctx.reads
 
 
 @app.get("/")
 async def health_check():
-    return {"status": "ok"}
+    circuit = circuit_breaker.vertex.summary()
+    circuit["deferred_scans"] = len(deferred_scans.queue)
+    return {
+        "status": "ok" if circuit["state"] == circuit_breaker.CLOSED
+        else "degraded",
+        "circuit": circuit,
+        "router": intent_router.stats.summary(),
+        "response_cache": response_cache.cache.summary(),
+        "agent": agent_trace.metrics.summary(),
+        "models": model_router.stats.summary(),
+        "scheduler": vertex_scheduler.scheduler.summary(),
+    }
+
+
+@app.get("/blobs/{name:path}")
+async def get_blob(name: str):
+    """提供 memory / sqlite 後端所儲存的 QR Code 圖片
+
+    只提供 QR Code 前綴下的 blob；firebase 後端的 blob 直接以
+    Cloud Storage 的公開網址提供，不經由本路由。
+    """
+    if (config.STORAGE_BACKEND == "firebase"
+            or not name.startswith(config.QRCODE_BLOB_PREFIX + "/")):
+        raise HTTPException(status_code=404, detail="Not found")
+    blob = get_backend().get_blob(name)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    data, content_type = blob
+    return Response(content=data, media_type=content_type)
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
     await close_session()
     print("aiohttp session closed.")
+    card_mirror.close_all()
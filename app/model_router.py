@@ -0,0 +1,174 @@
+"""Gemini 模型分級路由
+
+不同的工作對模型能力的需求不同：單純的查詢與清楚的單面名片用較輕量、
+便宜、快速的模型就足夠；多步驟的修改與雙面合併才需要較強的模型。
+config.MODEL_POLICY 決定各任務的起始等級（config.MODEL_TIERS 對應到
+實際模型），結果不理想時升級為 standard 重試一次：
+
+- 名片辨識：回傳內容無法解析，或有 OCR_ESCALATE_NA_FIELDS 個以上欄位
+  為 N/A
+- Agent：lite 模型超過回合預算（見 agent_runtime.run_agent）
+
+所有呼叫都先向 vertex_scheduler 依優先權取得配額，再經過
+circuit_breaker.vertex，熔斷中時拋出 CircuitOpenError。辨識在 worker
+thread 中執行，不阻塞 event loop；排隊與辨識都以請求剩餘的時間預算
+為上限（見 deadline），逾時拋出 DeadlineExceeded。
+
+TierStats 依任務與等級累計呼叫次數、延遲、token 數與估算成本
+（config.MODEL_PRICES），可在健康檢查端點 `GET /` 的 `models` 欄位查看，
+據此調整 policy。
+"""
+import asyncio
+import threading
+import time
+
+from . import (
+    circuit_breaker, config, deadline, gemini_utils, intent_router, utils,
+    vertex_scheduler
+)
+
+LITE = "lite"
+STANDARD = "standard"
+
+NAMECARD_FIELDS = tuple(gemini_utils.NAMECARD_SCHEMA["required"])
+
+
+def model_for(tier: str) -> str:
+    return config.MODEL_TIERS[tier]
+
+
+def policy_tier(task: str) -> str:
+    """任務的起始等級；未設定的任務使用 standard"""
+    return config.MODEL_POLICY.get(task, STANDARD)
+
+
+def agent_task(msg: str) -> str:
+    """Agent 訊息的任務類型：含編輯用語為 agent_edit，其餘為 agent_query"""
+    return "agent_edit" if intent_router.is_edit(msg) else "agent_query"
+
+
+def na_count(card_obj: dict) -> int:
+    """名片辨識結果中看不出來（N/A 或空白）的欄位數"""
+    count = 0
+    for field in NAMECARD_FIELDS:
+        value = str(card_obj.get(field) or "").strip()
+        if not value or value.upper() == "N/A":
+            count += 1
+    return count
+
+
+def needs_escalation(result) -> bool:
+    """名片辨識結果是否需要改用較強的模型重新辨識"""
+    card_obj = utils.parse_gemini_result_to_json(result.text)
+    if isinstance(card_obj, list):
+        card_obj = card_obj[0] if card_obj else {}
+    if not isinstance(card_obj, dict) or not card_obj:
+        return True
+    card_obj = {k.lower(): v for k, v in card_obj.items()}
+    return na_count(card_obj) >= config.OCR_ESCALATE_NA_FIELDS
+
+
+def _token_count(usage, name: str) -> int:
+    value = getattr(usage, name, None)
+    return value if isinstance(value, int) else 0
+
+
+class TierStats:
+    """依任務與模型等級累計呼叫次數、延遲、token 數與估算成本"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls = {}        # (task, tier) -> 累計數值
+            self._escalations = {}  # task -> 升級次數
+
+    def record(self, task: str, tier: str, seconds: float,
+               prompt_tokens: int = 0, output_tokens: int = 0) -> None:
+        with self._lock:
+            stats = self._calls.setdefault((task, tier), {
+                "calls": 0, "seconds": 0.0,
+                "prompt_tokens": 0, "output_tokens": 0,
+            })
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["prompt_tokens"] += prompt_tokens
+            stats["output_tokens"] += output_tokens
+
+    def record_usage(self, task: str, tier: str, seconds: float,
+                     usage) -> None:
+        """以回應的 usage_metadata 記錄一次呼叫"""
+        self.record(task, tier, seconds,
+                    _token_count(usage, "prompt_token_count"),
+                    _token_count(usage, "candidates_token_count"))
+
+    def escalated(self, task: str) -> None:
+        with self._lock:
+            self._escalations[task] = self._escalations.get(task, 0) + 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            tasks = {}
+            for (task, tier), stats in self._calls.items():
+                input_price, output_price = config.MODEL_PRICES[tier]
+                tasks.setdefault(task, {})[tier] = {
+                    "calls": stats["calls"],
+                    "avg_ms": stats["seconds"] * 1000 / stats["calls"],
+                    "prompt_tokens": stats["prompt_tokens"],
+                    "output_tokens": stats["output_tokens"],
+                    "cost_usd": (stats["prompt_tokens"] * input_price
+                                 + stats["output_tokens"] * output_price)
+                    / 1_000_000,
+                }
+            return {"tasks": tasks, "escalations": dict(self._escalations)}
+
+
+stats = TierStats()
+
+
+async def _recognize(task: str, user_id: str, priority: str, generate,
+                     *args):
+    """以任務的起始等級辨識名片，結果不理想時升級為 standard 重試"""
+    tier = policy_tier(task)
+    while True:
+        ticket = await deadline.wait_for(
+            vertex_scheduler.scheduler.acquire(priority, user_id))
+        tokens = 0
+        try:
+            start = time.perf_counter()
+            # 請求預算用完不代表 Vertex AI 故障（過慢仍會計入慢呼叫）
+            with circuit_breaker.vertex.guard(
+                    ignore=(deadline.DeadlineExceeded,)):
+                result = await deadline.wait_for(asyncio.to_thread(
+                    generate, *args, model_name=model_for(tier)))
+            usage = getattr(result, "usage_metadata", None)
+            tokens = (_token_count(usage, "prompt_token_count")
+                      + _token_count(usage, "candidates_token_count")
+                      or ticket.tokens)
+        finally:
+            vertex_scheduler.scheduler.settle(ticket, tokens)
+        stats.record_usage(task, tier, time.perf_counter() - start, usage)
+        if tier == STANDARD or not needs_escalation(result):
+            return result
+        stats.escalated(task)
+        tier = STANDARD
+
+
+async def recognize_card(img, prompt: str, user_id: str,
+                         priority: str = vertex_scheduler.OCR):
+    """辨識單面名片，回傳 Gemini 回應（.text 為 JSON）"""
+    return await _recognize(
+        "ocr_single", user_id, priority,
+        gemini_utils.generate_json_from_image, img, prompt)
+
+
+async def recognize_two_sided_card(front_img, back_img, prompt: str,
+                                   user_id: str,
+                                   priority: str = vertex_scheduler.OCR):
+    """合併辨識名片正反面，回傳 Gemini 回應（.text 為 JSON）"""
+    return await _recognize(
+        "ocr_double", user_id, priority,
+        gemini_utils.generate_json_from_two_images,
+        front_img, back_img, prompt)
@@ -0,0 +1,128 @@
+"""電話號碼正規化與反查索引
+
+名片上的電話格式不一（OCR prompt 產生的 `#886-0123-456-789,1234`、
+`+886 912 345 678`、`(02) 1234-5678` 等），直接比對子字串會因國碼、
+區碼前的 0 與分隔符號不同而失敗。normalize_phone() 將號碼轉成不含國碼
+與長途冠碼 0 的數字字串，PhoneIndex 再以反轉數字的後綴樹（suffix trie）
+保存，輸入完整號碼或末幾碼都能以 O(號碼長度) 找到名片。
+"""
+import re
+
+# 常見國碼（依長度由長到短比對）
+COUNTRY_CODES = (
+    "886", "852", "853", "86", "81", "82", "65", "60", "66", "84", "63",
+    "62", "91", "61", "44", "49", "33", "1",
+)
+# 部分號碼至少要幾位數才查詢，避免過短的數字對到大量名片
+MIN_QUERY_DIGITS = 4
+
+_SPLIT_RE = re.compile(r"[/;、|\n]+")
+_EXTENSION_RE = re.compile(r"(?:,|分機|ext\.?|#|x)\s*(\d{1,6})\s*$",
+                           re.IGNORECASE)
+_PHONE_QUERY_RE = re.compile(r"[+#(]?[\d\s\-().]+(?:,\d{1,6})?")
+
+
+def _strip_country_code(digits: str, international: bool) -> str:
+    for code in COUNTRY_CODES:
+        # 沒有 + / # / 00 標示時，只有台灣國碼且長度夠長才視為國碼
+        if digits.startswith(code) and (
+                international or (code == "886" and len(digits) >= 11)):
+            return digits[len(code):]
+    return digits
+
+
+def normalize_phone(raw: str) -> list:
+    """回傳欄位中每個號碼的正規化結果 [(號碼數字, 分機), ...]"""
+    numbers = []
+    for part in _SPLIT_RE.split(raw or ""):
+        part = part.strip()
+        extension = None
+        match = _EXTENSION_RE.search(part)
+        # 開頭的 # 是國碼標示，不是分機
+        if match and match.start() > 0:
+            extension = match.group(1)
+            part = part[:match.start()]
+        digits = re.sub(r"\D", "", part)
+        if not digits:
+            continue
+        international = part.lstrip().startswith(("+", "#"))
+        if digits.startswith("00"):
+            digits = digits[2:]
+            international = True
+        digits = _strip_country_code(digits, international).lstrip("0")
+        if digits:
+            numbers.append((digits, extension))
+    return numbers
+
+
+def looks_like_phone(query: str) -> bool:
+    """查詢字串是否為電話號碼（完整或部分）"""
+    query = (query or "").strip()
+    if not _PHONE_QUERY_RE.fullmatch(query):
+        return False
+    return len(re.sub(r"\D", "", query)) >= MIN_QUERY_DIGITS
+
+
+class PhoneIndex:
+    """單一使用者的電話反查索引（反轉數字的後綴樹）
+
+    每個節點代表一段號碼結尾，並記錄結尾為這段數字的名片，因此查詢只
+    需沿著反轉後的查詢數字往下走。
+    """
+
+    def __init__(self):
+        self._root = {}
+        self._card_numbers = {}  # card_id -> [號碼數字]，移除時使用
+
+    # 節點為 dict：數字 -> 子節點，另以 None 鍵存放名片集合
+    def _path(self, digits: str) -> list:
+        """由根節點沿反轉的數字往下走，回傳經過的節點（不含根節點）"""
+        path = []
+        node = self._root
+        for digit in reversed(digits):
+            node = node.get(digit)
+            if node is None:
+                break
+            path.append(node)
+        return path
+
+    def __len__(self) -> int:
+        return len(self._card_numbers)
+
+    def add(self, card_id: str, phone: str) -> None:
+        self.remove(card_id)
+        numbers = [digits for digits, _ in normalize_phone(phone)]
+        if not numbers:
+            return
+        self._card_numbers[card_id] = numbers
+        for digits in numbers:
+            node = self._root
+            for digit in reversed(digits):
+                node = node.setdefault(digit, {None: set()})
+                node[None].add(card_id)
+
+    def remove(self, card_id: str) -> None:
+        for digits in self._card_numbers.pop(card_id, ()):
+            path = self._path(digits)
+            for node in path:
+                node[None].discard(card_id)
+            # 由葉節點往上移除已經沒有名片的節點
+            for depth in range(len(path) - 1, -1, -1):
+                if path[depth][None]:
+                    break
+                parent = path[depth - 1] if depth else self._root
+                del parent[digits[-depth - 1]]
+
+    def search(self, query: str) -> list:
+        """以完整或末幾碼查詢，回傳相符的 card_id（完整號碼相符者在前）"""
+        results = []
+        for digits, _ in normalize_phone(query):
+            path = self._path(digits)
+            if len(digits) < MIN_QUERY_DIGITS - 1 or len(path) < len(digits):
+                continue
+            matched = path[-1][None]
+            exact = sorted(card_id for card_id in matched
+                           if digits in self._card_numbers[card_id])
+            partial = sorted(matched.difference(exact))
+            results.extend(exact + partial)
+        return list(dict.fromkeys(results))
@@ -0,0 +1,23 @@
+"""修復統計彙總漂移的維護工作
+
+用法：python -m app.reconcile_stats [user_id ...]
+未指定 user_id 時會檢查所有使用者。
+"""
+import sys
+
+from . import firebase_utils, storage_backend
+
+
+def run(user_ids: list) -> list:
+    if not user_ids:
+        return firebase_utils.reconcile_all_statistics()
+    return [
+        u_id for u_id in user_ids
+        if firebase_utils.rebuild_namecard_statistics(u_id)
+    ]
+
+
+if __name__ == "__main__":
+    storage_backend.init_storage()
+    repaired = run(sys.argv[1:])
+    print(f"Repaired statistics for {len(repaired)} user(s): {repaired}")
@@ -0,0 +1,112 @@
+"""Agent 回覆的快取
+
+使用者常一天內重複同樣的查詢（例如「王大明電話」），每次都要讓 Agent
+經過多輪模型呼叫。ResponseCache 以「使用者 + 正規化後的訊息」為鍵，
+保存 Agent 的文字回覆與要顯示的名片 card_id，下次相同的查詢直接回覆，
+不呼叫 Vertex AI。
+
+- 只快取唯讀的查詢：執行期間調用了修改工具的回覆不會存入
+- 含「他」、「這張」等代稱的訊息依賴對話上下文，不快取
+- 每位使用者有資料版本號，名片新增、修改、刪除時由 firebase_utils
+  呼叫 invalidate() 遞增；版本不同的快取視為失效。呼叫端在執行 Agent
+  之前取得版本號，執行期間名片有變動的回覆不會存入
+- 以 RESPONSE_CACHE_MAX_ENTRIES（最近使用淘汰）與
+  RESPONSE_CACHE_TTL_SECONDS 限制大小與時效；版本號只在行程內，
+  其他實例寫入的名片最晚在 TTL 後反映
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from . import config
+from .text_utils import split_terms
+
+CachedResponse = namedtuple("CachedResponse", ["text", "card_ids"])
+
+# 依賴對話上下文的用語，這類訊息的回覆不能重複使用
+CONTEXT_WORDS = (
+    "他", "她", "它", "這張", "這個", "這位", "那張", "那個", "那位",
+    "剛剛", "剛才", "上一", "前一", "下一", "其他", "另一",
+)
+
+
+def cache_key(msg: str):
+    """訊息的快取鍵；依賴對話上下文的訊息回傳 None"""
+    terms = split_terms(msg)
+    key = " ".join(terms)
+    if not key or any(word in key for word in CONTEXT_WORDS):
+        return None
+    return key
+
+
+class ResponseCache:
+    """以使用者資料版本號失效的 LRU + TTL 回覆快取"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (u_id, key) -> (版本, 時間, 回覆)
+        self._versions = {}  # u_id -> 資料版本號
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, u_id: str, key: str):
+        """取得仍有效的快取回覆，沒有時回傳 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((u_id, key))
+            if entry is not None:
+                version, stored_at, response = entry
+                if (version == self._versions.get(u_id, 0)
+                        and now - stored_at
+                        < config.RESPONSE_CACHE_TTL_SECONDS):
+                    self._entries.move_to_end((u_id, key))
+                    self.hits += 1
+                    return response
+                del self._entries[(u_id, key)]
+            self.misses += 1
+            return None
+
+    def version(self, u_id: str) -> int:
+        """使用者目前的資料版本號；在產生回覆之前取得，存入時傳給 put()"""
+        with self._lock:
+            return self._versions.get(u_id, 0)
+
+    def put(self, u_id: str, key: str, text: str, card_ids: list,
+            version: int) -> None:
+        """存入以 version 時的資料產生的回覆
+
+        產生回覆期間名片有變動（版本號已不同）時不存入，避免過時的回覆
+        被記在新的版本號下。
+        """
+        with self._lock:
+            if version != self._versions.get(u_id, 0):
+                return
+            self._entries[(u_id, key)] = (
+                version, time.time(), CachedResponse(text, tuple(card_ids)))
+            self._entries.move_to_end((u_id, key))
+            while len(self._entries) > config.RESPONSE_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, u_id: str) -> None:
+        """使用者的名片有變動：遞增資料版本號，舊的快取不再使用"""
+        with self._lock:
+            self._versions[u_id] = self._versions.get(u_id, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def summary(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+cache = ResponseCache()
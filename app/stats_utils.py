@@ -0,0 +1,152 @@
+from datetime import datetime
+from urllib.parse import quote
+
+# 統計彙總節點結構（存放於 config.NAMECARD_STATS_PATH/{u_id}）：
+# {
+#     "total": 名片總數,
+#     "months": {"2026-10": 當月新增數量, ...},
+#     "companies": {編碼後公司名稱: {"name": 公司名稱, "count": 數量}, ...},
+#     "top_company": {"name": 公司名稱, "count": 數量}  # 衍生欄位，無公司時不存在
+# }
+# 「📊 統計」只讀取 total、當月計數與 top_company，不必讀取整個 companies
+
+
+def empty_statistics() -> dict:
+    return {"total": 0, "months": {}, "companies": {}}
+
+
+def company_key(company: str) -> str:
+    """將公司名稱轉成合法的 RTDB key（不可含 . $ # [ ] /）"""
+    return quote(company, safe="").replace(".", "%2E")
+
+
+def _card_month(card: dict) -> str:
+    created_at = card.get("created_at")
+    if not created_at:
+        return None
+    try:
+        return datetime.fromisoformat(created_at).strftime("%Y-%m")
+    except ValueError:
+        return None  # 忽略格式錯誤的時間戳
+
+
+def _card_company(card: dict) -> str:
+    company = (card.get("company") or "").strip()
+    if not company or company == "N/A":
+        return None
+    return company
+
+
+def stats_delta(old_card: dict, new_card: dict) -> dict:
+    """計算一張名片新增／修改／刪除時，對統計彙總造成的增減量
+
+    old_card 為 None 表示新增，new_card 為 None 表示刪除。
+    """
+    delta = {"total": 0, "months": {}, "companies": {}}
+    for card, sign in ((old_card, -1), (new_card, 1)):
+        if card is None:
+            continue
+        delta["total"] += sign
+        month = _card_month(card)
+        if month:
+            delta["months"][month] = delta["months"].get(month, 0) + sign
+        company = _card_company(card)
+        if company:
+            entry = delta["companies"].setdefault(
+                company_key(company), {"name": company, "count": 0})
+            entry["count"] += sign
+    delta["months"] = {k: v for k, v in delta["months"].items() if v}
+    delta["companies"] = {
+        k: v for k, v in delta["companies"].items() if v["count"]}
+    return delta
+
+
+def is_empty_delta(delta: dict) -> bool:
+    return not (delta["total"] or delta["months"] or delta["companies"])
+
+
+def apply_counter_delta(current: int, amount: int) -> int:
+    """單一計數器節點的增減，歸零時回傳 None 讓 RTDB 移除節點"""
+    return max(0, (current or 0) + amount) or None
+
+
+def apply_company_delta(current: dict, entry: dict) -> dict:
+    """單一公司計數節點的增減，歸零時回傳 None"""
+    count = apply_counter_delta((current or {}).get("count"), entry["count"])
+    return {"name": entry["name"], "count": count} if count else None
+
+
+def top_company(companies: dict) -> dict:
+    """名片數量最多的公司 {"name", "count"}；沒有公司時回傳 None"""
+    if not companies:
+        return None
+    top = max(companies.values(),
+              key=lambda entry: (entry["count"], entry["name"]))
+    return {"name": top["name"], "count": top["count"]}
+
+
+def _with_top_company(stats: dict) -> dict:
+    top = top_company(stats["companies"])
+    if top:
+        stats["top_company"] = top
+    return stats
+
+
+def apply_stats_delta(stats: dict, delta: dict) -> dict:
+    """將增減量套用到整個統計彙總上（與逐一更新各計數節點的結果相同）"""
+    stats = stats or empty_statistics()
+    months = dict(stats.get("months") or {})
+    companies = dict(stats.get("companies") or {})
+
+    for month, count in delta["months"].items():
+        months[month] = months.get(month, 0) + count
+        if months[month] <= 0:
+            del months[month]
+
+    for key, entry in delta["companies"].items():
+        company = apply_company_delta(companies.get(key), entry)
+        if company:
+            companies[key] = company
+        else:
+            companies.pop(key, None)
+
+    return _with_top_company({
+        "total": max(0, (stats.get("total") or 0) + delta["total"]),
+        "months": months,
+        "companies": companies,
+    })
+
+
+def compute_statistics(all_cards: dict) -> dict:
+    """從所有名片完整重算統計彙總（修復漂移時使用）"""
+    stats = empty_statistics()
+    months = stats["months"]
+    companies = stats["companies"]
+    for card in (all_cards or {}).values():
+        stats["total"] += 1
+        month = _card_month(card)
+        if month:
+            months[month] = months.get(month, 0) + 1
+        company = _card_company(card)
+        if company:
+            entry = companies.setdefault(
+                company_key(company), {"name": company, "count": 0})
+            entry["count"] += 1
+    return _with_top_company(stats)
+
+
+def summarize_statistics(stats: dict, now: datetime = None) -> dict:
+    """將統計彙總轉成「📊 統計」回覆所需的格式
+
+    沒有 top_company 衍生欄位的舊彙總改從 companies 找出。
+    """
+    stats = stats or empty_statistics()
+    now = now or datetime.now()
+    this_month = (stats.get("months") or {}).get(now.strftime("%Y-%m"), 0)
+
+    top = stats.get("top_company") or top_company(stats.get("companies"))
+    return {
+        "total": stats.get("total") or 0,
+        "this_month": this_month,
+        "top_company": f"{top['name']} ({top['count']}張)" if top else "無"
+    }
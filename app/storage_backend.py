@@ -0,0 +1,549 @@
+"""資料層後端抽象
+
+firebase_utils 的名片、索引節點（摘要、統計彙總）都以 RTDB 風格的路徑存取，
+QR Code 等二進位檔案則以 blob 名稱存取。StorageBackend 定義這組操作，
+並提供三種實作（以 config.STORAGE_BACKEND 選擇）：
+
+- firebase：Firebase Realtime Database + Cloud Storage（正式環境）
+- memory：行程內記憶體（測試、效能量測）
+- sqlite：本機 SQLite 檔案（離線開發用的替身）
+
+路徑、push key 排序、空節點移除與排序查詢的行為皆比照 RTDB。
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+
+from . import config, deadline
+
+
+# 與 firebase_admin.db.Event 相同的欄位：event_type、path、data
+ListenEvent = namedtuple("ListenEvent", ["event_type", "path", "data"])
+
+
+def _split(path: str) -> list:
+    return [part for part in path.strip("/").split("/") if part]
+
+
+def _join(*parts: str) -> str:
+    return "/".join(part.strip("/") for part in parts if part.strip("/"))
+
+
+def _normalize(value):
+    """比照 RTDB：移除 None 與空的子節點，整個節點為空時回傳 None"""
+    if isinstance(value, dict):
+        normalized = {}
+        for key, child in value.items():
+            child = _normalize(child)
+            if child is not None:
+                normalized[str(key)] = child
+        return normalized or None
+    if isinstance(value, (list, tuple)):
+        return _normalize({str(i): child for i, child in enumerate(value)})
+    return value
+
+
+def _shallow(value):
+    if isinstance(value, dict):
+        return {key: True for key in value}
+    return value
+
+
+def _order_key(item: tuple, order_by: str) -> tuple:
+    """RTDB order_by_child 的排序：null < false < true < 數字 < 字串 < 物件，
+    同值再依 key 排序"""
+    key, value = item
+    child = value.get(order_by) if isinstance(value, dict) else None
+    if child is None:
+        rank, child = 0, 0
+    elif isinstance(child, bool):
+        rank, child = 1, int(child)
+    elif isinstance(child, (int, float)):
+        rank = 2
+    elif isinstance(child, str):
+        rank = 3
+    else:
+        rank, child = 4, 0
+    return rank, child, key
+
+
+_PUSH_CHARS = (
+    "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz")
+_push_lock = threading.Lock()
+_last_push_time = 0
+_last_rand_chars = []
+
+
+def generate_push_id() -> str:
+    """產生與 Firebase push() 相同格式、依建立時間排序的 20 字元 key"""
+    global _last_push_time, _last_rand_chars
+    with _push_lock:
+        now = int(time.time() * 1000)
+        if now == _last_push_time:
+            # 同一毫秒內遞增亂數部分，確保排序
+            for i in range(11, -1, -1):
+                if _last_rand_chars[i] != 63:
+                    _last_rand_chars[i] += 1
+                    break
+                _last_rand_chars[i] = 0
+        else:
+            _last_rand_chars = [random.randrange(64) for _ in range(12)]
+            _last_push_time = now
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(_PUSH_CHARS[now % 64])
+            now //= 64
+        return "".join(reversed(time_chars)) + "".join(
+            _PUSH_CHARS[i] for i in _last_rand_chars)
+
+
+class StorageBackend(ABC):
+    """名片資料層介面：路徑式樹狀資料（名片與索引節點）與 blob 檔案"""
+
+    # 是否能以 listen() 訂閱變更（card_mirror 依此決定是否包裝此後端）
+    supports_listen = True
+
+    @abstractmethod
+    def get(self, path: str, shallow: bool = False):
+        """讀取節點；shallow=True 時子節點只回傳 {key: True}"""
+
+    async def get_async(self, path: str, shallow: bool = False):
+        """在 event loop 中讀取節點（本機後端直接讀取，不需要等待）"""
+        return self.get(path, shallow=shallow)
+
+    @abstractmethod
+    def set(self, path: str, value) -> None:
+        """覆寫節點（value 為 None 等同刪除）"""
+
+    @abstractmethod
+    def update(self, path: str, values: dict) -> None:
+        """多路徑更新：values 的 key 可為相對路徑（例如 "card-1/memo"）"""
+
+    def push(self, path: str, value) -> str:
+        """以依時間排序的新 key 新增子節點，回傳該 key"""
+        key = generate_push_id()
+        self.set(_join(path, key), value)
+        return key
+
+    def delete(self, path: str) -> None:
+        self.set(path, None)
+
+    @abstractmethod
+    def transaction(self, path: str, update_fn):
+        """以 update_fn(目前值) 的回傳值原子性覆寫節點，回傳新值"""
+
+    def query(self, path: str, order_by: str, start_at=None, end_at=None,
+              limit_to_first: int = None, limit_to_last: int = None):
+        """依子欄位排序查詢子節點，回傳排序後的 OrderedDict"""
+        children = self.get(path) or {}
+        if not isinstance(children, dict):
+            return OrderedDict()
+        items = sorted(
+            children.items(), key=lambda item: _order_key(item, order_by))
+        if start_at is not None:
+            bound = _order_key(("", {order_by: start_at}), order_by)[:2]
+            items = [item for item in items
+                     if _order_key(item, order_by)[:2] >= bound]
+        if end_at is not None:
+            bound = _order_key(("", {order_by: end_at}), order_by)[:2]
+            items = [item for item in items
+                     if _order_key(item, order_by)[:2] <= bound]
+        if limit_to_first is not None:
+            items = items[:limit_to_first]
+        if limit_to_last is not None:
+            items = items[-limit_to_last:] if limit_to_last else []
+        return OrderedDict(items)
+
+    @abstractmethod
+    def listen(self, path: str, callback):
+        """訂閱節點變更（比照 RTDB 串流：先送出 path "/" 的完整 put，
+        之後送出 put / patch 事件），回傳具有 close() 的註冊物件；
+        supports_listen 為 False 的後端拋出 NotImplementedError"""
+
+    @abstractmethod
+    def upload_blob(self, name: str, data: bytes, content_type: str) -> str:
+        """上傳 blob 並回傳可公開讀取的 URL"""
+
+    @abstractmethod
+    def get_blob(self, name: str) -> tuple:
+        """回傳 (data, content_type)，不存在時回傳 None"""
+
+    def _local_blob_url(self, name: str) -> str:
+        return f"{config.LOCAL_BLOB_BASE_URL.rstrip('/')}/blobs/{name}"
+
+
+class FirebaseBackend(StorageBackend):
+    """Firebase Realtime Database + Cloud Storage 實作"""
+
+    def __init__(self):
+        from firebase_admin import db, storage
+        self._db = db
+        self._storage = storage
+
+    def get(self, path: str, shallow: bool = False):
+        return self._db.reference(path).get(shallow=shallow)
+
+    async def get_async(self, path: str, shallow: bool = False):
+        """以與 LINE Bot API 共用連線池的非同步 REST 用戶端讀取，
+        逾時以請求剩餘的時間預算為上限"""
+        from . import async_firebase
+        return await async_firebase.get_client().get(
+            path, shallow=shallow, timeout=deadline.timeout(reserve=0))
+
+    def set(self, path: str, value) -> None:
+        ref = self._db.reference(path)
+        if value is None:
+            ref.delete()
+        else:
+            ref.set(value)
+
+    def update(self, path: str, values: dict) -> None:
+        self._db.reference(path or "/").update(values)
+
+    def push(self, path: str, value) -> str:
+        return self._db.reference(path).push(value).key
+
+    def delete(self, path: str) -> None:
+        self._db.reference(path).delete()
+
+    def transaction(self, path: str, update_fn):
+        return self._db.reference(path).transaction(update_fn)
+
+    def query(self, path: str, order_by: str, start_at=None, end_at=None,
+              limit_to_first: int = None, limit_to_last: int = None):
+        query = self._db.reference(path).order_by_child(order_by)
+        if start_at is not None:
+            query = query.start_at(start_at)
+        if end_at is not None:
+            query = query.end_at(end_at)
+        if limit_to_first is not None:
+            query = query.limit_to_first(limit_to_first)
+        if limit_to_last is not None:
+            query = query.limit_to_last(limit_to_last)
+        return query.get() or OrderedDict()
+
+    def listen(self, path: str, callback):
+        return self._db.reference(path).listen(callback)
+
+    def upload_blob(self, name: str, data: bytes, content_type: str) -> str:
+        blob = self._storage.bucket().blob(name)
+        blob.upload_from_string(data, content_type=content_type)
+        blob.make_public()
+        return blob.public_url
+
+    def get_blob(self, name: str) -> tuple:
+        # Cloud Storage 的 blob 直接以公開 URL 提供，不經由本服務轉送
+        return None
+
+
+class MemoryBackend(StorageBackend):
+    """行程內記憶體實作，資料結構與 RTDB 相同的巢狀 dict"""
+
+    def __init__(self):
+        self._root = {}
+        self._blobs = {}
+        self._listeners = []
+        self._lock = threading.RLock()
+
+    def _node(self, parts: list):
+        node = self._root
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def get(self, path: str, shallow: bool = False):
+        with self._lock:
+            node = self._node(_split(path))
+            if shallow:
+                return _shallow(node)
+            return json.loads(json.dumps(node))
+
+    def _set(self, parts: list, value) -> None:
+        value = _normalize(json.loads(json.dumps(value)))
+        if not parts:
+            self._root = value or {}
+            return
+        node = self._root
+        trail = []
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[part] = {}
+            trail.append((node, part))
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+            # 移除因此變空的上層節點
+            for parent, part in reversed(trail):
+                if parent[part]:
+                    break
+                del parent[part]
+        else:
+            node[parts[-1]] = value
+
+    def set(self, path: str, value) -> None:
+        with self._lock:
+            self._set(_split(path), value)
+            self._notify(_join(path))
+
+    def update(self, path: str, values: dict) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._set(_split(_join(path, key)), value)
+            for key in values:
+                self._notify(_join(path, key))
+
+    def _notify(self, path: str) -> None:
+        """將寫入轉成各訂閱者的 put 事件（路徑相對於訂閱節點）"""
+        for listen_path, callback in list(self._listeners):
+            if path == listen_path or path.startswith(listen_path + "/"):
+                event_path = "/" + path[len(listen_path):].strip("/")
+                callback(ListenEvent("put", event_path, self.get(path)))
+            elif not listen_path or listen_path.startswith(path + "/"):
+                callback(ListenEvent("put", "/", self.get(listen_path)))
+
+    def listen(self, path: str, callback):
+        backend = self
+        entry = (_join(path), callback)
+
+        class Registration:
+            def close(self):
+                with backend._lock:
+                    if entry in backend._listeners:
+                        backend._listeners.remove(entry)
+
+        with self._lock:
+            self._listeners.append(entry)
+            callback(ListenEvent("put", "/", self.get(path)))
+        return Registration()
+
+    def transaction(self, path: str, update_fn):
+        with self._lock:
+            new_value = update_fn(self.get(path))
+            self.set(path, new_value)
+            return self.get(path)
+
+    def upload_blob(self, name: str, data: bytes, content_type: str) -> str:
+        with self._lock:
+            self._blobs[name] = (bytes(data), content_type)
+        return self._local_blob_url(name)
+
+    def get_blob(self, name: str) -> tuple:
+        with self._lock:
+            return self._blobs.get(name)
+
+
+class SqliteBackend(StorageBackend):
+    """本機 SQLite 實作：每個葉節點存成一列 (路徑, JSON 值)"""
+
+    def __init__(self, db_path: str):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS nodes "
+                "(path TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs "
+                "(name TEXT PRIMARY KEY, content_type TEXT, data BLOB)")
+
+    def _rows(self, path: str) -> list:
+        if not path:
+            return self._conn.execute(
+                "SELECT path, value FROM nodes").fetchall()
+        # '0' 是 '/' 的下一個字元，以範圍查詢取得整個子樹
+        return self._conn.execute(
+            "SELECT path, value FROM nodes "
+            "WHERE path = ? OR (path > ? AND path < ?)",
+            (path, path + "/", path + "0")).fetchall()
+
+    def _shallow_keys(self, path: str) -> dict:
+        """只取出直接子節點的 key，不載入整個子樹的值"""
+        if path:
+            where = "WHERE path > ? AND path < ?"
+            params = (len(path) + 2, path + "/", path + "0")
+        else:
+            where = ""
+            params = (1,)
+        rows = self._conn.execute(
+            "SELECT DISTINCT substr(rest, 1, instr(rest || '/', '/') - 1) "
+            f"FROM (SELECT substr(path, ?) AS rest FROM nodes {where})",
+            params).fetchall()
+        return {row[0]: True for row in rows}
+
+    def get(self, path: str, shallow: bool = False):
+        path = _join(path)
+        with self._lock:
+            if shallow:
+                leaf = self._conn.execute(
+                    "SELECT value FROM nodes WHERE path = ?",
+                    (path,)).fetchone()
+                if leaf is not None:
+                    return json.loads(leaf[0])
+                return self._shallow_keys(path) or None
+            rows = self._rows(path)
+        if not rows:
+            return None
+        prefix_len = len(_split(path))
+        result = {}
+        for row_path, raw in rows:
+            parts = _split(row_path)[prefix_len:]
+            if not parts:
+                return json.loads(raw)
+            node = result
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = json.loads(raw)
+        return result
+
+    def _set(self, path: str, value) -> None:
+        parts = _split(path)
+        if path:
+            self._conn.execute(
+                "DELETE FROM nodes WHERE path = ? OR (path > ? AND path < ?)",
+                (path, path + "/", path + "0"))
+            # 上層若原本是葉節點，寫入子節點時要一併移除
+            self._conn.executemany(
+                "DELETE FROM nodes WHERE path = ?",
+                [("/".join(parts[:i]),) for i in range(1, len(parts))])
+        else:
+            self._conn.execute("DELETE FROM nodes")
+
+        leaves = []
+
+        def flatten(prefix, node):
+            if isinstance(node, dict):
+                for key, child in node.items():
+                    flatten(_join(prefix, key), child)
+            else:
+                leaves.append((prefix, json.dumps(node, ensure_ascii=False)))
+
+        value = _normalize(value)
+        if value is not None:
+            flatten(path, value)
+            self._conn.executemany(
+                "INSERT INTO nodes (path, value) VALUES (?, ?)", leaves)
+
+    def set(self, path: str, value) -> None:
+        with self._lock, self._conn:
+            self._set(_join(path), value)
+
+    def update(self, path: str, values: dict) -> None:
+        with self._lock, self._conn:
+            for key, value in values.items():
+                self._set(_join(path, key), value)
+
+    def transaction(self, path: str, update_fn):
+        with self._lock:
+            new_value = update_fn(self.get(path))
+            self.set(path, new_value)
+            return self.get(path)
+
+    # 其他行程寫入同一個 SQLite 檔案時無法得知，不提供變更訂閱
+    supports_listen = False
+
+    def listen(self, path: str, callback):
+        raise NotImplementedError("sqlite backend does not support listen()")
+
+    def upload_blob(self, name: str, data: bytes, content_type: str) -> str:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs (name, content_type, data) "
+                "VALUES (?, ?, ?)", (name, content_type, bytes(data)))
+        return self._local_blob_url(name)
+
+    def get_blob(self, name: str) -> tuple:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, content_type FROM blobs WHERE name = ?",
+                (name,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+
+def init_firebase() -> None:
+    """初始化 Firebase Admin SDK（僅在使用 Firebase 資料層後端時）"""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    firebase_config = {
+        "databaseURL": config.FIREBASE_URL,
+    }
+    # 如果設定了 Storage Bucket，則加入配置
+    if config.FIREBASE_STORAGE_BUCKET:
+        firebase_config["storageBucket"] = config.FIREBASE_STORAGE_BUCKET
+
+    try:
+        cred = credentials.ApplicationDefault()
+        firebase_admin.initialize_app(cred, firebase_config)
+        print("Firebase Admin SDK initialized successfully.")
+    except Exception as e:
+        # 在 Heroku 上，GOOGLE_APPLICATION_CREDENTIALS 可能不是一個有效的檔案路徑
+        # 此時需要從環境變數解析 JSON
+        gac_str = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
+        if gac_str:
+            cred_json = json.loads(gac_str)
+            cred = credentials.Certificate(cred_json)
+            firebase_admin.initialize_app(cred, firebase_config)
+            print("Firebase Admin SDK initialized successfully from ENV VAR.")
+        else:
+            print(f"Firebase initialization failed: {e}")
+            # 可以選擇在這裡 sys.exit(1) 或讓程式繼續，但 Firebase 功能會失效
+
+
+def init_storage() -> None:
+    """程式進入點呼叫：依 config.STORAGE_BACKEND 完成資料層後端的初始化"""
+    if config.STORAGE_BACKEND == "firebase":
+        init_firebase()
+    else:
+        print(f"Using local storage backend: {config.STORAGE_BACKEND}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: str) -> StorageBackend:
+    if name == "firebase":
+        return FirebaseBackend()
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        os.makedirs(
+            os.path.dirname(os.path.abspath(config.SQLITE_PATH)),
+            exist_ok=True)
+        return SqliteBackend(config.SQLITE_PATH)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {name}")
+
+
+def get_backend() -> StorageBackend:
+    """取得目前設定的資料層後端（第一次使用時依 config 建立）"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend = create_backend(config.STORAGE_BACKEND)
+                if config.CARD_MIRROR_ENABLED and backend.supports_listen:
+                    from .card_mirror import MirroredBackend
+                    backend = MirroredBackend(backend)
+                elif config.CARD_MIRROR_ENABLED:
+                    print(f"CARD_MIRROR ignored: {config.STORAGE_BACKEND} "
+                          "backend does not support listen()")
+                _backend = backend
+    return _backend
+
+
+def set_backend(backend: StorageBackend) -> None:
+    """替換資料層後端（測試與效能量測用）"""
+    global _backend
+    _backend = backend
@@ -0,0 +1,31 @@
+"""名片搜尋共用的文字正規化與切詞"""
+import re
+import unicodedata
+
+_CJK = (
+    "\u3040-\u30ff"  # 日文假名
+    "\u3400-\u4dbf"  # CJK 擴充 A
+    "\u4e00-\u9fff"  # CJK 統一表意文字
+    "\uac00-\ud7af"  # 韓文
+    "\uf900-\ufaff"  # CJK 相容表意文字
+)
+# 第一組為連續的中日韓文字，第二組為英數字單字
+TOKEN_RE = re.compile(f"([{_CJK}]+)|([0-9a-z\u00c0-\u024f]+)")
+_CJK_RE = re.compile(f"[{_CJK}]+")
+
+
+def normalize_text(text: str) -> str:
+    """全形轉半形並轉小寫"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def is_cjk(term: str) -> bool:
+    """term 是否全由中日韓文字組成"""
+    return _CJK_RE.fullmatch(term) is not None
+
+
+def split_terms(text: str) -> list:
+    """切成連續的中日韓文字段與英數字單字（已正規化）"""
+    return [
+        cjk or word for cjk, word in TOKEN_RE.findall(normalize_text(text))
+    ]
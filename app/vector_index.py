@@ -0,0 +1,413 @@
+"""名片語意搜尋的向量索引
+
+「上次在東京認識的 AI 新創」這類描述無法以關鍵字比對，讓 Agent 讀完整本
+通訊錄又太慢。每張名片的姓名、職稱、公司、地址與備忘錄會以
+embedders 產生向量，依使用者保存在一個 float32 矩陣中（每列一張名片，
+已 L2 正規化），查詢時以一次矩陣乘法算出所有名片的 cosine 相似度再取
+前 k 名。
+
+- 名片新增、修改、刪除時由 firebase_utils 增量更新索引；尚未載入的
+  使用者在背景讀取保存的矩陣後為新名片產生向量，刪除則等下次查詢同步
+- 矩陣與每張名片文字的摘要值保存在 EMBEDDING_DIR；重新載入時只為
+  新增或內容變動的名片產生向量
+- 名片的向量在背景 task 中分批產生（不阻塞 webhook），每批完成後
+  保存一次；Vertex AI 的呼叫與查詢句的 embedding 一樣經過
+  vertex_scheduler 與 circuit_breaker.vertex，並受請求的時間預算限制
+"""
+import asyncio
+import itertools
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from . import circuit_breaker, config, deadline, vertex_scheduler
+from .embedders import (
+    EMBEDDED_FIELDS, card_text, get_embedder, normalize_rows, text_digest
+)
+
+
+class VectorIndex:
+    """單一使用者的名片向量矩陣"""
+
+    def __init__(self, dimension: int, model: str = ""):
+        self.dimension = dimension
+        self.model = model
+        self._matrix = np.zeros((0, dimension), dtype=np.float32)
+        self._ids = []      # 列 -> card_id
+        self._rows = {}     # card_id -> 列
+        self._digests = {}  # card_id -> 名片文字摘要值
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, card_id: str) -> bool:
+        return card_id in self._rows
+
+    def digest(self, card_id: str) -> str:
+        return self._digests.get(card_id)
+
+    def _reserve(self, rows: int) -> None:
+        """容量不足時以倍數擴充矩陣，避免每次新增都複製整個矩陣"""
+        capacity = self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        grown = np.zeros((max(rows, capacity * 2, 16), self.dimension),
+                         dtype=np.float32)
+        grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+        self._matrix = grown
+
+    def put_many(self, card_ids: list, vectors: np.ndarray,
+                 digests: list = None) -> None:
+        """新增或覆寫多張名片的向量"""
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            self._reserve(len(self._ids) + len(card_ids))
+            for i, card_id in enumerate(card_ids):
+                row = self._rows.get(card_id)
+                if row is None:
+                    row = self._rows[card_id] = len(self._ids)
+                    self._ids.append(card_id)
+                self._matrix[row] = vectors[i]
+                if digests is not None:
+                    self._digests[card_id] = digests[i]
+
+    def put(self, card_id: str, vector: np.ndarray,
+            digest: str = None) -> None:
+        self.put_many([card_id], np.asarray(vector).reshape(1, -1),
+                      None if digest is None else [digest])
+
+    def remove(self, card_id: str) -> None:
+        """移除名片；以最後一列填補空位，矩陣保持連續"""
+        with self._lock:
+            row = self._rows.pop(card_id, None)
+            self._digests.pop(card_id, None)
+            if row is None:
+                return
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+            self._ids.pop()
+
+    def search(self, query_vectors: np.ndarray, k: int) -> list:
+        """批次查詢，每個查詢向量回傳前 k 名 [(card_id, 相似度), ...]"""
+        queries = normalize_rows(
+            np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        with self._lock:
+            count = len(self._ids)
+            if count == 0 or k <= 0:
+                return [[] for _ in range(len(queries))]
+            scores = self._matrix[:count] @ queries.T  # (名片數, 查詢數)
+            ids = list(self._ids)
+        k = min(k, count)
+        results = []
+        for column in scores.T:
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.argsort(-column[top], kind="stable")]
+            results.append([(ids[row], float(column[row])) for row in top])
+        return results
+
+    def stale_cards(self, cards: dict) -> tuple:
+        """與名片資料比對：移除已刪除的名片，回傳 (移除數量, 待產生向量的名片)
+
+        待產生向量的名片為新增或內容變動者，格式為 {card_id: 名片資料}。
+        """
+        with self._lock:
+            removed = [c for c in self._ids if c not in cards]
+            for card_id in removed:
+                self.remove(card_id)
+            stale = {
+                card_id: card for card_id, card in cards.items()
+                if self._digests.get(card_id)
+                != text_digest(card_text(card))
+            }
+        return len(removed), stale
+
+    def save(self, path: str) -> None:
+        """寫入 .npz 檔（先寫暫存檔再替換，避免留下寫到一半的檔案）"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            count = len(self._ids)
+            payload = {
+                "matrix": self._matrix[:count].copy(),
+                "ids": np.array(self._ids, dtype=str),
+                "digests": np.array(
+                    [self._digests.get(c, "") for c in self._ids], dtype=str),
+                "model": np.array(self.model),
+            }
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str, dimension: int, model: str = ""):
+        """讀取 save() 寫入的檔案；檔案不存在或模型、維度不符時回傳 None"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            matrix = data["matrix"]
+            if str(data["model"]) != model or (
+                    len(matrix) and matrix.shape[1] != dimension):
+                return None
+            index = cls(dimension, model)
+            index.put_many(list(data["ids"]), matrix.reshape(-1, dimension),
+                           list(data["digests"]))
+        return index
+
+
+_indexes = OrderedDict()  # u_id -> (VectorIndex, 同步時間)，依最近使用排序
+_registry_lock = threading.Lock()
+_pending = {}     # u_id -> {card_id: 名片資料}，等待背景產生向量
+_dirty = set()    # 有變動尚未保存的使用者
+_refreshing = {}  # u_id -> 背景更新的 asyncio.Task
+
+
+def index_path(u_id: str) -> str:
+    safe_id = re.sub(r"[^\w-]", "_", u_id)
+    return os.path.join(config.EMBEDDING_DIR, f"{safe_id}.npz")
+
+
+def _save(u_id: str, index: VectorIndex) -> None:
+    try:
+        index.save(index_path(u_id))
+    except OSError as e:
+        print(f"Error saving vector index: {e}")
+
+
+async def _embed(u_id: str, texts: list, priority: str,
+                 query: bool = False):
+    """產生 embedding；Vertex AI 的呼叫經過 vertex_scheduler 與熔斷器
+
+    embedding 不計入 Gemini 的 token 配額，只佔用每分鐘請求數。
+    """
+    embedder = get_embedder()
+    if not embedder.remote:
+        return embedder.embed(texts, query=query)
+    ticket = await deadline.wait_for(
+        vertex_scheduler.scheduler.acquire(priority, u_id))
+    try:
+        with circuit_breaker.vertex.guard(
+                ignore=(deadline.DeadlineExceeded,)):
+            return await deadline.wait_for(asyncio.to_thread(
+                embedder.embed, texts, query=query))
+    finally:
+        vertex_scheduler.scheduler.settle(ticket, 0)
+
+
+def _next_batch(u_id: str) -> dict:
+    with _registry_lock:
+        pending = _pending.get(u_id) or {}
+        return dict(itertools.islice(
+            pending.items(), config.EMBEDDING_BATCH_SIZE))
+
+
+async def _refresh(u_id: str) -> None:
+    """在背景為待更新的名片產生向量，每批完成後保存一次
+
+    失敗（例如熔斷中）時保留待更新的名片，下次寫入或查詢時再重試；
+    這段期間搜尋沿用舊的向量。
+    """
+    try:
+        while True:
+            batch = _next_batch(u_id)
+            if not batch:
+                break
+            index = _open_index(u_id)
+            try:
+                vectors = await _embed(
+                    u_id, [card_text(card) for card in batch.values()],
+                    vertex_scheduler.BACKGROUND)
+            except Exception as e:
+                print(f"Error embedding namecards: {e}")
+                break
+            card_ids = list(batch)
+            with _registry_lock:
+                pending = _pending.get(u_id, {})
+                # 產生向量期間又被修改或刪除的名片以新的資料為準
+                rows = [i for i, card_id in enumerate(card_ids)
+                        if pending.get(card_id) is batch[card_id]]
+                for i in rows:
+                    del pending[card_ids[i]]
+            index.put_many(
+                [card_ids[i] for i in rows], vectors[rows],
+                [text_digest(card_text(batch[card_ids[i]])) for i in rows])
+            _save(u_id, index)
+            _dirty.discard(u_id)
+        index = _loaded_index(u_id)
+        if u_id in _dirty and index is not None:
+            _dirty.discard(u_id)
+            _save(u_id, index)
+    finally:
+        if _refreshing.get(u_id) is asyncio.current_task():
+            del _refreshing[u_id]
+
+
+def _schedule(u_id: str) -> None:
+    """在背景開始更新；不在 event loop 中時等下次查詢再處理"""
+    if u_id in _refreshing:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    with deadline.unbounded():
+        _refreshing[u_id] = loop.create_task(_refresh(u_id))
+
+
+def _load_saved(u_id: str) -> VectorIndex:
+    """讀取保存的矩陣；不存在或無法使用時回傳空的索引"""
+    embedder = get_embedder()
+    index = None
+    try:
+        index = VectorIndex.load(
+            index_path(u_id), embedder.dimension, embedder.name)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error loading vector index: {e}")
+    if index is None:
+        index = VectorIndex(embedder.dimension, embedder.name)
+    return index
+
+
+def _register(u_id: str, index: VectorIndex, synced_at: float) -> None:
+    """登記已載入的索引，超過 VECTOR_INDEX_MAX_USERS 時淘汰最久未使用者
+
+    呼叫端須持有 _registry_lock。
+    """
+    _indexes[u_id] = (index, synced_at)
+    _indexes.move_to_end(u_id)
+    while len(_indexes) > config.VECTOR_INDEX_MAX_USERS:
+        evicted, _ = _indexes.popitem(last=False)
+        _pending.pop(evicted, None)
+        _dirty.discard(evicted)
+
+
+def _open_index(u_id: str) -> VectorIndex:
+    """取得已載入的索引；尚未載入時讀取保存的矩陣（不與名片資料比對）
+
+    以同步時間 0 登記，下次查詢時 get_index 仍會與名片資料完整比對。
+    """
+    index = _loaded_index(u_id)
+    if index is not None:
+        return index
+    index = _load_saved(u_id)
+    with _registry_lock:
+        entry = _indexes.get(u_id)
+        if entry is not None:
+            return entry[0]
+        _register(u_id, index, 0)
+    return index
+
+
+def get_index(u_id: str, load_cards) -> VectorIndex:
+    """取得使用者的向量索引
+
+    尚未載入時先讀取保存的矩陣；未載入或超過 CARD_INDEX_TTL_SECONDS 時
+    以 load_cards(u_id) 比對，新增或內容變動的名片在背景產生向量，
+    不阻塞目前的請求。
+    """
+    now = time.time()
+    with _registry_lock:
+        entry = _indexes.get(u_id)
+        if (entry is not None
+                and now - entry[1] < config.CARD_INDEX_TTL_SECONDS):
+            _indexes.move_to_end(u_id)
+            return entry[0]
+    index = entry[0] if entry is not None else _load_saved(u_id)
+    removed, stale = index.stale_cards(load_cards(u_id))
+    with _registry_lock:
+        _register(u_id, index, now)
+        _pending[u_id] = stale
+        if removed:
+            _dirty.add(u_id)
+    if stale or removed:
+        _schedule(u_id)
+    return index
+
+
+async def search(u_id: str, queries: list, load_cards, k: int = 5) -> list:
+    """以描述文字批次查詢，每個查詢回傳前 k 名 [(card_id, 相似度), ...]
+
+    第一次建立索引時在請求的時間預算內等待背景產生向量；之後尚未
+    產生向量的名片要等背景更新完成才搜尋得到。
+    """
+    index = get_index(u_id, load_cards)
+    with _registry_lock:
+        has_pending = bool(_pending.get(u_id))
+    if has_pending:
+        _schedule(u_id)  # 先前失敗的背景更新在查詢時重試
+    refresh = _refreshing.get(u_id)
+    if refresh is not None and not len(index):
+        await asyncio.wait({refresh}, timeout=deadline.timeout())
+    vectors = await _embed(
+        u_id, list(queries), vertex_scheduler.INTERACTIVE, query=True)
+    return index.search(vectors, k)
+
+
+async def wait_refreshed() -> None:
+    """等待所有背景更新完成（測試與效能量測用）"""
+    while _refreshing:
+        await asyncio.gather(*_refreshing.values())
+
+
+def _loaded_index(u_id: str) -> VectorIndex:
+    with _registry_lock:
+        entry = _indexes.get(u_id)
+    return entry[0] if entry is not None else None
+
+
+def card_written(u_id: str, card_id: str, card_data: dict) -> None:
+    """名片新增／覆寫（card_data 為 None 表示刪除）後更新索引
+
+    新增或內容變動的名片在背景產生向量，批次保存；索引尚未載入時也會
+    排入，背景更新時再讀取保存的矩陣。刪除立即從已載入的索引移除，
+    未載入的使用者在下次查詢同步時移除。
+    """
+    index = _loaded_index(u_id)
+    with _registry_lock:
+        pending = _pending.setdefault(u_id, {})
+        if card_data is None:
+            pending.pop(card_id, None)
+            if index is None:
+                return
+            index.remove(card_id)
+            _dirty.add(u_id)
+        elif (index is not None and index.digest(card_id)
+              == text_digest(card_text(card_data))):
+            pending.pop(card_id, None)
+            return
+        else:
+            pending[card_id] = dict(card_data)
+    _schedule(u_id)
+
+
+def card_updated(u_id: str, card_id: str, values: dict, load_card) -> None:
+    """名片部分欄位更新後更新索引；load_card() 回傳更新後的名片"""
+    if not any(field in values for field in EMBEDDED_FIELDS):
+        return
+    card_data = load_card()
+    if card_data is not None:
+        card_written(u_id, card_id, card_data)
+
+
+def clear() -> None:
+    with _registry_lock:
+        for task in _refreshing.values():
+            task.cancel()
+        _refreshing.clear()
+        _indexes.clear()
+        _pending.clear()
+        _dirty.clear()
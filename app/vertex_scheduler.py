@@ -0,0 +1,212 @@
+"""Vertex AI（Gemini）呼叫的優先權排程與配額控管
+
+名片辨識、Agent 的每個模型回合與熔斷後的延後辨識共用同一份 Vertex AI
+配額；大量匯入名片時，辨識呼叫會把配額用完，讓互動中的對話一起變慢
+或被限流。所有 Gemini 呼叫在送出前先向 scheduler 取得許可：
+
+- 優先權：interactive（Agent 對話）> ocr（使用者剛傳的名片）>
+  background（延後辨識等背景工作）。只要有較高優先權的呼叫在等待，
+  較低優先權的呼叫就不會放行
+- 公平性：同一優先權中依使用者輪流放行，單一使用者大量匯入名片時
+  不會讓其他使用者一直排在後面
+- 配額：以兩個 token bucket 對應 Vertex AI 的每分鐘請求數
+  （VERTEX_QPM）與每分鐘 token 數（VERTEX_TPM）。送出前依該優先權
+  最近的平均用量預扣 token，完成後以實際用量（usage_metadata）校正
+
+各優先權放行的次數、排隊等待時間與目前排隊數可在健康檢查端點 `GET /`
+的 `scheduler` 欄位查看。
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+from . import config
+
+INTERACTIVE = "interactive"
+OCR = "ocr"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, OCR, BACKGROUND)  # 由高到低
+
+# 平均用量以指數移動平均更新的權重
+TOKEN_ESTIMATE_WEIGHT = 0.2
+
+
+class TokenBucket:
+    """每分鐘補滿 per_minute 的 token bucket；level 可暫時為負（實際用量
+    超過預扣時），之後的呼叫等待補回"""
+
+    def __init__(self, per_minute: float, now: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self._updated = now
+
+    def _refill(self, now: float) -> None:
+        self.level = min(
+            self.capacity,
+            self.level + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.level
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """還要等幾秒才足夠取出 amount"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0) * 60 / self.capacity
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level = min(self.level - amount, self.capacity)
+
+
+class Ticket:
+    """一次放行的 Gemini 呼叫；完成後以 settle() 回報實際 token 用量"""
+
+    def __init__(self, priority: str, user_id: str, tokens: float,
+                 queued_at: float):
+        self.priority = priority
+        self.user_id = user_id
+        self.tokens = tokens  # 預扣的 token 數
+        self.queued_at = queued_at
+        self.wait = 0.0
+        self.settled = False
+
+
+class VertexScheduler:
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.reset()
+
+    def reset(self) -> None:
+        """依目前的設定重建 bucket 並清除統計（不影響排隊中的呼叫）"""
+        now = self._clock()
+        self._requests = TokenBucket(config.VERTEX_QPM, now)
+        self._tokens = TokenBucket(config.VERTEX_TPM, now)
+        # 優先權 -> {user_id: deque[(Ticket, Future)]}，依輪流順序排列
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._timer = None
+        self._estimates = {
+            priority: float(config.VERTEX_TOKEN_ESTIMATE)
+            for priority in PRIORITIES
+        }
+        self._stats = {
+            priority: {"granted": 0, "wait_seconds": 0.0, "max_wait": 0.0}
+            for priority in PRIORITIES
+        }
+
+    def _head(self):
+        """下一個應該放行的呼叫：最高優先權中輪到的使用者"""
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            if queue:
+                return priority, next(iter(queue))
+        return None
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        return max(self._requests.wait_time(1, now),
+                   self._tokens.wait_time(tokens, now))
+
+    def _grant(self, ticket: Ticket, now: float) -> None:
+        self._requests.take(1, now)
+        self._tokens.take(ticket.tokens, now)
+        ticket.wait = now - ticket.queued_at
+        stats = self._stats[ticket.priority]
+        stats["granted"] += 1
+        stats["wait_seconds"] += ticket.wait
+        stats["max_wait"] = max(stats["max_wait"], ticket.wait)
+
+    def _dispatch(self) -> None:
+        """依優先權與輪流順序放行配額足夠的呼叫，不足時設定計時器"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while True:
+            head = self._head()
+            if head is None:
+                return
+            priority, user_id = head
+            queue = self._queues[priority]
+            waiters = queue[user_id]
+            ticket, future = waiters[0]
+            if future.done():  # 已取消
+                waiters.popleft()
+            else:
+                now = self._clock()
+                wait = self._wait_time(ticket.tokens, now)
+                if wait > 0:
+                    self._timer = future.get_loop().call_later(
+                        wait, self._dispatch)
+                    return
+                waiters.popleft()
+                self._grant(ticket, now)
+                future.set_result(ticket)
+            if waiters:
+                queue.move_to_end(user_id)
+            else:
+                del queue[user_id]
+
+    async def acquire(self, priority: str, user_id: str) -> Ticket:
+        """等待配額並依優先權與使用者輪流放行，回傳 Ticket"""
+        now = self._clock()
+        ticket = Ticket(priority, user_id,
+                        min(self._estimates[priority], self._tokens.capacity),
+                        now)
+        if self._head() is None and self._wait_time(ticket.tokens, now) <= 0:
+            self._grant(ticket, now)
+            return ticket
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user_id, deque()).append(
+            (ticket, future))
+        self._dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # 放行後才取消時退回預扣的配額
+            if future.done() and not future.cancelled():
+                self.settle(ticket, 0)
+            raise
+
+    def settle(self, ticket: Ticket, tokens: int) -> None:
+        """以實際 token 用量校正預扣的配額，並更新該優先權的平均用量
+
+        tokens 為 0 表示呼叫沒有送出（例如熔斷或超過回合預算），退回預扣
+        的 token，不影響平均用量。
+        """
+        if ticket.settled:
+            return
+        ticket.settled = True
+        self._tokens.take(tokens - ticket.tokens, self._clock())
+        if tokens:
+            estimate = self._estimates[ticket.priority]
+            self._estimates[ticket.priority] = (
+                estimate + (tokens - estimate) * TOKEN_ESTIMATE_WEIGHT)
+
+    def summary(self) -> dict:
+        now = self._clock()
+        classes = {}
+        for priority in PRIORITIES:
+            stats = self._stats[priority]
+            granted = stats["granted"]
+            classes[priority] = {
+                "granted": granted,
+                "queued": sum(
+                    len(waiters)
+                    for waiters in self._queues[priority].values()),
+                "avg_wait_ms": (stats["wait_seconds"] * 1000 / granted
+                                if granted else 0.0),
+                "max_wait_ms": stats["max_wait"] * 1000,
+                "token_estimate": round(self._estimates[priority]),
+            }
+        return {
+            "qpm": config.VERTEX_QPM,
+            "tpm": config.VERTEX_TPM,
+            "requests_available": round(self._requests.available(now), 1),
+            "tokens_available": round(self._tokens.available(now)),
+            "classes": classes,
+        }
+
+
+scheduler = VertexScheduler()
@@ -0,0 +1,91 @@
+"""量測每則文字訊息在執行 Agent 前的建置成本
+
+- 原本：每則訊息以閉包重新建立工具，再建立 Agent、Runner 與
+  InMemorySessionService
+- 現在：行程共用 agent_runtime.get_runner()，每則訊息只建立一個 session
+  並在結束後刪除
+
+不呼叫模型，只量測 run_debug 之前（與之後清理）的本地成本。
+
+用法：python -m benchmarks.bench_agent_setup [訊息數量]
+"""
+import asyncio
+import functools
+import os
+import sys
+import time
+import uuid
+
+os.environ.setdefault("ChannelSecret", "bench")
+os.environ.setdefault("ChannelAccessToken", "bench")
+os.environ.setdefault("PROJECT_ID", "bench")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from google.adk import Agent, Runner  # noqa: E402
+from google.adk.sessions.in_memory_session_service import (  # noqa: E402
+    InMemorySessionService
+)
+from google.genai.types import GenerateContentConfig  # noqa: E402
+
+from app import agent_runtime, model_router  # noqa: E402
+
+
+def legacy_setup(user_id: str) -> Runner:
+    """原本 handle_smart_query 在每則訊息開頭做的事"""
+    tools = [
+        functools.wraps(tool)(lambda *a, _tool=tool, **k: _tool(*a, **k))
+        for tool in agent_runtime.TOOLS
+    ]
+    agent = Agent(
+        name="namecard_agent",
+        model=model_router.model_for(model_router.STANDARD),
+        instruction=agent_runtime.AGENT_INSTRUCTION,
+        tools=tools,
+        generate_content_config=GenerateContentConfig(
+            labels={"client_id": "namecard"}
+        ),
+    )
+    return Runner(
+        app_name=agent_runtime.APP_NAME,
+        agent=agent,
+        session_service=InMemorySessionService()
+    )
+
+
+async def shared_setup(user_id: str) -> None:
+    """現在每則訊息的建置與清理：取得共用 Runner，建立並刪除 session"""
+    runner = agent_runtime.get_runner()
+    session_id = f"{user_id}-{uuid.uuid4().hex}"
+    service = runner.session_service
+    await service.create_session(
+        app_name=agent_runtime.APP_NAME, user_id=user_id,
+        session_id=session_id)
+    await service.delete_session(
+        app_name=agent_runtime.APP_NAME, user_id=user_id,
+        session_id=session_id)
+
+
+async def main(count: int) -> None:
+    start = time.perf_counter()
+    for i in range(count):
+        legacy_setup(f"user-{i}")
+    legacy = (time.perf_counter() - start) / count
+
+    start = time.perf_counter()
+    agent_runtime.get_runner()
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(count):
+        await shared_setup(f"user-{i}")
+    shared = (time.perf_counter() - start) / count
+
+    print(f"messages: {count}")
+    print(f"per-message agent/runner setup : {legacy * 1000:8.3f} ms")
+    print(f"shared runner + session        : {shared * 1000:8.3f} ms "
+          f"(one-time runner creation {first * 1000:.1f} ms)")
+    print(f"saved per message              : "
+          f"{(legacy - shared) * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,79 @@
+"""比較 Agent 查詢名片時，工具回傳內容佔用的 prompt token 數
+
+- 原本：get_all_namecards 回傳整本通訊錄（所有欄位加上 created_at）
+- 現在：search_namecards 回傳前 10 筆摘要，再以 get_namecard_by_id 取
+  一張名片的完整欄位
+
+ADK 會把工具回傳值以 JSON 放進後續每一輪的對話內容，因此一次典型的查詢
+（搜尋 -> display_namecard -> 回覆）中，工具回傳內容會再被送出兩次。
+
+token 數以 tiktoken 的 cl100k_base 估算（作為 Gemini tokenizer 的近似）；
+無法載入編碼檔時，改以「每個中日韓文字 1 個、其他每 4 個字元 1 個」估算。
+
+用法：python -m benchmarks.bench_agent_tokens [名片數量]
+"""
+import json
+import os
+import re
+import sys
+
+os.environ.setdefault("ChannelSecret", "bench")
+os.environ.setdefault("ChannelAccessToken", "bench")
+os.environ.setdefault("PROJECT_ID", "bench")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from app import agent_runtime, card_index, storage_backend  # noqa: E402
+from app.storage_backend import MemoryBackend  # noqa: E402
+from benchmarks.bench_card_index import make_index_cards  # noqa: E402
+
+# 搜尋結果出現在之後幾輪模型呼叫的內容中
+FOLLOWUP_TURNS = 2
+_CJK_RE = re.compile("[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+
+
+def token_counter():
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return "tiktoken cl100k_base", lambda text: len(encoding.encode(text))
+    except Exception:
+        def estimate(text):
+            cjk = len(_CJK_RE.findall(text))
+            return cjk + (len(text) - cjk + 3) // 4
+        return "estimate", estimate
+
+
+def legacy_get_all_namecards(cards: dict) -> list:
+    """原本 get_all_namecards 工具的回傳內容"""
+    return [{**card, "card_id": card_id} for card_id, card in cards.items()]
+
+
+def main(count: int) -> None:
+    cards = make_index_cards(count)
+    backend = MemoryBackend()
+    backend.set("namecard/bench-user", cards)
+    storage_backend.set_backend(backend)
+    card_index.clear()
+
+    query = cards["card-123"]["name"].split()[0]
+    with agent_runtime.agent_request("bench-user"):
+        summaries = agent_runtime.search_namecards(query)
+        detail = agent_runtime.get_namecard_by_id(summaries[0]["card_id"])
+
+    method, count_tokens = token_counter()
+
+    def payload_tokens(value) -> int:
+        return count_tokens(json.dumps(value, ensure_ascii=False))
+
+    before = payload_tokens(legacy_get_all_namecards(cards))
+    after = payload_tokens(summaries) + payload_tokens(detail)
+    print(f"cards: {count}, query {query!r}, token counting: {method}")
+    print(f"get_all_namecards          : {before:9d} tokens per call, "
+          f"{before * (1 + FOLLOWUP_TURNS):9d} per lookup")
+    print(f"search_namecards + by_id   : {after:9d} tokens per call, "
+          f"{after * (1 + FOLLOWUP_TURNS):9d} per lookup")
+    print(f"reduction                  : {before / max(after, 1):9.0f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000)
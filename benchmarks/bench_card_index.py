@@ -0,0 +1,119 @@
+"""比較備援搜尋在 50k 張名片下的查詢成本
+
+- 線性掃描：逐張比對 name / company 子字串（原本的作法）
+- 倒排索引：CardIndex.search（涵蓋所有欄位並依相關度排序）
+- 容錯比對：CardIndex.fuzzy_search（姓名、公司、職稱打錯字時）
+- 電話反查：CardIndex.phone_search（完整號碼或末幾碼，不限格式），
+  對照逐張正規化號碼後比對
+
+用法：python -m benchmarks.bench_card_index [名片數量]
+"""
+import os
+import random
+import re
+import sys
+import time
+import timeit
+
+os.environ.setdefault("ChannelSecret", "bench")
+os.environ.setdefault("ChannelAccessToken", "bench")
+os.environ.setdefault("PROJECT_ID", "bench")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from app.card_index import CardIndex  # noqa: E402
+from benchmarks.bench_statistics import make_cards  # noqa: E402
+
+SURNAMES = "王李張劉陳楊黃趙吳周徐孫馬朱胡郭何高林羅"
+GIVEN = "大小明華美志宏偉文傑俊雅婷怡君佳玲"
+TITLES = ["工程師", "產品經理", "業務協理", "財務長", "設計師", "執行長"]
+
+
+def make_index_cards(count: int) -> dict:
+    rng = random.Random(7)
+    cards = make_cards(count)
+    for i, card in enumerate(cards.values()):
+        card["name"] = (rng.choice(SURNAMES) + rng.choice(GIVEN)
+                        + rng.choice(GIVEN) + f" User{i}")
+        card["title"] = rng.choice(TITLES)
+        card["memo"] = f"{rng.choice(['東京', '台北', '新加坡'])}展認識"
+        card["phone"] = (f"#886-09{rng.randrange(100):02d}-"
+                         f"{rng.randrange(1000):03d}-"
+                         f"{rng.randrange(1000):03d}")
+    return cards
+
+
+def linear_scan(cards: dict, query: str) -> list:
+    query_lower = query.lower()
+    return [
+        card_id for card_id, card in cards.items()
+        if query_lower in card.get("name", "").lower()
+        or query_lower in card.get("company", "").lower()
+    ]
+
+
+def linear_phone_scan(cards: dict, query: str) -> list:
+    digits = re.sub(r"\D", "", query).lstrip("0")
+    return [
+        card_id for card_id, card in cards.items()
+        if re.sub(r"\D", "", card.get("phone", "")).endswith(digits)
+    ]
+
+
+def main(count: int) -> None:
+    cards = make_index_cards(count)
+    start = time.perf_counter()
+    index = CardIndex(cards)
+    build = time.perf_counter() - start
+
+    sample = cards["card-123"]
+    queries = [
+        ("exact name", sample["name"].split()[0]),
+        ("latin prefix", "user1234"),
+        ("company", "公司42"),
+        ("name + title", f"{sample['name'].split()[0]} {sample['title']}"),
+    ]
+    print(f"cards: {count}, index build {build * 1000:.0f} ms")
+    runs = 50
+    for label, query in queries:
+        scan = timeit.timeit(
+            lambda: linear_scan(cards, query), number=5) / 5
+        lookup = timeit.timeit(
+            lambda: index.search(query, limit=8), number=runs) / runs
+        hits = len(index.search(query))
+        print(f"{label:13s} {query!r:22s} hits {hits:6d}  "
+              f"scan {scan * 1000:7.2f} ms  index {lookup * 1000:7.3f} ms")
+
+    name = sample["name"].split()[0]
+    fuzzy_queries = [
+        ("cjk typo", name[0] + "某" + name[2]),
+        ("latin typo", "usre1234"),
+        ("title typo", "產品經里"),
+    ]
+    for label, query in fuzzy_queries:
+        lookup = timeit.timeit(
+            lambda: index.fuzzy_search(query, limit=8), number=runs) / runs
+        hits = len(index.fuzzy_search(query))
+        print(f"{label:13s} {query!r:22s} hits {hits:6d}  "
+              f"fuzzy {lookup * 1000:7.3f} ms")
+
+    phone = sample["phone"]
+    phone_queries = [
+        ("full phone", "+886 " + phone[6:].replace("-", " ")),
+        ("last digits", phone[-7:]),
+    ]
+    for label, query in phone_queries:
+        scan = timeit.timeit(
+            lambda: linear_phone_scan(cards, query), number=5) / 5
+        lookup = timeit.timeit(
+            lambda: index.phone_search(query, limit=8), number=runs) / runs
+        hits = len(index.phone_search(query))
+        print(f"{label:13s} {query!r:22s} hits {hits:6d}  "
+              f"scan {scan * 1000:7.2f} ms  trie  {lookup * 1000:7.3f} ms")
+
+    start = time.perf_counter()
+    index.update("card-123", {"title": "技術長"})
+    print(f"incremental update: {(time.perf_counter() - start) * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,49 @@
+"""比較行程內快取 100k 張名片時，dict 與 CardRecord 的記憶體用量
+
+兩者都從同一份 RTDB JSON 內容解析而來（與 get_all_cards 下載後的狀態相同），
+以 tracemalloc 量測快取建立完成、暫存物件釋放後仍佔用的記憶體。
+
+用法：python -m benchmarks.bench_card_memory [名片數量]
+"""
+import gc
+import json
+import sys
+import timeit
+import tracemalloc
+
+from app.card_record import CardStore
+from benchmarks.bench_statistics import make_cards
+
+
+def measure(build) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    cache = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cache, current
+
+
+def main(count: int) -> None:
+    payload = json.dumps(make_cards(count), ensure_ascii=False)
+
+    dict_cache, dict_bytes = measure(lambda: json.loads(payload))
+    store, store_bytes = measure(lambda: CardStore(json.loads(payload)))
+    assert store.to_dicts() == dict_cache
+
+    runs = 5
+    convert = timeit.timeit(
+        lambda: [record.to_dict() for record in store],
+        number=runs) / runs
+
+    print(f"cards: {count}")
+    print(f"dict cache : {dict_bytes / 2**20:8.1f} MiB, "
+          f"{dict_bytes / count:6.0f} B/card")
+    print(f"CardStore  : {store_bytes / 2**20:8.1f} MiB, "
+          f"{store_bytes / count:6.0f} B/card")
+    print(f"to_dict    : {convert / count * 1e6:8.2f} us/card")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
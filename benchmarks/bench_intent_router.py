@@ -0,0 +1,78 @@
+"""量測規則式意圖判斷在一組典型訊息上的本地回覆比例與延遲
+
+每則訊息依 handle_local_lookup 的流程：先 intent_router.route()，判定為
+查詢時再以本地索引做嚴格搜尋；有結果即視為本地回覆，否則交給 Agent。
+本地回覆省下的時間即為一次 Agent 執行（runner.run_debug）的延遲，
+正式環境的實際數字可由健康檢查端點的 router 統計取得。
+
+用法：python -m benchmarks.bench_intent_router [名片數量]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("ChannelSecret", "bench")
+os.environ.setdefault("ChannelAccessToken", "bench")
+os.environ.setdefault("PROJECT_ID", "bench")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from app import card_index, firebase_utils, storage_backend  # noqa: E402
+from app.intent_router import LOOKUP, route  # noqa: E402
+from app.storage_backend import MemoryBackend  # noqa: E402
+from benchmarks.bench_card_index import make_index_cards  # noqa: E402
+
+
+def make_messages(cards: dict, count: int) -> list:
+    rng = random.Random(3)
+    samples = rng.sample(list(cards.values()), count)
+    templates = [
+        "{name}", "{name}", "幫我查一下{name}", "{name}的電話", "{company}",
+        "找 {company} {title}", "{name}的名片",
+        "把{name}的電話改成 0912-345-678", "幫{name}加上備忘錄：下週開會",
+        "{company}有誰？", "最近新增了哪些名片", "上個月在東京認識的人",
+        "陳不存在",
+    ]
+    messages = []
+    for card in samples:
+        template = rng.choice(templates)
+        messages.append(template.format(
+            name=card["name"].split()[0], company=card["company"],
+            title=card["title"]))
+    return messages
+
+
+def main(count: int) -> None:
+    cards = make_index_cards(count)
+    backend = MemoryBackend()
+    backend.set("namecard/bench-user", cards)
+    storage_backend.set_backend(backend)
+    card_index.clear()
+    firebase_utils.search_cards("bench-user", "預熱")  # 建立索引
+
+    messages = make_messages(cards, 1000)
+    local_ms = []
+    escalated = 0
+    for msg in messages:
+        start = time.perf_counter()
+        intent = route(msg)
+        served = (intent.kind == LOOKUP and firebase_utils.search_cards(
+            "bench-user", intent.query, strict=True))
+        elapsed = (time.perf_counter() - start) * 1000
+        if served:
+            local_ms.append(elapsed)
+        else:
+            escalated += 1
+
+    local_ms.sort()
+    print(f"cards: {count}, messages: {len(messages)}")
+    print(f"served locally : {len(local_ms) / len(messages):6.1%}")
+    print(f"to agent       : {escalated / len(messages):6.1%}")
+    print(f"local latency  : p50 {statistics.median(local_ms):.2f} ms, "
+          f"p95 {local_ms[int(len(local_ms) * 0.95)]:.2f} ms")
+    print("each locally served message skips one full agent run")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000)
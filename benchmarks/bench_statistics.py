@@ -0,0 +1,75 @@
+"""比較「📊 統計」兩種計算方式在 10k 張名片下的成本
+
+- 完整重算：下載所有名片後逐張解析 created_at、累計公司（原本的作法）
+- 增量彙總：只讀取統計彙總的總數、當月計數與 top_company 並格式化
+
+用法：python -m benchmarks.bench_statistics [名片數量]
+"""
+import json
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from app import stats_utils
+
+COMPANIES = [f"公司{i}" for i in range(500)] + ["LINE Taiwan", "N/A"]
+
+
+def make_cards(count: int) -> dict:
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    return {
+        f"card-{i}": {
+            "name": f"聯絡人{i}",
+            "title": "工程師",
+            "company": rng.choice(COMPANIES),
+            "address": "台北市信義區",
+            "phone": "#886-02-1234-5678",
+            "email": f"user{i}@example.com",
+            "created_at": (
+                start + timedelta(minutes=rng.randrange(1_000_000))
+            ).isoformat(),
+        }
+        for i in range(count)
+    }
+
+
+def main(count: int) -> None:
+    cards = make_cards(count)
+    stats = stats_utils.compute_statistics(cards)
+    month = datetime.now().strftime("%Y-%m")
+    summary = {
+        "total": stats["total"],
+        "months": {month: stats["months"].get(month, 0)},
+        "top_company": stats.get("top_company"),
+    }
+    assert (stats_utils.summarize_statistics(summary)
+            == stats_utils.summarize_statistics(
+                stats_utils.compute_statistics(cards)))
+
+    runs = 20
+    full = timeit.timeit(
+        lambda: stats_utils.summarize_statistics(
+            stats_utils.compute_statistics(cards)),
+        number=runs) / runs
+    aggregate = timeit.timeit(
+        lambda: stats_utils.summarize_statistics(summary),
+        number=runs) / runs
+    delta = stats_utils.stats_delta(None, cards["card-0"])
+    increment = timeit.timeit(
+        lambda: stats_utils.apply_stats_delta(stats, delta),
+        number=runs) / runs
+
+    full_bytes = len(json.dumps(cards, ensure_ascii=False).encode())
+    stats_bytes = len(json.dumps(summary, ensure_ascii=False).encode())
+    print(f"cards: {count}")
+    print(f"full recompute : {full * 1000:8.2f} ms, "
+          f"read payload {full_bytes / 1024:8.1f} KiB")
+    print(f"aggregate read : {aggregate * 1000:8.2f} ms, "
+          f"read payload {stats_bytes / 1024:8.1f} KiB")
+    print(f"apply delta    : {increment * 1000:8.2f} ms per write")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,66 @@
+"""在 memory / sqlite 後端上量測 firebase_utils 各操作的資料層成本
+
+不需要 Firebase 專案即可執行，用來比較各查詢路徑隨名片數量的成本變化。
+
+用法：python -m benchmarks.bench_storage_backends [名片數量]
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("ChannelSecret", "bench")
+os.environ.setdefault("ChannelAccessToken", "bench")
+os.environ.setdefault("PROJECT_ID", "bench")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from app import firebase_utils, storage_backend  # noqa: E402
+from app.storage_backend import MemoryBackend, SqliteBackend  # noqa: E402
+
+
+def timed(label: str, fn, repeat: int = 1) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<28}{elapsed * 1000:10.2f} ms")
+
+
+def run(backend, count: int) -> None:
+    storage_backend.set_backend(backend)
+    u_id = "bench-user"
+    card_ids = []
+
+    def add_cards():
+        for i in range(count):
+            card_ids.append(firebase_utils.add_namecard({
+                "name": f"聯絡人{i}", "title": "工程師",
+                "company": f"公司{i % 200}", "address": "台北市",
+                "phone": "#886-02-1234-5678",
+                "email": f"user{i}@example.com"}, u_id))
+
+    timed(f"add_namecard x{count}", add_cards)
+    timed("get_all_cards", lambda: firebase_utils.get_all_cards(u_id), 5)
+    timed("count_cards (shallow)",
+          lambda: firebase_utils.count_cards(u_id), 5)
+    timed("get_namecard_statistics",
+          lambda: firebase_utils.get_namecard_statistics(u_id), 5)
+    timed("get_card_summary_page",
+          lambda: firebase_utils.get_card_summary_page(u_id, limit=8), 5)
+    timed("get_cards_by_ids x20",
+          lambda: firebase_utils.get_cards_by_ids(u_id, card_ids[:20]), 5)
+    timed("update_namecard_field",
+          lambda: firebase_utils.update_namecard_field(
+              u_id, card_ids[0], "company", "LINE"), 5)
+
+
+def main(count: int) -> None:
+    print(f"memory backend ({count} cards)")
+    run(MemoryBackend(), count)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"sqlite backend ({count} cards)")
+        run(SqliteBackend(os.path.join(tmp, "bench.db")), count)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000)
@@ -0,0 +1,73 @@
+"""量測名片向量索引的 cosine top-k 查詢與增量更新成本
+
+以 768 維隨機向量模擬 Vertex embedding（查詢成本只與矩陣大小有關），
+比較單一查詢與批次查詢每筆的延遲，以及保存／載入矩陣檔的時間。
+
+用法：python -m benchmarks.bench_vector_index [名片數量]
+"""
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+
+os.environ.setdefault("ChannelSecret", "bench")
+os.environ.setdefault("ChannelAccessToken", "bench")
+os.environ.setdefault("PROJECT_ID", "bench")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from app.vector_index import VectorIndex  # noqa: E402
+
+DIMENSION = 768
+
+
+def main(count: int) -> None:
+    rng = np.random.default_rng(11)
+    card_ids = [f"card-{i}" for i in range(count)]
+    vectors = rng.standard_normal((count, DIMENSION), dtype=np.float32)
+
+    start = time.perf_counter()
+    index = VectorIndex(DIMENSION)
+    index.put_many(card_ids, vectors)
+    build = time.perf_counter() - start
+    print(f"cards: {count}, dimension {DIMENSION}, "
+          f"matrix {count * DIMENSION * 4 / 2**20:.0f} MiB, "
+          f"build {build * 1000:.0f} ms")
+
+    queries = rng.standard_normal((32, DIMENSION), dtype=np.float32)
+    runs = 20
+    single = timeit.timeit(
+        lambda: index.search(queries[0], k=10), number=runs) / runs
+    batch = timeit.timeit(
+        lambda: index.search(queries, k=10), number=runs) / runs
+    print(f"top-10 single query : {single * 1000:7.2f} ms")
+    print(f"top-10 batch of 32  : {batch * 1000 / len(queries):7.2f} ms "
+          "per query")
+
+    start = time.perf_counter()
+    index.put("card-new", rng.standard_normal(DIMENSION))
+    print(f"add (grows matrix)  : "
+          f"{(time.perf_counter() - start) * 1000:7.2f} ms")
+    start = time.perf_counter()
+    index.put("card-123", rng.standard_normal(DIMENSION))
+    index.put("card-new-2", rng.standard_normal(DIMENSION))
+    index.remove("card-7")
+    print(f"update / add / del  : "
+          f"{(time.perf_counter() - start) * 1e6 / 3:7.0f} us each")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.npz")
+        start = time.perf_counter()
+        index.save(path)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        VectorIndex.load(path, DIMENSION)
+        loaded = time.perf_counter() - start
+    print(f"save / load         : {saved * 1000:7.0f} / "
+          f"{loaded * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
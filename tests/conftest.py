@@ -8,6 +8,96 @@ sys.path.insert(
 os.environ.setdefault("ChannelSecret", "test-channel-secret")
 os.environ.setdefault("ChannelAccessToken", "test-channel-access-token")
 os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("AGENT_SESSION_STORE", "memory")
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "0")
+os.environ.setdefault("CIRCUIT_MIN_CALLS", "1000")
 os.environ.setdefault(
     "FIREBASE_URL", "https://test-project.firebaseio.com/"
 )
+
+import pytest  # noqa: E402
+from google.adk.models.base_llm import BaseLlm  # noqa: E402
+from google.adk.models.llm_response import LlmResponse  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from app import (  # noqa: E402
+    agent_runtime, agent_sessions, card_index, config, line_handlers,
+    storage_backend, vector_index
+)
+from app.agent_sessions import MemorySessionStore  # noqa: E402
+from app.storage_backend import MemoryBackend  # noqa: E402
+
+CARD = {
+    "name": "王大明", "title": "工程師", "company": "測試公司",
+    "address": "台北市", "phone": "#886-02-1234-5678",
+    "email": "david@example.com",
+}
+
+
+class ScriptedLlm(BaseLlm):
+    """依序回傳預先寫好的工具呼叫 (名稱, 參數) 或文字回覆；用完後重複 repeat"""
+
+    model: str = "scripted"
+    script: list = []
+    repeat: str | tuple = "好的"
+
+    async def generate_content_async(self, llm_request, stream=False):
+        step = self.script.pop(0) if self.script else self.repeat
+        if isinstance(step, str):
+            part = types.Part(text=step)
+        else:
+            part = types.Part(function_call=types.FunctionCall(
+                id=f"call-{len(self.script)}", name=step[0], args=step[1]))
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[part]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=100, candidates_token_count=10))
+
+
+@pytest.fixture
+def card():
+    return dict(CARD)
+
+
+@pytest.fixture(autouse=True)
+def embedding_dir(tmp_path, monkeypatch):
+    """名片寫入會在背景產生向量，向量檔寫到測試的暫存目錄"""
+    monkeypatch.setattr(config, "EMBEDDING_DIR", str(tmp_path / "embeddings"))
+    yield
+    vector_index.clear()
+
+
+@pytest.fixture
+def backend():
+    """以空的 MemoryBackend 取代 Firebase；測試檔可覆寫此 fixture 放入名片"""
+    backend = MemoryBackend()
+    storage_backend.set_backend(backend)
+    card_index.clear()
+    yield backend
+    card_index.clear()
+    storage_backend.set_backend(None)
+    line_handlers.user_states.clear()
+
+
+@pytest.fixture
+def card_backend(backend):
+    """user-1 只有一張名片 CARD（card-1）"""
+    backend.set("namecard/user-1", {"card-1": dict(CARD)})
+    return backend
+
+
+@pytest.fixture
+def session_store():
+    store = MemorySessionStore()
+    agent_sessions.set_store(store)
+    yield store
+    agent_sessions.set_store(None)
+
+
+@pytest.fixture
+def scripted_llm(monkeypatch, session_store):
+    """讓 agent 改用 ScriptedLlm；測試設定 script 決定每一輪的回覆"""
+    runner = agent_runtime.create_runner()
+    runner.agent.model = ScriptedLlm()
+    monkeypatch.setattr(agent_runtime, "_runner", runner)
+    return runner.agent.model
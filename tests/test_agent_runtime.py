@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app import agent_runtime, line_handlers
+
+CARDS = {
+    "card-1": {"name": "王大明", "company": "LINE Taiwan", "title": "工程師"},
+}
+
+
+def text_event(text):
+    return SimpleNamespace(content=SimpleNamespace(
+        parts=[SimpleNamespace(text=text)]))
+
+
+class FakeRunner:
+    """模擬 Runner：執行期間呼叫工具，並記錄使用過的 session"""
+
+    def __init__(self):
+        self.session_service = AsyncMock()
+        self.session_ids = []
+
+    async def run_debug(self, msg, user_id, session_id):
+        self.session_ids.append(session_id)
+        await asyncio.sleep(0)
+        agent_runtime.display_namecard(f"{user_id}-card")
+        return [text_event(f"{user_id} 的結果 ")]
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    runner = FakeRunner()
+    monkeypatch.setattr(agent_runtime, "_runner", runner)
+    return runner
+
+
+def test_runner_is_created_once(monkeypatch):
+    monkeypatch.setattr(agent_runtime, "_runner", None)
+    create = MagicMock()
+    monkeypatch.setattr(agent_runtime, "create_runner", create)
+    assert agent_runtime.get_runner() is agent_runtime.get_runner()
+    create.assert_called_once()
+
+
+def test_tools_require_request_scope():
+    with pytest.raises(RuntimeError):
+        agent_runtime.display_namecard("card-1")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_scoped_per_user(runner):
+    async def handle(user_id):
+        with agent_runtime.agent_request(user_id) as request:
+            text = await agent_runtime.run_agent(user_id, "hi")
+        return text, request.found_card_ids
+
+    results = await asyncio.gather(handle("user-1"), handle("user-2"))
+    assert results == [("user-1 的結果", ["user-1-card"]),
+                       ("user-2 的結果", ["user-2-card"])]
+    # 每則訊息使用獨立的 session，結束後刪除
+    assert len(set(runner.session_ids)) == 2
+    assert runner.session_service.delete_session.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_smart_query_uses_shared_runner(runner, backend):
+    backend.set("namecard/user-1", CARDS)
+
+    async def run_debug(msg, user_id, session_id):
+        agent_runtime.display_namecard("card-1")
+        return [text_event("找到王大明的名片")]
+
+    runner.run_debug = run_debug
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        for _ in range(2):
+            await line_handlers.handle_smart_query(
+                SimpleNamespace(reply_token="token"), "user-1", "王大明")
+
+    reply_msgs = mock_api.reply_message.call_args.args[1]
+    assert reply_msgs[0].text == "找到王大明的名片"
+    assert reply_msgs[1].alt_text == "王大明 的名片"
+    assert agent_runtime.get_runner() is runner
@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+
+import pytest
+from google.adk.sessions.in_memory_session_service import (
+    InMemorySessionService
+)
+
+from app import agent_runtime, agent_sessions, config
+from app.agent_sessions import (
+    BackendSessionStore, Conversation, SessionStore, SqliteSessionStore
+)
+
+CARDS = {
+    "card-1": {"name": "王大明", "company": "LINE Taiwan", "title": "工程師"},
+}
+
+
+def test_window_compacts_old_turns_into_summary(monkeypatch):
+    monkeypatch.setattr(config, "AGENT_SESSION_MAX_TURNS", 2)
+    monkeypatch.setattr(config, "AGENT_SESSION_SUMMARY_CHARS", 40)
+    conversation = Conversation()
+    for i in range(5):
+        conversation.add_turn(f"問題{i}", f"回答{i}", now=100.0)
+
+    assert [turn["user"] for turn in conversation.turns] == ["問題3", "問題4"]
+    # 摘要有長度上限，只保留較新的內容
+    assert "問題2" in conversation.summary
+    assert "問題0" not in conversation.summary
+    assert len(conversation.summary) <= 40
+
+
+def test_recent_cards_are_deduplicated_and_bounded():
+    conversation = Conversation()
+    for i in range(4):
+        conversation.add_turn("找", "好", [{"card_id": f"c{i}", "name": i}])
+    conversation.add_turn("找", "好", [{"card_id": "c2", "name": 2}])
+
+    assert [card["card_id"] for card in conversation.recent_cards] == [
+        "c2", "c3", "c1"]
+    assert "c2" in conversation.state()["recent_cards"]
+    assert Conversation().state() == {
+        "conversation_summary": "無", "recent_cards": "無"}
+
+
+def test_expired_session_starts_fresh(session_store, monkeypatch):
+    monkeypatch.setattr(config, "AGENT_SESSION_TTL_SECONDS", 60)
+    conversation = Conversation()
+    conversation.add_turn("找王大明", "找到了", now=0.0)
+    agent_sessions.save("user-1", conversation)
+    assert agent_sessions.load("user-1").turns == []
+
+    conversation.add_turn("找王大明", "找到了")
+    agent_sessions.save("user-1", conversation)
+    assert len(agent_sessions.load("user-1").turns) == 2
+
+    agent_sessions.reset("user-1")
+    assert session_store.get("user-1") is None
+
+
+def test_sqlite_store_round_trip_and_purge(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "AGENT_SESSION_TTL_SECONDS", 60)
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"))
+    stale = Conversation()
+    stale.add_turn("舊的", "舊的", now=0.0)
+    store.put("user-old", stale.to_dict())
+
+    fresh = Conversation()
+    fresh.add_turn("找王大明", "找到了",
+                   [{"card_id": "card-1", "name": "王大明"}])
+    store.put("user-1", fresh.to_dict())
+
+    assert store.get("user-1") == fresh.to_dict()
+    assert store.get("user-old") is None  # 寫入時清除過期的 session
+
+
+def test_backend_store_uses_storage_backend(backend):
+    store = BackendSessionStore()
+    conversation = Conversation()
+    conversation.add_turn("找王大明", "找到了")
+    store.put("user-1", conversation.to_dict())
+    assert store.get("user-1") == conversation.to_dict()
+    assert isinstance(backend.get("agent_session/user-1"), str)
+    store.delete("user-1")
+    assert store.get("user-1") is None
+
+
+class RecordingRunner:
+    """模擬 Runner：記錄每次執行時 session 帶入的對話事件與 state"""
+
+    def __init__(self, replies):
+        self.session_service = InMemorySessionService()
+        self.replies = list(replies)
+        self.seen = []
+
+    async def run_debug(self, msg, user_id, session_id):
+        session = await self.session_service.get_session(
+            app_name=agent_runtime.APP_NAME, user_id=user_id,
+            session_id=session_id)
+        self.seen.append((
+            [(ev.author, ev.content.parts[0].text) for ev in session.events],
+            dict(session.state)))
+        agent_runtime.display_namecard("card-1")
+        reply = self.replies.pop(0)
+        return [SimpleNamespace(content=SimpleNamespace(
+            parts=[SimpleNamespace(text=reply)]))]
+
+
+@pytest.mark.asyncio
+async def test_run_agent_carries_context_to_next_message(session_store,
+                                                         backend, monkeypatch):
+    backend.set("namecard/user-1", CARDS)
+    backend.set("namecard_summary/user-1", CARDS)
+    runner = RecordingRunner(["找到王大明的名片", "已準備更新電話"])
+    monkeypatch.setattr(agent_runtime, "_runner", runner)
+    for msg in ("找王大明", "把他的電話改成 0912345678"):
+        with agent_runtime.agent_request("user-1"):
+            await agent_runtime.run_agent("user-1", msg)
+
+    first_events, first_state = runner.seen[0]
+    assert first_events == []
+    assert first_state["recent_cards"] == "無"
+
+    second_events, second_state = runner.seen[1]
+    assert second_events == [("user", "找王大明"),
+                             (agent_runtime.AGENT_NAME, "找到王大明的名片")]
+    assert "card-1" in second_state["recent_cards"]
+    assert "王大明" in second_state["recent_cards"]
+    # 每則訊息的 ADK session 執行後即刪除
+    sessions = await runner.session_service.list_sessions(
+        app_name=agent_runtime.APP_NAME, user_id="user-1")
+    assert sessions.sessions == []
+    assert len(session_store.get("user-1")["turns"]) == 2
+
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
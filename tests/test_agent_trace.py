@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app import agent_runtime, agent_trace, config, line_handlers, model_router
+
+CARDS = {
+    "card-1": {"name": "王大明", "company": "LINE Taiwan", "title": "工程師"},
+}
+
+
+@pytest.fixture
+def scripted(backend, scripted_llm):
+    backend.set("namecard/user-1", CARDS)
+    backend.set("namecard_summary/user-1", CARDS)
+    agent_trace.metrics.reset()
+    model_router.stats.reset()
+    # 用完 script 後一直呼叫工具，用來觸發預算上限
+    scripted_llm.repeat = ("search_namecards", {"query": "王大明"})
+    yield scripted_llm
+    agent_trace.metrics.reset()
+    model_router.stats.reset()
+
+
+@pytest.mark.asyncio
+async def test_trace_records_model_and_tool_calls(scripted):
+    scripted.script = [
+        ("search_namecards", {"query": "王大明"}),
+        ("display_namecard", {"card_id": "card-1"}),
+        "找到王大明的名片",
+    ]
+    with agent_runtime.agent_request("user-1") as request:
+        assert await agent_runtime.run_agent("user-1", "王大明") == (
+            "找到王大明的名片")
+
+    trace = request.trace
+    assert len(trace.model_calls) == 3
+    assert trace.summary()["prompt_tokens"] == 300
+    assert [call["tool"] for call in trace.tool_calls] == [
+        "search_namecards", "display_namecard"]
+    assert trace.tool_calls[0]["result_bytes"] > 0
+    assert trace.aborted is None
+
+    summary = agent_trace.metrics.summary()
+    assert summary["requests"] == 1
+    assert summary["tools"]["search_namecards"]["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_tool_budget_aborts_run(scripted, monkeypatch):
+    monkeypatch.setattr(config, "AGENT_MAX_TOOL_CALLS", 2)
+    monkeypatch.setitem(config.MODEL_POLICY, "agent_query", "lite")
+    with agent_runtime.agent_request("user-1") as request:
+        with pytest.raises(agent_trace.AgentBudgetExceeded):
+            await agent_runtime.run_agent("user-1", "王大明")
+
+    assert len(request.trace.tool_calls) == 2
+    # lite 模型超過預算後改用 standard 重試，仍超過才中止
+    assert request.tier == model_router.STANDARD
+    assert agent_trace.metrics.summary()["aborted"] == 2
+    assert model_router.stats.summary()["escalations"] == {"agent_query": 1}
+
+
+@pytest.mark.asyncio
+async def test_model_budget_falls_back_to_local_search(scripted, monkeypatch):
+    monkeypatch.setattr(config, "AGENT_MAX_MODEL_CALLS", 3)
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        await line_handlers.handle_smart_query(
+            SimpleNamespace(reply_token="token"), "user-1", "王大明")
+
+    reply_msgs = mock_api.reply_message.call_args.args[1]
+    assert "關鍵字備援搜尋" in reply_msgs[0].text
+    assert agent_trace.metrics.summary()["model_calls_per_request"] == 3
@@ -0,0 +1,94 @@
+import pytest
+
+from app import agent_runtime, firebase_utils
+from app.alias_index import (
+    AliasIndex, company_aliases, name_aliases, split_scripts
+)
+from app.card_index import CardIndex
+
+CARDS = {
+    "card-1": {"name": "王大明 David Wang", "company": "LINE Taiwan"},
+    "card-2": {"name": "王大明", "company": "未來智能"},
+    "card-3": {"name": "Amy Chen", "company": "台灣積體電路製造股份有限公司"},
+    "card-4": {"name": "李小華",
+               "company": "Taiwan Semiconductor Manufacturing Co., Ltd."},
+}
+
+
+def ids(results):
+    return [card_id for card_id, _ in results]
+
+
+def test_split_scripts():
+    assert split_scripts("王大明 David Wang") == ("王大明", "david wang")
+    assert split_scripts("ＬＩＮＥ 台灣") == ("台灣", "line")
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("王大明", {"wang", "wong", "ong"}),
+    ("歐陽娜娜", {"ouyang", "auyeung"}),
+    ("David Wang", {"王", "汪"}),
+    ("Chen Mei-Ling", {"陳", "陈"}),
+    ("某某某", set()),
+])
+def test_name_aliases(name, expected):
+    assert name_aliases(name) == expected
+
+
+def test_company_aliases():
+    assert {"台積電", "tsmc"} <= company_aliases("台灣積體電路製造股份有限公司")
+    assert {"tsm", "tsmc"} <= company_aliases(
+        "Taiwan Semiconductor Manufacturing Co., Ltd.")
+    assert "ibm" in company_aliases("International Business Machines Corp.")
+    assert company_aliases("未來智能") == set()
+
+
+def test_learned_pairs_apply_to_single_script_cards():
+    aliases = AliasIndex()
+    aliases.add("card-2", CARDS["card-2"])
+    assert "david wang" not in aliases.aliases(CARDS["card-2"])["name"]
+
+    assert aliases.add("card-1", CARDS["card-1"]) == {"card-2"}
+    assert "david wang" in aliases.aliases(CARDS["card-2"])["name"]
+    assert "王大明" in aliases.aliases({"name": "David Wang"})["name"]
+
+    assert aliases.remove("card-1") == {"card-2"}
+    assert "david wang" not in aliases.aliases(CARDS["card-2"])["name"]
+
+
+def test_cross_script_search():
+    index = CardIndex(CARDS)
+    # 只寫中文姓名的名片，以雙面名片學到的英文名找到
+    assert ids(index.search("David", strict=True)) == ["card-1", "card-2"]
+    assert ids(index.search("david wang", strict=True)) == [
+        "card-1", "card-2"]
+    # 姓氏拼音與公司簡稱
+    assert "card-2" in ids(index.search("wong"))
+    assert ids(index.search("TSMC")) == ["card-3", "card-4"]
+    assert ids(index.search("台積電")) == ["card-3"]
+    assert ids(index.search("陳")) == ["card-3"]
+
+
+def test_real_text_outranks_alias():
+    index = CardIndex(CARDS)
+    assert ids(index.search("wang"))[0] == "card-1"
+
+
+def test_alias_tokens_follow_card_updates():
+    index = CardIndex(CARDS)
+    index.put("card-1", None)
+    assert ids(index.search("David", strict=True)) == []
+
+    index.put("card-5", {"name": "David Wang"})
+    assert ids(index.search("王大明")) == ["card-2"]
+    index.update("card-5", {"name": "王大明 David Wang"})
+    assert ids(index.search("David", strict=True)) == ["card-5", "card-2"]
+
+
+def test_agent_search_tool_uses_aliases(backend):
+    backend.set("namecard/user-1", CARDS)
+    with agent_runtime.agent_request("user-1"):
+        results = agent_runtime.search_namecards("tsmc")
+    assert [card["card_id"] for card in results] == ["card-3", "card-4"]
+    assert list(firebase_utils.search_cards(
+        "user-1", "David", strict=True)) == ["card-1", "card-2"]
@@ -0,0 +1,246 @@
+import hashlib
+import json
+
+import pytest
+import pytest_asyncio
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+from app import async_firebase, firebase_utils, storage_backend
+from app.async_firebase import (
+    AsyncFirebaseClient, AsyncFirebaseError, PreconditionFailedError
+)
+from app.storage_backend import FirebaseBackend, MemoryBackend
+
+
+def _etag(value) -> str:
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class FakeFirebaseServer:
+    """以 MemoryBackend 模擬 RTDB / Cloud Storage REST API 的本機替身"""
+
+    def __init__(self):
+        self.backend = MemoryBackend()
+        self.blobs = {}
+        self.requests = []
+        # 在下一次條件寫入前由「其他用戶端」插入的寫入，用來製造衝突
+        self.interfere = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(
+            "/upload/storage/v1/b/{bucket}/o", self.handle_upload)
+        app.router.add_route("*", "/{path:.*}", self.handle_rtdb)
+        return app
+
+    async def handle_upload(self, request):
+        name = request.query["name"]
+        self.blobs[name] = (
+            await request.read(), request.headers["Content-Type"],
+            request.query.get("predefinedAcl"))
+        return web.json_response({"name": name})
+
+    async def handle_rtdb(self, request):
+        if request.headers.get("Authorization") != "Bearer test-token":
+            return web.json_response(
+                {"error": "Permission denied"}, status=401)
+        self.requests.append((request.method, request.path))
+        path = request.match_info["path"]
+        assert path.endswith(".json")
+        path = path[:-len(".json")]
+        query = request.query
+        body = await request.text()
+        data = json.loads(body) if body else None
+
+        if request.method == "GET":
+            if "orderBy" in query:
+                value = self.backend.query(
+                    path, json.loads(query["orderBy"]),
+                    start_at=_param(query, "startAt"),
+                    end_at=_param(query, "endAt"),
+                    limit_to_first=_param(query, "limitToFirst"),
+                    limit_to_last=_param(query, "limitToLast"))
+            else:
+                value = self.backend.get(
+                    path, shallow=query.get("shallow") == "true")
+            return self._respond(value)
+
+        if request.method == "PUT":
+            if "if-match" in request.headers:
+                if self.interfere:
+                    self.interfere(self.backend)
+                    self.interfere = None
+                current = self.backend.get(path)
+                if request.headers["if-match"] != _etag(current):
+                    return web.json_response(
+                        current, status=412,
+                        headers={"ETag": _etag(current)})
+            self.backend.set(path, data)
+            return self._respond(data)
+
+        if request.method == "PATCH":
+            self.backend.update(path, data)
+            return web.json_response(data)
+
+        if request.method == "POST":
+            return web.json_response({"name": self.backend.push(path, data)})
+
+        if request.method == "DELETE":
+            self.backend.delete(path)
+            return web.json_response(None)
+
+        return web.json_response({"error": "unsupported"}, status=405)
+
+    def _respond(self, value):
+        return web.json_response(value, headers={"ETag": _etag(value)})
+
+
+def _param(query, name):
+    return json.loads(query[name]) if name in query else None
+
+
+@pytest_asyncio.fixture
+async def firebase_server():
+    fake = FakeFirebaseServer()
+    server = TestServer(fake.app())
+    await server.start_server()
+    fake.url = str(server.make_url("/"))
+    yield fake
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def client(firebase_server):
+    session = ClientSession()
+
+    async def token_provider():
+        return "test-token"
+
+    yield AsyncFirebaseClient(
+        firebase_server.url, lambda: session,
+        token_provider=token_provider, bucket="test-bucket",
+        storage_url=firebase_server.url)
+    await session.close()
+
+
+@pytest.mark.asyncio
+async def test_set_get_and_shallow(client):
+    await client.set("namecard/user-1/card-1", {"name": "王大明"})
+    await client.set("namecard/user-1/card-2", {"name": "李小華"})
+
+    assert await client.get("namecard/user-1/card-1") == {"name": "王大明"}
+    assert await client.get("namecard/user-1", shallow=True) == {
+        "card-1": True, "card-2": True}
+    assert await client.get("namecard/user-2") is None
+
+
+@pytest.mark.asyncio
+async def test_ordered_query_is_sorted(client, firebase_server):
+    firebase_server.backend.set("namecard_summary/user-1", {
+        "a": {"created_at": "2026-10-03"},
+        "b": {"created_at": "2026-10-01"},
+        "c": {"created_at": "2026-10-02"},
+    })
+    latest = await client.get(
+        "namecard_summary/user-1", order_by="created_at", limit_to_last=2)
+    assert list(latest) == ["c", "a"]
+
+    ranged = await client.get(
+        "namecard_summary/user-1", order_by="created_at",
+        start_at="2026-10-02", limit_to_first=5)
+    assert list(ranged) == ["c", "a"]
+
+
+@pytest.mark.asyncio
+async def test_patch_multi_path_push_and_delete(client, firebase_server):
+    key = await client.push("namecard/user-1", {"name": "王大明"})
+    await client.update({
+        f"namecard/user-1/{key}/title": "經理",
+        f"namecard_summary/user-1/{key}": {"name": "王大明"},
+    })
+    await client.patch(f"namecard/user-1/{key}", {"memo": "備註"})
+
+    assert firebase_server.backend.get(f"namecard/user-1/{key}") == {
+        "name": "王大明", "title": "經理", "memo": "備註"}
+    assert firebase_server.backend.get("namecard_summary/user-1") == {
+        key: {"name": "王大明"}}
+    # 多路徑更新只送出一次 PATCH
+    assert [m for m, _ in firebase_server.requests].count("PATCH") == 2
+
+    await client.delete(f"namecard/user-1/{key}")
+    assert firebase_server.backend.get("namecard/user-1") is None
+
+
+@pytest.mark.asyncio
+async def test_conditional_set_rejects_stale_etag(client):
+    etag = await client.set("namecard_stats/user-1/total", 1)
+    await client.set("namecard_stats/user-1/total", 2)
+
+    with pytest.raises(PreconditionFailedError) as exc_info:
+        await client.set("namecard_stats/user-1/total", 3, if_match=etag)
+    assert exc_info.value.value == 2
+    assert exc_info.value.etag == _etag(2)
+
+
+@pytest.mark.asyncio
+async def test_transaction_retries_on_conflict(client, firebase_server):
+    firebase_server.backend.set("namecard_stats/user-1/total", 1)
+    # 第一次條件寫入前，另一個用戶端先把計數改成 5
+    firebase_server.interfere = (
+        lambda backend: backend.set("namecard_stats/user-1/total", 5))
+    seen = []
+
+    def increment(current):
+        seen.append(current)
+        return (current or 0) + 1
+
+    result = await client.transaction("namecard_stats/user-1/total", increment)
+    assert result == 6
+    assert seen == [1, 5]
+    assert firebase_server.backend.get("namecard_stats/user-1/total") == 6
+
+
+@pytest.mark.asyncio
+async def test_upload_blob_returns_public_url(client, firebase_server):
+    url = await client.upload_blob("qrcodes/u 1.png", b"png", "image/png")
+    base_url = firebase_server.url.rstrip("/")
+    assert url == f"{base_url}/test-bucket/qrcodes/u%201.png"
+    assert firebase_server.blobs["qrcodes/u 1.png"] == (
+        b"png", "image/png", "publicRead")
+
+
+@pytest.mark.asyncio
+async def test_error_status_raises(client, firebase_server):
+    async def wrong_token():
+        return "wrong-token"
+
+    client._token_provider = wrong_token
+    with pytest.raises(AsyncFirebaseError) as exc_info:
+        await client.get("namecard/user-1")
+    assert exc_info.value.status == 401
+    assert "Permission denied" in str(exc_info.value)
+
+
+@pytest.mark.asyncio
+async def test_handler_prefetch_reads_through_async_client(
+        client, firebase_server, monkeypatch):
+    firebase_server.backend.set("namecard/user-1", {
+        "card-1": {"name": "王大明"}, "card-2": {"name": "李小華"}})
+    monkeypatch.setattr(async_firebase, "_client", client)
+    storage_backend.set_backend(FirebaseBackend())
+    try:
+        with firebase_utils.card_context() as ctx:
+            await firebase_utils.prefetch_cards(
+                "user-1", ["card-1", "card-2", "card-1", "missing"])
+            # 之後的同步讀取直接命中 CardContext，不經過 Admin SDK
+            assert firebase_utils.get_name_from_card(
+                "user-1", "card-2") == "李小華"
+            assert firebase_utils.get_card_by_id("user-1", "missing") is None
+    finally:
+        storage_backend.set_backend(None)
+    assert ctx.reads == 3
+    assert sorted(path for _, path in firebase_server.requests) == [
+        "/namecard/user-1/card-1.json", "/namecard/user-1/card-2.json",
+        "/namecard/user-1/missing.json"]
@@ -0,0 +1,142 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app import (
+    agent_runtime, agent_trace, config, firebase_utils, line_handlers
+)
+
+CARDS = {
+    "card-1": {"name": "王大明", "company": "LINE Taiwan", "title": "工程師",
+               "phone": "02-1234-5678"},
+    "card-2": {"name": "李小華", "company": "測試公司", "title": "經理"},
+}
+
+
+@pytest.fixture
+def backend(backend, scripted_llm):
+    backend.set("namecard/user-1", CARDS)
+    backend.set("namecard_summary/user-1", {
+        card_id: firebase_utils.card_summary(card)
+        for card_id, card in CARDS.items()})
+    agent_trace.metrics.reset()
+    yield backend
+    agent_trace.metrics.reset()
+
+
+async def smart_query(msg):
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        with firebase_utils.card_context():
+            await line_handlers.handle_smart_query(
+                SimpleNamespace(reply_token="token"), "user-1", msg)
+    return mock_api.reply_message.call_args.args[1]
+
+
+async def confirm():
+    event = SimpleNamespace(
+        reply_token="token",
+        postback=SimpleNamespace(data="action=confirm_update"))
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        with firebase_utils.card_context() as ctx:
+            await line_handlers.handle_postback_event(event, "user-1")
+    return mock_api.reply_message.call_args.args[1], ctx
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_confirms_and_writes_once(backend):
+    agent_runtime.get_runner().agent.model.script = [
+        ("update_namecard_fields", {"updates": [
+            {"card_id": "card-1", "field": "phone", "value": "0912345678"},
+            {"card_id": "card-1", "field": "title", "value": "技術長"},
+            {"card_id": "card-2", "field": "memo", "value": "下週開會"},
+        ]}),
+        "請確認以下修改",
+    ]
+    reply_msgs = await smart_query("把王大明的電話改成 0912345678、職稱改成技術長")
+
+    assert len(line_handlers.user_states["user-1"]["changes"]) == 3
+    confirm_text = reply_msgs[1].contents.body.contents[1].text
+    assert "3 項修改" in confirm_text
+    assert "「王大明」的【職稱】：「技術長」" in confirm_text
+    assert "「李小華」的【備忘錄】：「下週開會」" in confirm_text
+
+    reply_msgs, ctx = await confirm()
+    assert "2 張名片" in reply_msgs[0].text
+    assert len(reply_msgs) == 3
+    assert ctx.writes == 1  # 單一多路徑更新，沒有公司變動不需更新統計
+    card = backend.get("namecard/user-1/card-1")
+    assert (card["phone"], card["title"]) == ("0912345678", "技術長")
+    assert backend.get("namecard_summary/user-1/card-1/title") == "技術長"
+    assert backend.get("namecard/user-1/card-2/memo") == "下週開會"
+    assert "user-1" not in line_handlers.user_states
+
+    edits = agent_trace.metrics.summary()["edits"]
+    assert edits["proposed"] == 3
+    assert edits["model_calls_per_edit"] == pytest.approx(2 / 3)
+    assert edits["applied"] == 3
+    assert edits["writes_per_edit"] == pytest.approx(1 / 3)
+
+
+@pytest.mark.asyncio
+async def test_single_field_calls_accumulate_instead_of_overwriting(backend):
+    agent_runtime.get_runner().agent.model.script = [
+        ("update_namecard_field",
+         {"card_id": "card-1", "field": "phone", "value": "0911"}),
+        ("update_namecard_field",
+         {"card_id": "card-1", "field": "email", "value": "d@example.com"}),
+        ("update_namecard_field",
+         {"card_id": "card-1", "field": "phone", "value": "0922"}),
+        "請確認",
+    ]
+    await smart_query("把王大明的電話和 Email 改掉")
+
+    assert line_handlers.user_states["user-1"]["changes"] == [
+        {"card_id": "card-1", "field": "phone", "value": "0922"},
+        {"card_id": "card-1", "field": "email", "value": "d@example.com"},
+    ]
+    reply_msgs, _ = await confirm()
+    assert "「王大明」的資料已成功更新" in reply_msgs[0].text
+    card = backend.get("namecard/user-1/card-1")
+    assert (card["phone"], card["email"]) == ("0922", "d@example.com")
+
+
+def test_invalid_fields_are_rejected_without_pending_changes(backend):
+    with agent_runtime.agent_request("user-1") as request:
+        result = agent_runtime.update_namecard_fields(
+            [{"card_id": "card-1", "field": "salary", "value": "1"}])
+    assert result["status"] == "error"
+    assert request.pending_changes == []
+    assert "user-1" not in line_handlers.user_states
+
+
+@pytest.mark.asyncio
+async def test_aborted_tier_leaves_no_pending_update(backend, monkeypatch):
+    monkeypatch.setitem(config.MODEL_POLICY, "agent_edit", "lite")
+    monkeypatch.setattr(config, "AGENT_MAX_MODEL_CALLS", 2)
+    # lite 提出修改後超過回合預算，升級為 standard 後沒有提出修改
+    agent_runtime.get_runner().agent.model.script = [
+        ("update_namecard_field",
+         {"card_id": "card-1", "field": "phone", "value": "0911"}),
+        ("search_namecards", {"query": "王大明"}),
+        ("search_namecards", {"query": "王大明"}),
+        "找不到要修改的名片",
+    ]
+    with agent_runtime.agent_request("user-1"):
+        text = await agent_runtime.run_agent("user-1", "把王大明的電話改掉")
+    assert text == "找不到要修改的名片"
+    assert "user-1" not in line_handlers.user_states
+
+    monkeypatch.setitem(config.MODEL_POLICY, "agent_edit", "standard")
+    agent_runtime.get_runner().agent.model.script = [
+        ("update_namecard_field",
+         {"card_id": "card-1", "field": "phone", "value": "0911"}),
+        ("search_namecards", {"query": "王大明"}),
+        ("search_namecards", {"query": "王大明"}),
+    ]
+    with agent_runtime.agent_request("user-1"):
+        with pytest.raises(agent_trace.AgentBudgetExceeded):
+            await agent_runtime.run_agent("user-1", "把王大明的電話改掉")
+    assert "user-1" not in line_handlers.user_states
@@ -0,0 +1,138 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app import firebase_utils, line_handlers, storage_backend
+from app.storage_backend import MemoryBackend
+
+CARD_OBJ = {
+    "name": "王大明",
+    "title": "工程師",
+    "company": "測試公司",
+    "address": "台北市",
+    "phone": "#886-02-1234-5678",
+    "email": "david@example.com"
+}
+
+
+class FakePostback:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakePostbackEvent:
+    def __init__(self, data, reply_token="reply-token-1"):
+        self.postback = FakePostback(data)
+        self.reply_token = reply_token
+
+
+class CountingBackend(MemoryBackend):
+    """記錄實際讀取次數的記憶體後端"""
+
+    def __init__(self):
+        super().__init__()
+        self.get_calls = 0
+
+    def get(self, path, shallow=False):
+        self.get_calls += 1
+        return super().get(path, shallow=shallow)
+
+
+@pytest.fixture(autouse=True)
+def clear_user_states():
+    line_handlers.user_states.clear()
+    yield
+    line_handlers.user_states.clear()
+
+
+@pytest.fixture
+def backend():
+    backend = CountingBackend()
+    backend.set("namecard/user-1/card-1", CARD_OBJ)
+    storage_backend.set_backend(backend)
+    yield backend
+    storage_backend.set_backend(None)
+
+
+@pytest.fixture
+def mock_line_api():
+    with patch.object(
+        line_handlers, "line_bot_api", new=AsyncMock()
+    ) as mock_api:
+        yield mock_api
+
+
+def test_card_read_once_per_context(backend):
+    with firebase_utils.card_context() as ctx:
+        assert firebase_utils.get_name_from_card("user-1", "card-1") == "王大明"
+        assert firebase_utils.get_card_by_id("user-1", "card-1") == CARD_OBJ
+    assert ctx.reads == 1
+
+
+def test_card_reads_outside_context_are_not_cached(backend):
+    firebase_utils.get_card_by_id("user-1", "card-1")
+    firebase_utils.get_card_by_id("user-1", "card-1")
+    assert backend.get_calls == 2
+
+
+def test_all_cards_serve_single_card_reads(backend):
+    with firebase_utils.card_context() as ctx:
+        firebase_utils.get_all_cards("user-1")
+        firebase_utils.get_card_by_id("user-1", "card-1")
+        firebase_utils.check_if_card_exists(CARD_OBJ, "user-1")
+    assert ctx.reads == 1
+
+
+def test_update_is_applied_locally(backend):
+    with firebase_utils.card_context() as ctx:
+        firebase_utils.get_card_by_id("user-1", "card-1")
+        firebase_utils.update_namecard_field(
+            "user-1", "card-1", "phone", "0912-345-678")
+        card = firebase_utils.get_card_by_id("user-1", "card-1")
+    assert card["phone"] == "0912-345-678"
+    stored = backend.get("namecard/user-1/card-1")
+    assert stored["phone"] == "0912-345-678"
+    assert ctx.reads == 1
+
+
+@pytest.mark.asyncio
+async def test_show_card_postback_reads_card_once(backend, mock_line_api):
+    event = FakePostbackEvent("action=show_card&card_id=card-1")
+    with firebase_utils.card_context() as ctx:
+        await line_handlers.handle_postback_event(event, "user-1")
+    assert ctx.reads == 1
+    mock_line_api.reply_message.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_confirm_update_reads_card_once(backend, mock_line_api):
+    line_handlers.user_states["user-1"] = {
+        "action": "pending_update",
+        "changes": [
+            {"card_id": "card-1", "field": "title", "value": "經理"},
+        ],
+    }
+    backend.set("namecard_summary/user-1/card-1",
+                firebase_utils.card_summary(CARD_OBJ))
+    event = FakePostbackEvent("action=confirm_update")
+    with firebase_utils.card_context() as ctx:
+        await line_handlers.handle_postback_event(event, "user-1")
+    assert ctx.reads == 2  # 名片本身與確認摘要節點已建立的單筆查詢
+    reply_msgs = mock_line_api.reply_message.call_args.args[1]
+    assert "成功更新" in reply_msgs[0].text
+    assert len(reply_msgs) == 2
+
+
+def test_get_cards_by_ids_uses_snapshot_and_fetches_missing(backend):
+    backend.set("namecard/user-2", {"a": {"name": "A"}, "b": {"name": "B"}})
+    backend.set("namecard/user-1/card-2", {"name": "李小華"})
+    with firebase_utils.card_context() as ctx:
+        firebase_utils.get_all_cards("user-2")
+        snapshot_cards = firebase_utils.get_cards_by_ids(
+            "user-2", ["b", "a", "missing"])
+        fetched_cards = firebase_utils.get_cards_by_ids(
+            "user-1", ["card-2", "card-1", "card-1"])
+    assert list(snapshot_cards) == ["b", "a"]
+    assert list(fetched_cards) == ["card-2", "card-1"]
+    assert fetched_cards["card-2"]["name"] == "李小華"
+    assert ctx.reads == 3
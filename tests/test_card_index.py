@@ -0,0 +1,142 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app import agent_runtime, firebase_utils, line_handlers
+from app.card_index import CardIndex, index_tokens, query_tokens
+
+CARDS = {
+    "card-1": {"name": "王大明 David Wang", "company": "台灣積體電路",
+               "title": "工程師", "email": "david@example.com"},
+    "card-2": {"name": "李小華", "company": "LINE Taiwan",
+               "title": "產品經理", "memo": "東京 AI 展認識"},
+    "card-3": {"name": "陳王明", "company": "王大明商行",
+               "address": "台北市信義區"},
+}
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeTextEvent:
+    def __init__(self, text, reply_token="reply-token-1"):
+        self.message = FakeMessage(text)
+        self.reply_token = reply_token
+
+
+@pytest.fixture(autouse=True)
+def backend(backend):
+    backend.set("namecard/user-1", CARDS)
+    return backend
+
+
+def test_tokens_cover_cjk_bigrams_and_latin_prefixes():
+    tokens = index_tokens("王大明 David")
+    assert {"王", "王大", "大明", "d", "dav", "david"} <= set(tokens)
+    assert tokens["david"] > tokens["dav"]
+    assert query_tokens("ＬＩＮＥ 台積電") == ["line", "台積", "積電"]
+
+
+def test_name_match_ranks_above_company_match():
+    index = CardIndex(CARDS)
+    assert [card_id for card_id, _ in index.search("王大明")] == [
+        "card-1", "card-3"]
+
+
+def test_searches_all_fields_and_prefixes():
+    index = CardIndex(CARDS)
+    assert [c for c, _ in index.search("dav")] == ["card-1"]
+    assert [c for c, _ in index.search("東京")] == ["card-2"]
+    assert [c for c, _ in index.search("信義")] == ["card-3"]
+    assert index.search("不存在") == []
+
+
+def test_strict_search_matches_whole_latin_words_only():
+    index = CardIndex(CARDS)
+    assert index.search("dav", strict=True) == []
+    assert [c for c, _ in index.search("david", strict=True)] == ["card-1"]
+    assert [c for c, _ in index.search("台灣 dav")] == ["card-1"]
+    assert index.search("台灣 dav", strict=True) == []
+
+
+def test_multi_term_query_prefers_cards_matching_every_term():
+    index = CardIndex(CARDS)
+    results = [c for c, _ in index.search("經理 line")]
+    assert results[0] == "card-2"
+    assert [c for c, _ in index.search("王明 信義")][0] == "card-3"
+
+
+def test_long_query_tolerates_filler_words():
+    index = CardIndex(CARDS)
+    assert index.search("幫我查一下李小華")[0][0] == "card-2"
+
+
+def test_incremental_updates_follow_firebase_writes(backend):
+    assert list(firebase_utils.search_cards("user-1", "李小華")) == ["card-2"]
+
+    firebase_utils.update_namecard_field("user-1", "card-2", "name", "李美華")
+    card_id = firebase_utils.add_namecard(
+        {"name": "李小華", "company": "新公司"}, "user-1")
+
+    results = firebase_utils.search_cards("user-1", "李小華")
+    assert list(results) == [card_id]
+    assert results[card_id]["company"] == "新公司"
+    assert list(firebase_utils.search_cards("user-1", "美華")) == ["card-2"]
+
+
+def test_index_is_loaded_once(backend):
+    with firebase_utils.card_context() as ctx:
+        firebase_utils.search_cards("user-1", "王大明")
+        firebase_utils.search_cards("user-1", "李小華")
+    assert ctx.reads == 1
+    with firebase_utils.card_context() as ctx:
+        firebase_utils.search_cards("user-1", "陳王明")
+    assert ctx.reads == 0
+
+
+def test_failed_load_is_not_cached(backend, monkeypatch):
+    def unavailable(path, shallow=False):
+        raise ConnectionError("RTDB unavailable")
+
+    with monkeypatch.context() as m:
+        m.setattr(backend, "get", unavailable)
+        with firebase_utils.card_context() as ctx:
+            assert firebase_utils.search_cards("user-1", "王大明") == {}
+        assert "user-1" not in ctx.all_cards
+
+    # 暫時性錯誤恢復後立即重新載入，不會沿用空的索引直到 TTL 到期
+    assert list(firebase_utils.search_cards("user-1", "李小華")) == ["card-2"]
+
+
+@pytest.mark.asyncio
+async def test_smart_query_fallback_uses_index():
+    failing_runner = AsyncMock()
+    failing_runner.run_debug.side_effect = RuntimeError("Vertex down")
+    with patch.object(agent_runtime, "get_runner",
+                      return_value=failing_runner), \
+            patch.object(line_handlers, "line_bot_api",
+                         new=AsyncMock()) as mock_api:
+        await line_handlers.handle_smart_query(
+            FakeTextEvent("王大明"), "user-1", "王大明")
+
+    reply_msgs = mock_api.reply_message.call_args.args[1]
+    assert "關鍵字備援搜尋" in reply_msgs[0].text
+    # 姓名相符的名片排在公司名稱相符的名片前面
+    assert [msg.alt_text for msg in reply_msgs[1:]] == [
+        "王大明 David Wang 的名片", "陳王明 的名片"]
+
+
+def test_search_tool_returns_compact_summaries():
+    tools = {tool.__name__: tool for tool in agent_runtime.TOOLS}
+    assert "get_all_namecards" not in tools
+
+    with agent_runtime.agent_request("user-1"):
+        assert tools["search_namecards"]("王大明", limit=1) == [{
+            "card_id": "card-1", "name": "王大明 David Wang",
+            "company": "台灣積體電路", "title": "工程師"}]
+        # 關鍵字沒有相符時改用容錯比對
+        assert [r["card_id"]
+                for r in tools["search_namecards"]("李小話")] == ["card-2"]
+        assert tools["get_namecard_by_id"]("card-1") == CARDS["card-1"]
@@ -0,0 +1,135 @@
+import pytest
+
+from app import config, firebase_utils, storage_backend
+from app.card_mirror import MirroredBackend
+from app.storage_backend import ListenEvent, MemoryBackend
+
+
+class FakeStreamBackend(MemoryBackend):
+    """記錄監聽 callback，讓測試自行送出串流事件"""
+
+    def __init__(self):
+        super().__init__()
+        self.streams = {}
+        self.closed = []
+        self.reads = 0
+
+    def get(self, path, shallow=False):
+        self.reads += 1
+        return super().get(path, shallow=shallow)
+
+    def listen(self, path, callback):
+        self.streams[path] = callback
+        backend = self
+
+        class Registration:
+            def close(self):
+                backend.closed.append(path)
+                backend.streams.pop(path, None)
+
+        return Registration()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def mirror_config(monkeypatch):
+    monkeypatch.setattr(config, "CARD_MIRROR_HOT_THRESHOLD", 1)
+    monkeypatch.setattr(config, "CARD_MIRROR_IDLE_SECONDS", 60)
+    monkeypatch.setattr(config, "CARD_MIRROR_MAX_LISTENERS", 2)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def inner():
+    return FakeStreamBackend()
+
+
+@pytest.fixture
+def mirrored(inner, clock):
+    backend = MirroredBackend(inner, clock=clock)
+    storage_backend.set_backend(backend)
+    yield backend
+    storage_backend.set_backend(None)
+
+
+def test_reads_served_from_mirror_after_initial_put(inner, mirrored):
+    inner.set("namecard/u1/c1", {"name": "王大明"})
+    mirrored.touch("u1")
+    stream = inner.streams["namecard/u1"]
+
+    # 初始快照送達前仍讀取實際後端
+    assert mirrored.get("namecard/u1/c1") == {"name": "王大明"}
+    reads = inner.reads
+
+    stream(ListenEvent("put", "/", {"c1": {"name": "王大明"}}))
+    stream(ListenEvent("put", "/c2", {"name": "李小華"}))
+    stream(ListenEvent("patch", "/c1", {"phone": "0912"}))
+
+    assert firebase_utils.get_all_cards("u1") == {
+        "c1": {"name": "王大明", "phone": "0912"},
+        "c2": {"name": "李小華"}}
+    assert firebase_utils.count_cards("u1") == 2
+    stream(ListenEvent("put", "/c2", None))
+    assert firebase_utils.get_card_by_id("u1", "c2") is None
+    assert inner.reads == reads
+    assert mirrored.hits == 3
+
+
+def test_local_writes_apply_to_mirror_immediately(inner, mirrored):
+    mirrored.touch("u1")
+    inner.streams["namecard/u1"](ListenEvent("put", "/", None))
+    card_id = firebase_utils.add_namecard({"name": "王大明"}, "u1")
+    firebase_utils.update_namecard_field("u1", card_id, "title", "PM")
+    assert firebase_utils.get_card_by_id("u1", card_id)["title"] == "PM"
+    assert inner.get(f"namecard/u1/{card_id}/title") == "PM"
+
+
+def test_listener_cap_evicts_least_recently_used(inner, mirrored, clock):
+    for u_id in ("u1", "u2"):
+        mirrored.touch(u_id)
+        clock.now += 1
+    mirrored.touch("u1")
+    mirrored.touch("u3")
+    assert mirrored.listener_count() == 2
+    assert inner.closed == ["namecard/u2"]
+    assert set(inner.streams) == {"namecard/u1", "namecard/u3"}
+
+
+def test_idle_listeners_are_closed(inner, mirrored, clock):
+    mirrored.touch("u1")
+    clock.now += 61
+    mirrored.sweep_idle()
+    assert mirrored.listener_count() == 0
+    assert inner.closed == ["namecard/u1"]
+
+
+def test_hot_threshold_delays_listening(inner, mirrored, monkeypatch):
+    monkeypatch.setattr(config, "CARD_MIRROR_HOT_THRESHOLD", 3)
+    mirrored.touch("u1")
+    mirrored.touch("u1")
+    assert "namecard/u1" not in inner.streams
+    mirrored.touch("u1")
+    assert "namecard/u1" in inner.streams
+
+
+def test_memory_backend_stream_keeps_mirror_in_sync():
+    inner = MemoryBackend()
+    inner.set("namecard/u1/c1", {"name": "王大明"})
+    mirrored = MirroredBackend(inner)
+    mirrored.touch("u1")
+    # 模擬其他實例直接寫入實際後端
+    inner.update("namecard/u1", {"c1/phone": "0912", "c2": {"name": "B"}})
+    assert mirrored.get("namecard/u1") == {
+        "c1": {"name": "王大明", "phone": "0912"}, "c2": {"name": "B"}}
+    assert mirrored.hits == 1
@@ -0,0 +1,87 @@
+import pytest
+
+from app import firebase_utils
+
+SUMMARIES = {
+    f"card-{i:02d}": {
+        "name": name,
+        "company": "測試公司",
+        "created_at": f"2026-10-{i + 1:02d}T10:00:00",
+    }
+    for i, name in enumerate(
+        ["王大明", "李小華", "陳一", "林二", "陳一", "張三", "陳一"])
+}
+
+
+@pytest.fixture(autouse=True)
+def backend(backend):
+    backend.set("namecard/user-1", SUMMARIES)
+    backend.set("namecard_summary/user-1", SUMMARIES)
+    return backend
+
+
+def _collect_pages(**kwargs):
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = firebase_utils.get_card_summary_page(
+            "user-1", limit=2, cursor=cursor, **kwargs)
+        pages.append([card["card_id"] for card in page])
+        if cursor is None:
+            return pages
+
+
+def test_count_cards_uses_shallow_read():
+    assert firebase_utils.count_cards("user-1") == len(SUMMARIES)
+
+
+def test_pages_by_created_at_are_newest_first():
+    pages = _collect_pages()
+    assert pages == [
+        ["card-06", "card-05"], ["card-04", "card-03"],
+        ["card-02", "card-01"], ["card-00"]]
+
+
+def test_pages_by_name_handle_ties_without_duplicates():
+    pages = _collect_pages(order_by="name")
+    flat = [card_id for page in pages for card_id in page]
+    assert sorted(flat) == sorted(SUMMARIES)
+    assert len(flat) == len(set(flat))
+    names = [SUMMARIES[card_id]["name"] for card_id in flat]
+    assert names == sorted(names)
+
+
+def test_get_card_summaries_keeps_order():
+    summaries = firebase_utils.get_card_summaries(
+        "user-1", ["card-03", "card-00", "missing"])
+    assert [card["card_id"] for card in summaries] == ["card-03", "card-00"]
+    assert summaries[1]["name"] == "王大明"
+
+
+def test_summary_page_rebuilds_missing_summary_node(backend):
+    backend.delete("namecard_summary/user-1")
+    page, cursor = firebase_utils.get_card_summary_page("user-1", limit=3)
+    assert [card["card_id"] for card in page] == [
+        "card-06", "card-05", "card-04"]
+    assert backend.get("namecard_summary/user-1/card-00")["name"] == "王大明"
+
+
+def test_writes_backfill_missing_summary_node_first(backend):
+    backend.delete("namecard_summary/user-1")
+    firebase_utils.update_namecard_field("user-1", "card-00", "title", "PM")
+    assert len(backend.get("namecard_summary/user-1")) == len(SUMMARIES)
+    assert backend.get("namecard_summary/user-1/card-00")["title"] == "PM"
+
+    backend.delete("namecard_summary/user-1")
+    card_id = firebase_utils.add_namecard({"name": "趙四"}, "user-1")
+    page, _ = firebase_utils.get_card_summary_page("user-1", limit=20)
+    assert sorted(card["card_id"] for card in page) == sorted(
+        [*SUMMARIES, card_id])
+
+
+def test_card_summary_projects_list_fields():
+    card = {"name": "王大明", "company": "LINE", "title": "PM",
+            "email": "a@b.c", "memo": "x", "created_at": "2026-10-01"}
+    assert firebase_utils.card_summary(card) == {
+        "name": "王大明", "company": "LINE", "title": "PM",
+        "created_at": "2026-10-01"}
@@ -0,0 +1,52 @@
+from app.card_record import CardRecord, CardStore
+from app.flex_messages import get_namecard_flex_msg
+
+CARD_OBJ = {
+    "name": "王大明",
+    "title": "工程師",
+    "company": "測試公司",
+    "phone": "#886-02-1234-5678",
+    "created_at": "2026-10-01T10:00:00",
+}
+
+
+def test_record_round_trips_to_dict():
+    record = CardRecord.from_dict("card-1", CARD_OBJ)
+    assert record.to_dict() == CARD_OBJ
+    assert record.to_dict(with_id=True) == {**CARD_OBJ, "card_id": "card-1"}
+    # 缺少的欄位沿用 dict.get 的預設值語意
+    assert record.get("email", "N/A") == "N/A"
+    assert record.summary() == {
+        "card_id": "card-1", "name": "王大明",
+        "company": "測試公司", "title": "工程師"}
+
+
+def test_record_keeps_unknown_fields():
+    record = CardRecord.from_dict("card-1", {"name": "A", "line_id": "abc"})
+    assert record.get("line_id") == "abc"
+    assert record.to_dict() == {"name": "A", "line_id": "abc"}
+
+
+def test_repeated_company_is_interned():
+    a = CardRecord.from_dict("a", {"company": "".join(["LINE ", "Taiwan"])})
+    b = CardRecord.from_dict("b", {"company": "".join(["LINE", " Taiwan"])})
+    assert a.company is b.company
+
+
+def test_store_matches_get_all_cards_shape():
+    cards = {"card-1": CARD_OBJ, "card-2": {"name": "李小華"}}
+    store = CardStore(cards)
+    assert len(store) == 2
+    assert store.to_dicts() == cards
+    assert store.get_dict("card-2") == {"name": "李小華"}
+
+    store.put("card-2", {"name": "李小華", "memo": "備註"})
+    assert store.get("card-2").memo == "備註"
+    store.remove("card-1")
+    assert "card-1" not in store
+    assert store.get_dict("card-1") is None
+
+
+def test_record_dict_renders_flex_message():
+    record = CardRecord.from_dict("card-1", CARD_OBJ)
+    assert get_namecard_flex_msg(record.to_dict(), "card-1") is not None
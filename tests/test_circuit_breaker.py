@@ -0,0 +1,183 @@
+import json
+from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import PIL.Image
+import pytest
+
+from app import (
+    agent_runtime, circuit_breaker, config, deferred_scans, gemini_utils,
+    line_handlers
+)
+from app.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+)
+from app.deferred_scans import DeferredScans
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(config, "CIRCUIT_MIN_CALLS", 4)
+    monkeypatch.setattr(config, "CIRCUIT_ERROR_RATE", 0.5)
+    monkeypatch.setattr(config, "CIRCUIT_SLOW_CALL_SECONDS", 10)
+    monkeypatch.setattr(config, "CIRCUIT_SLOW_CALL_RATE", 0.75)
+    monkeypatch.setattr(config, "CIRCUIT_OPEN_SECONDS", 30)
+    monkeypatch.setattr(config, "CIRCUIT_HALF_OPEN_PROBES", 1)
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", clock=clock)
+    breaker.clock = clock
+    return breaker
+
+
+def call(breaker, error=None, seconds=0.0):
+    with breaker.guard(ignore=(KeyError,)):
+        breaker.clock.now += seconds
+        if error is not None:
+            raise error
+
+
+def test_opens_on_error_rate_then_probes_and_closes(breaker):
+    call(breaker)
+    call(breaker)
+    with pytest.raises(RuntimeError):
+        call(breaker, RuntimeError("quota"))
+    assert breaker.state == CLOSED
+    with pytest.raises(RuntimeError):
+        call(breaker, RuntimeError("quota"))
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        call(breaker)
+    assert breaker.summary()["rejected"] == 1
+
+    breaker.clock.now += 30
+    assert breaker.summary()["state"] == HALF_OPEN
+    with breaker.guard():
+        # 試探期間只放行一個呼叫
+        with pytest.raises(CircuitOpenError):
+            call(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens(breaker):
+    for _ in range(4):
+        with pytest.raises(RuntimeError):
+            call(breaker, RuntimeError("down"))
+    breaker.clock.now += 30
+    with pytest.raises(RuntimeError):
+        call(breaker, RuntimeError("still down"))
+    assert breaker.state == OPEN
+    assert breaker.opened_count == 2
+
+
+def test_slow_calls_open_and_ignored_errors_count_as_success(breaker):
+    for _ in range(4):
+        with pytest.raises(KeyError):
+            call(breaker, KeyError("budget"))
+    assert breaker.summary()["error_rate"] == 0.0
+
+    breaker.clock.now += 61  # 舊的呼叫移出時間窗
+    for _ in range(3):
+        call(breaker, seconds=12)
+    assert breaker.state == CLOSED  # 未達最少呼叫次數
+    call(breaker)
+    assert breaker.state == OPEN  # 4 次中 3 次過慢
+
+
+def test_deferred_scans_are_bounded_and_expire(monkeypatch):
+    monkeypatch.setattr(config, "DEFERRED_SCAN_MAX_PER_USER", 2)
+    monkeypatch.setattr(config, "DEFERRED_SCAN_TTL_SECONDS", 60)
+    clock = FakeClock()
+    scans = DeferredScans(clock=clock)
+    assert scans.add("user-1", b"a")
+    assert scans.add("user-1", b"b")
+    assert not scans.add("user-1", b"c")
+    assert scans.add("user-2", b"d")
+
+    clock.now += 61
+    assert scans.pop_all() == []
+
+
+@pytest.fixture
+def open_vertex(monkeypatch):
+    monkeypatch.setattr(config, "CIRCUIT_MIN_CALLS", 1)
+    circuit_breaker.vertex.reset()
+    deferred_scans.queue.pop_all()
+    with pytest.raises(RuntimeError):
+        with circuit_breaker.vertex.guard():
+            raise RuntimeError("Vertex down")
+    assert circuit_breaker.vertex.state == OPEN
+    yield circuit_breaker.vertex
+    circuit_breaker.vertex.reset()
+    deferred_scans.queue.pop_all()
+    line_handlers.user_states.clear()
+
+
+@pytest.mark.asyncio
+async def test_smart_query_skips_agent_while_open(open_vertex, card_backend,
+                                                  monkeypatch):
+    runner = AsyncMock()
+    monkeypatch.setattr(agent_runtime, "_runner", runner)
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        await line_handlers.handle_smart_query(
+            SimpleNamespace(reply_token="token"), "user-1", "王大明")
+
+    runner.run_debug.assert_not_called()
+    reply_msgs = mock_api.reply_message.call_args.args[1]
+    assert "關鍵字備援搜尋" in reply_msgs[0].text
+
+
+def _jpeg_bytes():
+    buf = BytesIO()
+    PIL.Image.new("RGB", (10, 10), color="white").save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_image_is_deferred_while_open_and_scanned_after(
+        open_vertex, card):
+    async def iter_content():
+        yield _jpeg_bytes()
+
+    event = SimpleNamespace(reply_token="token",
+                            message=SimpleNamespace(id="msg-1"))
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api, \
+            patch.object(gemini_utils,
+                         "generate_json_from_image",
+                         return_value=MagicMock(
+                             text=json.dumps(card))) as generate, \
+            patch.object(line_handlers.firebase_utils,
+                         "check_if_card_exists", return_value=None), \
+            patch.object(line_handlers.firebase_utils, "add_namecard",
+                         return_value="card-9") as add:
+        mock_api.get_message_content.return_value = SimpleNamespace(
+            iter_content=iter_content)
+        await line_handlers.handle_image_event(event, "user-1")
+
+        generate.assert_not_called()
+        assert "已保留這張名片" in mock_api.reply_message.call_args.args[1].text
+        assert len(deferred_scans.queue) == 1
+
+        # 熔斷期間不處理
+        line_handlers.schedule_deferred_scans()
+        assert len(deferred_scans.queue) == 1
+
+        open_vertex.reset()
+        assert await line_handlers.process_deferred_scans() == 1
+
+    add.assert_called_once()
+    user_id, messages = mock_api.push_message.call_args.args
+    assert user_id == "user-1"
+    assert messages[1].text == "名片資料已經成功加入資料庫。"
+    assert len(deferred_scans.queue) == 0
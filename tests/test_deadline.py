@@ -0,0 +1,257 @@
+import asyncio
+import json
+import time
+from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import PIL.Image
+import pytest
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from app import (
+    agent_runtime, bot_instance, config, deadline, deferred_scans,
+    firebase_utils, gemini_utils, line_handlers
+)
+
+
+@pytest.fixture(autouse=True)
+def short_reserve(monkeypatch):
+    monkeypatch.setattr(config, "DEADLINE_REPLY_RESERVE_SECONDS", 0.1)
+    monkeypatch.setattr(config, "DEADLINE_LOW_SECONDS", 0.2)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_uses_remaining_budget():
+    assert deadline.timeout() is None
+    with deadline.request_deadline(0.3):
+        assert 0.1 < deadline.timeout() <= 0.2
+        assert await deadline.wait_for(asyncio.sleep(0, "done")) == "done"
+        with pytest.raises(deadline.DeadlineExceeded):
+            await deadline.wait_for(asyncio.sleep(1))
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.check()
+        assert deadline.running_low()
+        with deadline.unbounded():
+            assert deadline.timeout() is None
+
+
+@pytest.mark.asyncio
+async def test_line_api_calls_get_remaining_budget_as_timeout():
+    class FakeApi:
+        def __init__(self):
+            self.timeouts = []
+
+        async def reply_message(self, reply_token, messages, timeout=None):
+            self.timeouts.append(timeout)
+
+    api = bot_instance.LazyLineBotApi()
+    api._api = FakeApi()
+    await api.reply_message("token", [])
+    with deadline.request_deadline(10):
+        await api.reply_message("token", [])
+        await api.reply_message("token", [], timeout=3)
+    with deadline.request_deadline(0):
+        await api.reply_message("token", [])
+
+    assert api._api.timeouts[0] is None
+    assert 9 < api._api.timeouts[1] <= 10
+    assert api._api.timeouts[2] == 3
+    assert api._api.timeouts[3] is None
+
+
+class SlowLlm(BaseLlm):
+    model: str = "slow"
+    seconds: float = 1
+
+    async def generate_content_async(self, llm_request, stream=False):
+        await asyncio.sleep(self.seconds)
+        yield LlmResponse(content=types.Content(
+            role="model", parts=[types.Part(text="太慢了")]))
+
+
+@pytest.fixture
+def backend(card_backend, session_store):
+    yield card_backend
+    deferred_scans.queue.pop_all()
+
+
+@pytest.mark.asyncio
+async def test_slow_agent_degrades_to_local_search(backend, monkeypatch):
+    monkeypatch.setattr(config, "HEDGED_SEARCH_ENABLED", False)
+    runner = agent_runtime.create_runner()
+    runner.agent.model = SlowLlm()
+    monkeypatch.setattr(agent_runtime, "_runner", runner)
+
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        with deadline.request_deadline(0.5):
+            await line_handlers.handle_smart_query(
+                SimpleNamespace(reply_token="token"), "user-1", "王大明")
+
+    reply_msgs = mock_api.reply_message.call_args.args[1]
+    assert "關鍵字備援搜尋" in reply_msgs[0].text
+
+
+@pytest.mark.asyncio
+async def test_hedged_agent_outlives_deadline_to_push_answer(
+        backend, monkeypatch):
+    monkeypatch.setattr(config, "HEDGED_SEARCH_ENABLED", True)
+    monkeypatch.setattr(config, "HEDGE_SOFT_DEADLINE_SECONDS", 0.05)
+    monkeypatch.setattr(config, "HEDGE_LATE_ANSWER", "push")
+    runner = agent_runtime.create_runner()
+    runner.agent.model = SlowLlm(seconds=0.8)
+    monkeypatch.setattr(agent_runtime, "_runner", runner)
+
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        with deadline.request_deadline(0.5):
+            await line_handlers.handle_smart_query(
+                SimpleNamespace(reply_token="token"), "user-1", "找王大明")
+            assert "完成後會再通知您" in (
+                mock_api.reply_message.call_args.args[1][0].text)
+        await asyncio.gather(*line_handlers._background_tasks)
+
+    user_id, pushed = mock_api.push_message.call_args.args
+    assert user_id == "user-1"
+    assert pushed[0].text == "太慢了"
+
+
+@pytest.mark.asyncio
+async def test_low_budget_query_replies_with_local_results(backend):
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        with deadline.request_deadline(0.15):
+            await line_handlers.handle_smart_query(
+                SimpleNamespace(reply_token="token"), "user-1", "王大明")
+
+    reply_msgs = mock_api.reply_message.call_args.args[1]
+    assert reply_msgs[0].text == "為您列出關鍵字搜尋找到的相關名片："
+    assert len(reply_msgs) == 2
+
+
+def _jpeg_bytes():
+    buf = BytesIO()
+    PIL.Image.new("RGB", (10, 10), color="white").save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_low_budget_image_is_scanned_in_background(backend, card):
+    backend.delete("namecard/user-1")
+
+    async def iter_content():
+        yield _jpeg_bytes()
+
+    event = SimpleNamespace(reply_token="token",
+                            message=SimpleNamespace(id="msg-1"))
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api, \
+            patch.object(gemini_utils,
+                         "generate_json_from_image",
+                         return_value=MagicMock(
+                             text=json.dumps(card))) as generate:
+        mock_api.get_message_content.return_value = SimpleNamespace(
+            iter_content=iter_content)
+        with deadline.request_deadline(0.25):
+            await line_handlers.handle_image_event(event, "user-1")
+            assert "完成後會再通知您" in (
+                mock_api.reply_message.call_args.args[1].text)
+            generate.assert_not_called()
+        await asyncio.gather(*line_handlers._background_tasks)
+
+    generate.assert_called_once()
+    user_id, messages = mock_api.push_message.call_args.args
+    assert user_id == "user-1"
+    assert messages[1].text == "名片資料已經成功加入資料庫。"
+    assert len(deferred_scans.queue) == 0
+
+
+def test_expired_deadline_is_not_read_as_empty_address_book(backend, card):
+    with firebase_utils.card_context() as ctx:
+        with deadline.request_deadline(0):
+            with pytest.raises(deadline.DeadlineExceeded):
+                firebase_utils.get_all_cards("user-1")
+            with pytest.raises(deadline.DeadlineExceeded):
+                firebase_utils.check_if_card_exists(card, "user-1")
+            assert firebase_utils.search_cards("user-1", "王大明") == {}
+        assert "user-1" not in ctx.all_cards
+        assert firebase_utils.search_cards("user-1", "王大明") == {
+            "card-1": card}
+
+
+@pytest.mark.asyncio
+async def test_timed_out_scan_is_finished_in_background_once(backend,
+                                                             card):
+    backend.delete("namecard/user-1")
+
+    async def iter_content():
+        yield _jpeg_bytes()
+
+    def slow_generate(*args, **kwargs):
+        time.sleep(0.4)
+        return MagicMock(text=json.dumps(card))
+
+    event = SimpleNamespace(reply_token="token",
+                            message=SimpleNamespace(id="msg-1"))
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api, \
+            patch.object(gemini_utils, "generate_json_from_image",
+                         side_effect=slow_generate) as generate:
+        mock_api.get_message_content.return_value = SimpleNamespace(
+            iter_content=iter_content)
+        with deadline.request_deadline(0.4):
+            await line_handlers.handle_image_event(event, "user-1")
+            assert "完成後會再通知您" in (
+                mock_api.reply_message.call_args.args[1].text)
+        assert len(deferred_scans.queue) == 0
+        while line_handlers._background_tasks:
+            await asyncio.gather(*line_handlers._background_tasks)
+
+    generate.assert_called_once()
+    user_id, messages = mock_api.push_message.call_args.args
+    assert messages[0].quick_reply.items[1].action.data == (
+        "action=backside_confirm&has_backside=no")
+    assert backend.get("namecard/user-1") is None
+    assert bot_instance.user_states["user-1"]["card_obj"] == card
+
+    postback = SimpleNamespace(
+        reply_token="token-2",
+        postback=SimpleNamespace(
+            data="action=backside_confirm&has_backside=no"))
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        await line_handlers.handle_postback_event(postback, "user-1")
+    messages = mock_api.reply_message.call_args.args[1]
+    assert messages[1].text == "名片資料已經成功加入資料庫。"
+    assert len(backend.get("namecard/user-1")) == 1
+
+
+@pytest.mark.asyncio
+async def test_save_after_deadline_is_finished_in_background(backend, card):
+    backend.delete("namecard/user-1")
+    bot_instance.user_states["user-1"] = {
+        'action': 'pending_backside_confirm',
+        'card_obj': card,
+        'front_image_bytes': b"front",
+        'expires_at': time.time() + 60
+    }
+    event = SimpleNamespace(
+        reply_token="token",
+        postback=SimpleNamespace(
+            data="action=backside_confirm&has_backside=no"))
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        with deadline.request_deadline(0):
+            await line_handlers.handle_postback_event(event, "user-1")
+            assert mock_api.reply_message.call_args.args[1].text == (
+                line_handlers.SAVE_PENDING_TEXT)
+        await asyncio.gather(*line_handlers._background_tasks)
+
+    assert "user-1" not in bot_instance.user_states
+    user_id, messages = mock_api.push_message.call_args.args
+    assert user_id == "user-1"
+    assert messages[1].text == "名片資料已經成功加入資料庫。"
+    assert len(backend.get("namecard/user-1")) == 1
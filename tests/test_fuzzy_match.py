@@ -0,0 +1,82 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app import agent_runtime, line_handlers
+from app.card_index import CardIndex
+from app.fuzzy_match import FuzzyMatcher, edit_distance
+
+CARDS = {
+    "card-1": {"name": "王大明 David Wang", "company": "LINE Taiwan",
+               "title": "工程師"},
+    "card-2": {"name": "李小華", "company": "台積電股份有限公司",
+               "title": "產品經理"},
+    "card-3": {"name": "Davis Chen", "company": "David Design",
+               "title": "Designer"},
+}
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeTextEvent:
+    def __init__(self, text, reply_token="reply-token-1"):
+        self.message = FakeMessage(text)
+        self.reply_token = reply_token
+
+
+def test_edit_distance_counts_transpositions_and_cutoff():
+    assert edit_distance("davd", "david", 2) == 1
+    assert edit_distance("dvaid", "david", 2) == 1
+    assert edit_distance("abcdef", "uvwxyz", 2) == 3
+    assert edit_distance("台績電", "台積電股份有限公司", 1, substring=True) == 1
+
+
+def test_typos_find_cards():
+    index = CardIndex(CARDS)
+    assert index.search("Davd") == []
+    assert [c for c, _ in index.fuzzy_search("Davd Wang")] == ["card-1"]
+    assert [c for c, _ in index.fuzzy_search("台績電")] == ["card-2"]
+    assert [c for c, _ in index.fuzzy_search("李小話")] == ["card-2"]
+
+
+def test_name_match_outranks_company_match():
+    index = CardIndex(CARDS)
+    # card-1 的姓名與 card-3 的公司都和 "Davd" 相差一個字元
+    assert [c for c, _ in index.fuzzy_search("Davd")] == ["card-1", "card-3"]
+
+
+def test_short_terms_are_not_fuzzy():
+    index = CardIndex(CARDS)
+    assert index.fuzzy_search("Wag") == []
+
+
+def test_removed_cards_leave_no_terms():
+    matcher = FuzzyMatcher()
+    matcher.add("card-1", CARDS["card-1"])
+    matcher.remove("card-1")
+    assert matcher.search("Davd Wang") == []
+    assert matcher._terms == {} and matcher._grams == {}
+
+
+@pytest.mark.asyncio
+async def test_smart_query_fallback_suggests_similar_cards(backend):
+    backend.set("namecard/user-1", CARDS)
+    failing_runner = AsyncMock()
+    failing_runner.run_debug.side_effect = RuntimeError("Vertex down")
+    with patch.object(agent_runtime, "get_runner",
+                      return_value=failing_runner), \
+            patch.object(line_handlers, "line_bot_api",
+                         new=AsyncMock()) as mock_api, \
+            patch.object(line_handlers.flex_messages,
+                         "get_namecard_list_flex_msg") as mock_list:
+        await line_handlers.handle_smart_query(
+            FakeTextEvent("台績電"), "user-1", "台績電")
+
+    reply_msgs = mock_api.reply_message.call_args.args[1]
+    assert "拼寫相近" in reply_msgs[0].text
+    assert mock_list.call_args.kwargs["cards"] == [{
+        "card_id": "card-2", "name": "李小華",
+        "company": "台積電股份有限公司", "title": "產品經理"}]
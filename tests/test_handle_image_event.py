@@ -6,7 +6,7 @@ from unittest.mock import AsyncMock, MagicMock, patch
 import pytest
 import PIL.Image
 
-from app import line_handlers
+from app import gemini_utils, line_handlers
 
 
 def _make_jpeg_bytes(color):
@@ -80,7 +80,7 @@ async def test_fresh_image_asks_about_backside_and_does_not_save(
     fake_response = MagicMock(text=CARD_JSON)
 
     with patch.object(
-        line_handlers.gemini_utils, "generate_json_from_image",
+        gemini_utils, "generate_json_from_image",
         return_value=fake_response
     ) as mock_single, patch.object(
         line_handlers.firebase_utils, "add_namecard"
@@ -111,10 +111,10 @@ async def test_awaiting_backside_image_merges_and_saves(mock_line_api):
     fake_response = MagicMock(text=MERGED_CARD_JSON)
 
     with patch.object(
-        line_handlers.gemini_utils, "generate_json_from_two_images",
+        gemini_utils, "generate_json_from_two_images",
         return_value=fake_response
     ) as mock_merge, patch.object(
-        line_handlers.gemini_utils, "generate_json_from_image"
+        gemini_utils, "generate_json_from_image"
     ) as mock_single, patch.object(
         line_handlers.firebase_utils, "check_if_card_exists",
         return_value=None
@@ -146,10 +146,10 @@ async def test_expired_awaiting_backside_treated_as_new_card(
     fake_response = MagicMock(text=CARD_JSON)
 
     with patch.object(
-        line_handlers.gemini_utils, "generate_json_from_image",
+        gemini_utils, "generate_json_from_image",
         return_value=fake_response
     ) as mock_single, patch.object(
-        line_handlers.gemini_utils, "generate_json_from_two_images"
+        gemini_utils, "generate_json_from_two_images"
     ) as mock_merge, patch.object(
         line_handlers.firebase_utils, "add_namecard"
     ) as mock_add:
@@ -176,7 +176,7 @@ async def test_merge_parse_failure_clears_state_and_replies_error(
     fake_response = MagicMock(text="not valid json")
 
     with patch.object(
-        line_handlers.gemini_utils, "generate_json_from_two_images",
+        gemini_utils, "generate_json_from_two_images",
         return_value=fake_response
     ):
         await line_handlers.handle_image_event(FakeEvent(), "user-1")
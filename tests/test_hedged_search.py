@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app import agent_runtime, config, intent_router, line_handlers
+
+
+@pytest.fixture
+def cards(card_backend, monkeypatch):
+    monkeypatch.setattr(config, "HEDGED_SEARCH_ENABLED", True)
+    monkeypatch.setattr(config, "HEDGE_SOFT_DEADLINE_SECONDS", 0.05)
+    monkeypatch.setattr(intent_router, "stats", intent_router.RouterStats())
+
+
+def agent(seconds, text="王大明在測試公司擔任工程師。"):
+    calls = {"started": 0, "finished": 0, "cancelled": 0}
+
+    async def run_agent(user_id, msg):
+        calls["started"] += 1
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            calls["cancelled"] += 1
+            raise
+        calls["finished"] += 1
+        return text
+
+    return run_agent, calls
+
+
+async def smart_query(msg):
+    with patch.object(line_handlers, "line_bot_api",
+                      new=AsyncMock()) as mock_api:
+        await line_handlers.handle_smart_query(
+            SimpleNamespace(reply_token="token"), "user-1", msg)
+        await asyncio.gather(*line_handlers._background_tasks)
+    return mock_api
+
+
+@pytest.mark.asyncio
+async def test_slow_agent_is_hedged_and_late_answer_pushed(cards,
+                                                           monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_LATE_ANSWER", "push")
+    run_agent, calls = agent(0.2)
+    monkeypatch.setattr(agent_runtime, "run_agent", run_agent)
+
+    mock_api = await smart_query("找王大明")
+
+    reply_msgs = mock_api.reply_message.call_args.args[1]
+    assert "關鍵字搜尋" in reply_msgs[0].text
+    assert len(reply_msgs) == 2  # 說明文字與名片
+    user_id, pushed = mock_api.push_message.call_args.args
+    assert user_id == "user-1"
+    assert pushed[0].text == "王大明在測試公司擔任工程師。"
+    assert calls["finished"] == 1
+    assert intent_router.stats.summary()["hedged"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancel_mode_stops_the_agent(cards, monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_LATE_ANSWER", "cancel")
+    run_agent, calls = agent(0.2)
+    monkeypatch.setattr(agent_runtime, "run_agent", run_agent)
+
+    mock_api = await smart_query("找王大明")
+    await asyncio.sleep(0)
+
+    mock_api.reply_message.assert_called_once()
+    mock_api.push_message.assert_not_called()
+    assert calls == {"started": 1, "finished": 0, "cancelled": 1}
+
+
+@pytest.mark.asyncio
+async def test_fast_agent_and_edits_are_not_hedged(cards, monkeypatch):
+    run_agent, calls = agent(0.2, text="好的")
+    monkeypatch.setattr(agent_runtime, "run_agent", run_agent)
+    mock_api = await smart_query("把王大明的電話改成 0912345678")
+    assert mock_api.reply_message.call_args.args[1][0].text == "好的"
+
+    run_agent, calls = agent(0, text="找到了")
+    monkeypatch.setattr(agent_runtime, "run_agent", run_agent)
+    mock_api = await smart_query("找王大明")
+    assert mock_api.reply_message.call_args.args[1][0].text == "找到了"
+    mock_api.push_message.assert_not_called()
+    assert intent_router.stats.summary()["hedged"] == 0
+
+
+@pytest.mark.asyncio
+async def test_no_local_match_keeps_waiting_for_agent(cards, monkeypatch):
+    run_agent, calls = agent(0.2, text="查無此人")
+    monkeypatch.setattr(agent_runtime, "run_agent", run_agent)
+
+    mock_api = await smart_query("找李小華")
+
+    assert mock_api.reply_message.call_args.args[1][0].text == "查無此人"
+    assert calls["finished"] == 1
@@ -0,0 +1,111 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app import line_handlers
+from app.intent_router import AGENT, LOOKUP, RouterStats, route
+
+CARDS = {
+    "card-1": {"name": "王大明", "company": "LINE Taiwan", "title": "工程師"},
+    "card-2": {"name": "李小華", "company": "台積電", "title": "經理"},
+    "card-3": {"name": "Okada Hiroshi", "company": "Hitachi Delta",
+               "title": "Director"},
+}
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeTextEvent:
+    def __init__(self, text, reply_token="reply-token-1"):
+        self.message = FakeMessage(text)
+        self.reply_token = reply_token
+
+
+@pytest.fixture(autouse=True)
+def backend(backend):
+    backend.set("namecard/user-1", CARDS)
+    line_handlers.user_states.clear()
+    return backend
+
+
+@pytest.mark.parametrize("msg, query", [
+    ("王大明", "王大明"),
+    ("LINE Taiwan", "line taiwan"),
+    ("幫我查一下王大明", "王大明"),
+    ("王大明的電話", "王大明"),
+    ("找 台積電 經理", "台積電 經理"),
+])
+def test_plain_lookups_are_routed_locally(msg, query):
+    assert route(msg) == (LOOKUP, query)
+
+
+@pytest.mark.parametrize("msg", [
+    "把王大明的電話改成 0912-345-678",
+    "幫我把這張名片加上備忘錄",
+    "update David's email",
+    "王大明電話是多少？",
+    "最近加的名片有哪些",
+    "who works at LINE",
+    "hi",
+    "OK",
+    "",
+])
+def test_edits_and_questions_go_to_agent(msg):
+    assert route(msg).kind == AGENT
+
+
+@pytest.mark.asyncio
+async def test_lookup_is_answered_without_agent():
+    with patch.object(line_handlers, "handle_smart_query",
+                      new=AsyncMock()) as mock_query, \
+            patch.object(line_handlers, "line_bot_api",
+                         new=AsyncMock()) as mock_api:
+        await line_handlers.handle_text_event(
+            FakeTextEvent("幫我找王大明"), "user-1")
+
+    mock_query.assert_not_awaited()
+    reply_msgs = mock_api.reply_message.call_args.args[1]
+    assert "1 張" in reply_msgs[0].text
+    assert reply_msgs[1].alt_text == "王大明 的名片"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("msg", ["把王大明的職稱改成經理", "陳小美"])
+async def test_edits_and_misses_escalate_to_agent(msg):
+    with patch.object(line_handlers, "handle_smart_query",
+                      new=AsyncMock()) as mock_query, \
+            patch.object(line_handlers, "line_bot_api", new=AsyncMock()):
+        await line_handlers.handle_text_event(FakeTextEvent(msg), "user-1")
+
+    mock_query.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("msg", ["hi", "ok", "de", "hit", "dir"])
+async def test_latin_chit_chat_does_not_match_prefixes(msg):
+    with patch.object(line_handlers, "line_bot_api", new=AsyncMock()):
+        assert not await line_handlers.handle_local_lookup(
+            FakeTextEvent(msg), "user-1", msg)
+        assert await line_handlers.handle_local_lookup(
+            FakeTextEvent("Okada"), "user-1", "Okada")
+
+
+def test_router_stats_estimate_saved_latency():
+    stats = RouterStats()
+    stats.record(True, 0.01)
+    stats.record(True, 0.01)
+    stats.record(False, 4.01)
+    summary = stats.summary()
+    assert summary["local_share"] == pytest.approx(2 / 3)
+    assert summary["saved_seconds"] == pytest.approx(8.0)
+
+
+@pytest.mark.asyncio
+async def test_router_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(line_handlers.config, "INTENT_ROUTER_ENABLED", False)
+    with patch.object(line_handlers, "line_bot_api", new=AsyncMock()):
+        assert not await line_handlers.handle_local_lookup(
+            FakeTextEvent("王大明"), "user-1", "王大明")
@@ -0,0 +1,128 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from app import agent_runtime, config, gemini_utils, model_router
+from app.bot_instance import user_states
+
+
+def response(card, prompt_tokens=1000, output_tokens=100):
+    return SimpleNamespace(
+        text=json.dumps(card, ensure_ascii=False),
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens))
+
+
+@pytest.fixture
+def blurry_card(card):
+    return {**card, "title": "N/A", "address": "N/A", "email": ""}
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    model_router.stats.reset()
+    yield
+    model_router.stats.reset()
+
+
+@pytest.fixture(autouse=True)
+def lite_policy(monkeypatch):
+    """比照部署時以 MODEL_POLICY 讓查詢與單面辨識改用 lite 模型"""
+    monkeypatch.setitem(config.MODEL_POLICY, "agent_query", "lite")
+    monkeypatch.setitem(config.MODEL_POLICY, "ocr_single", "lite")
+
+
+def test_needs_escalation_on_na_heavy_or_unparsable_results(card, blurry_card):
+    assert not model_router.needs_escalation(response(card))
+    assert model_router.needs_escalation(response(blurry_card))
+    assert model_router.needs_escalation(SimpleNamespace(text="not json"))
+    assert not model_router.needs_escalation(
+        response([{k.upper(): v for k, v in card.items()}]))
+
+
+@pytest.mark.asyncio
+async def test_clean_single_sided_card_stays_on_lite_model(card):
+    with patch.object(gemini_utils, "generate_json_from_image",
+                      return_value=response(card)) as generate:
+        await model_router.recognize_card("img", "prompt", "user-1")
+
+    generate.assert_called_once_with(
+        "img", "prompt", model_name=config.MODEL_TIERS["lite"])
+    lite = model_router.stats.summary()["tasks"]["ocr_single"]["lite"]
+    assert lite["calls"] == 1
+    assert lite["cost_usd"] == pytest.approx(
+        (1000 * config.MODEL_PRICES["lite"][0]
+         + 100 * config.MODEL_PRICES["lite"][1]) / 1_000_000)
+
+
+@pytest.mark.asyncio
+async def test_na_heavy_card_is_escalated_to_standard_model(card, blurry_card):
+    def generate(img, prompt, model_name):
+        lite = model_name == config.MODEL_TIERS["lite"]
+        return response(blurry_card if lite else card)
+
+    with patch.object(gemini_utils, "generate_json_from_image",
+                      side_effect=generate) as mock_generate:
+        result = await model_router.recognize_card("img", "prompt", "user-1")
+
+    assert json.loads(result.text) == card
+    assert [c.kwargs["model_name"] for c in mock_generate.call_args_list] == [
+        config.MODEL_TIERS["lite"], config.MODEL_TIERS["standard"]]
+    summary = model_router.stats.summary()
+    assert summary["escalations"] == {"ocr_single": 1}
+    assert set(summary["tasks"]["ocr_single"]) == {"lite", "standard"}
+
+
+@pytest.mark.asyncio
+async def test_policy_table_controls_starting_tier(card, blurry_card,
+                                                   monkeypatch):
+    monkeypatch.setitem(config.MODEL_POLICY, "ocr_single", "standard")
+    with patch.object(gemini_utils, "generate_json_from_image",
+                      return_value=response(blurry_card)) as generate:
+        await model_router.recognize_card("img", "prompt", "user-1")
+    generate.assert_called_once_with(
+        "img", "prompt", model_name=config.MODEL_TIERS["standard"])
+
+    with patch.object(gemini_utils, "generate_json_from_two_images",
+                      return_value=response(card)) as generate:
+        await model_router.recognize_two_sided_card(
+            "front", "back", "prompt", "user-1")
+    assert generate.call_args.kwargs["model_name"] == (
+        config.MODEL_TIERS["standard"])
+
+
+class RecordingLlm(BaseLlm):
+    """記錄每次請求使用的模型，直接回覆文字"""
+
+    model: str = "recording"
+    models: list = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.models.append(llm_request.model)
+        yield LlmResponse(content=types.Content(
+            role="model", parts=[types.Part(text="好的")]))
+
+
+@pytest.mark.asyncio
+async def test_agent_model_follows_message_type(session_store, monkeypatch):
+    runner = agent_runtime.create_runner()
+    runner.agent.model = RecordingLlm()
+    monkeypatch.setattr(agent_runtime, "_runner", runner)
+    try:
+        for msg in ("誰在測試公司工作？", "把王大明的電話改成 0912345678"):
+            with agent_runtime.agent_request("user-1"):
+                await agent_runtime.run_agent("user-1", msg)
+    finally:
+        user_states.pop("user-1", None)
+
+    assert runner.agent.model.models == [
+        config.MODEL_TIERS["lite"], config.MODEL_TIERS["standard"]]
+    tasks = model_router.stats.summary()["tasks"]
+    assert tasks["agent_query"]["lite"]["calls"] == 1
+    assert tasks["agent_edit"]["standard"]["calls"] == 1
@@ -0,0 +1,95 @@
+import pytest
+
+from app import firebase_utils
+from app.card_index import CardIndex
+from app.intent_router import LOOKUP, route
+from app.phone_index import PhoneIndex, looks_like_phone, normalize_phone
+
+CARDS = {
+    "card-1": {"name": "王大明", "company": "LINE Taiwan",
+               "phone": "#886-0912-345-678,1234"},
+    "card-2": {"name": "李小華", "company": "台積電",
+               "phone": "(02) 2345-5678 / 0988-111-222"},
+    "card-3": {"name": "Davis Chen", "company": "David Design",
+               "phone": "+1 415 555 5678"},
+}
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("#886-0912-345-678,1234", [("912345678", "1234")]),
+    ("+886 912 345 678", [("912345678", None)]),
+    ("0912-345-678", [("912345678", None)]),
+    ("886912345678", [("912345678", None)]),
+    ("00886-2-2345-5678", [("223455678", None)]),
+    ("02-2345-5678 分機 12", [("223455678", "12")]),
+    ("02-2345-5678 / 0988-111-222",
+     [("223455678", None), ("988111222", None)]),
+    ("N/A", []),
+])
+def test_normalize_phone(raw, expected):
+    assert normalize_phone(raw) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("0912-345-678", True),
+    ("+886 912345678", True),
+    ("5678", True),
+    ("123", False),
+    ("王大明 0912", False),
+])
+def test_looks_like_phone(query, expected):
+    assert looks_like_phone(query) is expected
+
+
+def test_full_and_partial_numbers_resolve_across_formats():
+    index = PhoneIndex()
+    for card_id, card in CARDS.items():
+        index.add(card_id, card["phone"])
+
+    assert index.search("+886 912 345 678") == ["card-1"]
+    assert index.search("0912345678") == ["card-1"]
+    assert index.search("0988 111 222") == ["card-2"]
+    # 末四碼相同的名片全部列出
+    assert index.search("5678") == ["card-1", "card-2", "card-3"]
+    assert index.search("0000-0000") == []
+
+
+def test_exact_number_ranks_before_longer_numbers_with_same_ending():
+    index = PhoneIndex()
+    index.add("short", "2345-5678")
+    index.add("long", "02-2345-5678")
+    assert index.search("23455678") == ["short", "long"]
+
+
+def test_remove_and_overwrite_prune_the_trie():
+    index = PhoneIndex()
+    index.add("card-1", "0912-345-678")
+    index.add("card-1", "0988-111-222")
+    assert index.search("345678") == []
+    assert index.search("111222") == ["card-1"]
+
+    index.remove("card-1")
+    assert len(index) == 0
+    assert index._root == {}
+
+
+def test_card_index_search_uses_phone_lookup():
+    index = CardIndex(CARDS)
+    assert [card_id for card_id, _ in index.search("0912-345-678")] == [
+        "card-1"]
+    assert [card_id for card_id, _ in index.search(
+        "0988111222", strict=True)] == ["card-2"]
+
+    index.update("card-1", {"phone": "0955-000-111"})
+    assert index.search("0912-345-678") == []
+    assert [card_id for card_id, _ in index.search("000111")] == ["card-1"]
+
+
+def test_phone_queries_are_answered_locally(backend):
+    backend.set("namecard/user-1", CARDS)
+    intent = route("+886 988-111-222")
+    assert intent.kind == LOOKUP
+    assert list(firebase_utils.search_cards(
+        "user-1", intent.query, strict=True)) == ["card-2"]
+    assert [card["card_id"] for card in firebase_utils
+            .search_card_summaries("user-1", "345678")] == ["card-1"]
@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+import pytest
+from google.adk.sessions.in_memory_session_service import (
+    InMemorySessionService
+)
+
+from app import (
+    agent_runtime, agent_sessions, config, firebase_utils, response_cache
+)
+from app.response_cache import ResponseCache, cache_key
+
+CARDS = {
+    "card-1": {"name": "王大明", "company": "LINE Taiwan", "title": "工程師"},
+}
+
+
+def test_cache_key_normalizes_and_skips_context_dependent_messages():
+    assert cache_key("王大明電話？") == cache_key(" 王大明電話 ")
+    assert cache_key("ＤＡＶＩＤ  Wang!") == "david wang"
+    assert cache_key("他的電話") is None
+    assert cache_key("這張名片的地址") is None
+    assert cache_key("？？") is None
+
+
+def test_version_bump_invalidates_user_entries():
+    cache = ResponseCache()
+    cache.put("user-1", "王大明", "找到了", ["card-1"], 0)
+    cache.put("user-2", "王大明", "找到了", ["card-9"], 0)
+    assert cache.get("user-1", "王大明").card_ids == ("card-1",)
+
+    cache.invalidate("user-1")
+    assert cache.get("user-1", "王大明") is None
+    assert cache.get("user-2", "王大明") is not None
+    assert cache.summary()["hits"] == 2
+
+
+def test_put_drops_response_generated_before_a_write():
+    cache = ResponseCache()
+    version = cache.version("user-1")
+    cache.invalidate("user-1")  # 產生回覆期間名片有變動
+    cache.put("user-1", "王大明", "舊的回覆", ["card-1"], version)
+    assert cache.get("user-1", "王大明") is None
+
+
+def test_lru_and_ttl_bounds(monkeypatch):
+    monkeypatch.setattr(config, "RESPONSE_CACHE_MAX_ENTRIES", 2)
+    cache = ResponseCache()
+    cache.put("user-1", "a", "A", [], 0)
+    cache.put("user-1", "b", "B", [], 0)
+    cache.get("user-1", "a")
+    cache.put("user-1", "c", "C", [], 0)
+    assert cache.get("user-1", "b") is None
+    assert cache.get("user-1", "a").text == "A"
+
+    monkeypatch.setattr(config, "RESPONSE_CACHE_TTL_SECONDS", 0)
+    assert cache.get("user-1", "a") is None
+
+
+class CountingRunner:
+    """模擬 Runner：回覆並顯示名片，可選擇是否調用修改工具"""
+
+    def __init__(self, edit=False):
+        self.session_service = InMemorySessionService()
+        self.calls = 0
+        self.edit = edit
+
+    async def run_debug(self, msg, user_id, session_id):
+        self.calls += 1
+        agent_runtime.display_namecard("card-1")
+        if self.edit:
+            agent_runtime.update_namecard_memo("card-1", "下週開會")
+        return [SimpleNamespace(content=SimpleNamespace(
+            parts=[SimpleNamespace(text=f"第 {self.calls} 次回覆")]))]
+
+
+@pytest.fixture
+def env(backend, session_store, monkeypatch):
+    backend.set("namecard/user-1", CARDS)
+    backend.set("namecard_summary/user-1", CARDS)
+    monkeypatch.setattr(config, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache, "cache", ResponseCache())
+
+
+async def ask(msg):
+    with agent_runtime.agent_request("user-1") as request:
+        text = await agent_runtime.run_agent("user-1", msg)
+    return text, request.found_card_ids
+
+
+@pytest.mark.asyncio
+async def test_repeated_read_only_query_skips_agent(env, monkeypatch):
+    runner = CountingRunner()
+    monkeypatch.setattr(agent_runtime, "_runner", runner)
+
+    assert await ask("王大明電話") == ("第 1 次回覆", ["card-1"])
+    assert await ask("王大明電話？") == ("第 1 次回覆", ["card-1"])
+    assert runner.calls == 1
+    # 命中快取的查詢仍記錄在對話紀錄中
+    assert len(agent_sessions.load("user-1").turns) == 2
+
+    # 名片變動後快取失效
+    firebase_utils.update_namecard_field(
+        "user-1", "card-1", "phone", "0912345678")
+    assert await ask("王大明電話") == ("第 2 次回覆", ["card-1"])
+    assert runner.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_queries_that_edit_are_not_cached(env, monkeypatch):
+    runner = CountingRunner(edit=True)
+    monkeypatch.setattr(agent_runtime, "_runner", runner)
+
+    await ask("王大明備忘錄寫下週開會")
+    await ask("王大明備忘錄寫下週開會")
+    assert runner.calls == 2
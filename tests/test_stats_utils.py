@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from app import stats_utils
+
+CARDS = {
+    "a": {"name": "王大明", "company": "LINE Taiwan",
+          "created_at": "2026-10-01T10:00:00"},
+    "b": {"name": "李小華", "company": "LINE Taiwan",
+          "created_at": "2026-09-30T10:00:00"},
+    "c": {"name": "陳一", "company": "N/A",
+          "created_at": "not-a-date"},
+    "d": {"name": "林二", "company": "a.b/c"},
+}
+
+NOW = datetime(2026, 10, 19)
+
+
+def test_compute_statistics_matches_summary():
+    stats = stats_utils.compute_statistics(CARDS)
+    assert stats["top_company"] == {"name": "LINE Taiwan", "count": 2}
+    assert stats_utils.summarize_statistics(stats, NOW) == {
+        "total": 4,
+        "this_month": 1,
+        "top_company": "LINE Taiwan (2張)"
+    }
+
+
+def test_company_key_is_valid_rtdb_key():
+    key = stats_utils.company_key("a.b/c#[$]")
+    assert not any(ch in key for ch in ".$#[]/")
+
+
+def test_incremental_updates_match_full_recompute():
+    stats = stats_utils.empty_statistics()
+    for card in CARDS.values():
+        stats = stats_utils.apply_stats_delta(
+            stats, stats_utils.stats_delta(None, card))
+
+    moved = {**CARDS["a"], "company": "Google"}
+    stats = stats_utils.apply_stats_delta(
+        stats, stats_utils.stats_delta(CARDS["a"], moved))
+    stats = stats_utils.apply_stats_delta(
+        stats, stats_utils.stats_delta(CARDS["b"], None))
+
+    expected = stats_utils.compute_statistics(
+        {"a": moved, "c": CARDS["c"], "d": CARDS["d"]})
+    assert stats == expected
+
+
+def test_memo_change_produces_empty_delta():
+    delta = stats_utils.stats_delta(
+        CARDS["a"], {**CARDS["a"], "memo": "下週開會"})
+    assert stats_utils.is_empty_delta(delta)
+
+
+def test_summarize_empty_statistics():
+    assert stats_utils.summarize_statistics(None, NOW) == {
+        "total": 0,
+        "this_month": 0,
+        "top_company": "無"
+    }
@@ -0,0 +1,169 @@
+from io import BytesIO
+
+import pytest
+
+from app import firebase_utils, storage_backend
+from app.storage_backend import MemoryBackend, SqliteBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        backend = MemoryBackend()
+    else:
+        backend = SqliteBackend(str(tmp_path / "namecard.db"))
+    storage_backend.set_backend(backend)
+    yield backend
+    storage_backend.set_backend(None)
+
+
+def test_set_get_and_shallow(backend):
+    backend.set("namecard/u1/c1", {"name": "王大明", "phone": "0912"})
+    backend.set("namecard/u1/c2", {"name": "李小華"})
+    assert backend.get("namecard/u1/c1/name") == "王大明"
+    assert backend.get("namecard/u1") == {
+        "c1": {"name": "王大明", "phone": "0912"},
+        "c2": {"name": "李小華"}}
+    assert backend.get("namecard/u1", shallow=True) == {
+        "c1": True, "c2": True}
+    assert backend.get("namecard/missing") is None
+
+
+def test_multi_path_update_and_delete_prunes_empty_nodes(backend):
+    backend.set("namecard/u1/c1", {"name": "王大明"})
+    backend.update("", {
+        "namecard/u1/c1/phone": "0912",
+        "namecard_summary/u1/c1/name": "王大明"})
+    assert backend.get("namecard/u1/c1") == {"name": "王大明", "phone": "0912"}
+    backend.update("namecard/u1/c1", {"phone": None})
+    assert backend.get("namecard/u1/c1") == {"name": "王大明"}
+    backend.delete("namecard/u1/c1")
+    assert backend.get("namecard") is None
+    assert backend.get("namecard_summary/u1/c1/name") == "王大明"
+
+
+def test_set_replaces_leaf_ancestor(backend):
+    backend.set("a/b", "leaf")
+    backend.set("a/b/c", 1)
+    assert backend.get("a") == {"b": {"c": 1}}
+
+
+def test_push_keys_are_ordered(backend):
+    keys = [backend.push("namecard/u1", {"n": i}) for i in range(50)]
+    assert keys == sorted(keys)
+    assert len(set(keys)) == 50
+    assert all(len(key) == 20 for key in keys)
+
+
+def test_transaction(backend):
+    for _ in range(3):
+        backend.transaction(
+            "stats/u1", lambda cur: {"total": (cur or {}).get("total", 0) + 1})
+    assert backend.get("stats/u1") == {"total": 3}
+
+
+def test_query_orders_like_rtdb(backend):
+    backend.set("s/u1", {
+        "k1": {"name": "b"}, "k2": {"name": "a"}, "k3": {"title": "x"},
+        "k4": {"name": 5}, "k5": {"name": "b"}})
+    assert list(backend.query("s/u1", "name")) == [
+        "k3", "k4", "k2", "k1", "k5"]
+    assert list(backend.query(
+        "s/u1", "name", start_at="b", limit_to_first=1)) == ["k1"]
+    assert list(backend.query(
+        "s/u1", "name", end_at="a", limit_to_last=2)) == ["k4", "k2"]
+
+
+def test_blob_round_trip(backend):
+    url = backend.upload_blob("qrcodes/u1/c1.png", b"png-bytes", "image/png")
+    assert url.endswith("/blobs/qrcodes/u1/c1.png")
+    assert backend.get_blob("qrcodes/u1/c1.png") == (b"png-bytes", "image/png")
+    assert backend.get_blob("missing") is None
+
+
+def test_firebase_utils_runs_on_local_backends(backend):
+    card = {"name": "王大明", "company": "LINE", "email": "a@b.c"}
+    card_id = firebase_utils.add_namecard(dict(card), "u1")
+    dup_id = firebase_utils.add_namecard(dict(card), "u1")
+    other_id = firebase_utils.add_namecard(
+        {"name": "李小華", "company": "Google", "email": "x@y.z"}, "u1")
+    assert firebase_utils.count_cards("u1") == 3
+
+    firebase_utils.update_namecard_field("u1", other_id, "company", "LINE")
+    firebase_utils.remove_redundant_data("u1")
+    assert firebase_utils.get_card_by_id("u1", dup_id) is None
+    assert firebase_utils.count_cards("u1") == 2
+
+    stats = firebase_utils.get_namecard_statistics("u1")
+    assert stats["total"] == 2
+    assert stats["top_company"] == "LINE (2張)"
+    assert firebase_utils.rebuild_namecard_statistics("u1") is False
+
+    page, _ = firebase_utils.get_card_summary_page("u1", limit=8)
+    assert [summary["card_id"] for summary in page] == [other_id, card_id]
+    assert page[0]["company"] == "LINE"
+
+    url = firebase_utils.upload_qrcode_to_storage(
+        BytesIO(b"qr"), "u1", card_id)
+    assert backend.get_blob(f"qrcodes/u1/{card_id}.png")[0] == b"qr"
+    assert url
+
+
+def test_legacy_user_statistics_are_rebuilt_before_deltas(backend):
+    # 舊資料：已有名片但尚未建立 namecard_stats 節點
+    backend.set("namecard/u1", {
+        "c1": {"name": "王大明", "company": "LINE",
+               "created_at": "2026-09-01T10:00:00"},
+        "c2": {"name": "李小華", "company": "Google",
+               "created_at": "2026-09-02T10:00:00"},
+    })
+    firebase_utils.update_namecard_fields(
+        "u1", {"c1": {"company": "Google"}, "c2": {"company": "LINE"}})
+    assert firebase_utils.rebuild_namecard_statistics("u1") is False
+
+    backend.delete("namecard_stats/u1")
+    firebase_utils.add_namecard({"name": "陳一", "company": "LINE"}, "u1")
+    assert firebase_utils.get_namecard_statistics("u1")["total"] == 3
+    assert firebase_utils.rebuild_namecard_statistics("u1") is False
+
+
+def test_statistics_read_skips_company_counts(backend, monkeypatch):
+    firebase_utils.add_namecard({"name": "王大明", "company": "LINE"}, "u1")
+    firebase_utils.add_namecard({"name": "李小華", "company": "LINE"}, "u1")
+    firebase_utils.add_namecard({"name": "陳一", "company": "Google"}, "u1")
+    paths = []
+    get = backend.get
+
+    def recording_get(path, shallow=False):
+        paths.append(path)
+        return get(path, shallow=shallow)
+
+    monkeypatch.setattr(backend, "get", recording_get)
+    stats = firebase_utils.get_namecard_statistics("u1")
+    assert stats["total"] == 3
+    assert stats["this_month"] == 3
+    assert stats["top_company"] == "LINE (2張)"
+    assert "namecard_stats/u1" not in paths
+    assert "namecard_stats/u1/companies" not in paths
+
+    # 尚未寫入 top_company 的舊彙總節點
+    backend.delete("namecard_stats/u1/top_company")
+    stats = firebase_utils.get_namecard_statistics("u1")
+    assert stats["top_company"] == "LINE (2張)"
+
+
+def test_card_mirror_skips_backends_without_listen(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_backend.config, "CARD_MIRROR_ENABLED", True)
+    monkeypatch.setattr(storage_backend.config, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(storage_backend.config, "SQLITE_PATH",
+                        str(tmp_path / "namecard.db"))
+    storage_backend.set_backend(None)
+    try:
+        assert isinstance(storage_backend.get_backend(), SqliteBackend)
+    finally:
+        storage_backend.set_backend(None)
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        storage_backend.StorageBackend()
@@ -0,0 +1,195 @@
+import numpy as np
+import pytest
+
+from app import (
+    agent_runtime, circuit_breaker, config, embedders, firebase_utils,
+    vector_index, vertex_scheduler
+)
+from app.embedders import (
+    Embedder, HashingEmbedder, card_text, text_digest
+)
+from app.vector_index import VectorIndex
+
+CARDS = {
+    "card-1": {"name": "王大明", "company": "未來智能", "title": "創辦人",
+               "memo": "東京 AI 新創展認識，做語音辨識"},
+    "card-2": {"name": "李小華", "company": "台積電", "title": "經理",
+               "memo": "半導體製程"},
+    "card-3": {"name": "Davis Chen", "company": "David Design",
+               "title": "Designer", "memo": "台北設計週"},
+}
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__(dimension=128)
+        self.embedded = []
+
+    def embed(self, texts, query=False):
+        if not query:
+            self.embedded.extend(texts)
+        return super().embed(texts, query)
+
+
+@pytest.fixture
+def embedder(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index.config, "EMBEDDING_DIR", str(tmp_path))
+    embedder = CountingEmbedder()
+    embedders.set_embedder(embedder)
+    vector_index.clear()
+    yield embedder
+    vector_index.clear()
+    embedders.set_embedder(None)
+
+
+@pytest.fixture
+def backend(backend, embedder):
+    backend.set("namecard/user-1", CARDS)
+    return backend
+
+
+def test_hashing_embedder_is_normalized_and_deterministic():
+    embedder = HashingEmbedder(dimension=64)
+    vectors = embedder.embed(["東京 AI 新創", "東京 AI 新創", ""])
+    assert vectors.dtype == np.float32
+    assert vectors.shape == (3, 64)
+    assert np.allclose(vectors[0], vectors[1])
+    assert np.linalg.norm(vectors[0]) == pytest.approx(1.0)
+    assert not vectors[2].any()
+    with pytest.raises(TypeError):
+        Embedder()
+
+
+def test_card_text_skips_missing_fields():
+    assert card_text({"name": "王大明", "title": "N/A", "phone": "0912"}) \
+        == "王大明"
+
+
+def test_batched_top_k_and_swap_remove():
+    index = VectorIndex(dimension=3)
+    index.put_many(["a", "b", "c"],
+                   np.array([[1, 0, 0], [0, 1, 0], [1, 1, 0]]))
+    results = index.search(np.array([[1, 0, 0], [0, 1, 0]]), k=2)
+    assert [card_id for card_id, _ in results[0]] == ["a", "c"]
+    assert [card_id for card_id, _ in results[1]] == ["b", "c"]
+    assert results[0][0][1] == pytest.approx(1.0)
+
+    index.remove("a")
+    assert len(index) == 2
+    assert [card_id for card_id, _ in index.search(
+        np.array([1, 0, 0]), k=5)[0]] == ["c", "b"]
+
+
+@pytest.mark.asyncio
+async def test_persisted_matrix_only_reembeds_changed_cards(embedder):
+    cards = {card_id: dict(card) for card_id, card in CARDS.items()}
+    index = vector_index.get_index("user-1", lambda u_id: cards)
+    await vector_index.wait_refreshed()
+    assert len(index) == 3 and len(embedder.embedded) == 3
+
+    # 模擬重新啟動：從檔案載入，只為變動與新增的名片產生向量
+    vector_index.clear()
+    embedder.embedded.clear()
+    cards["card-2"]["memo"] = "晶圓代工"
+    cards["card-4"] = {"name": "陳小美", "company": "LINE"}
+    del cards["card-3"]
+    index = vector_index.get_index("user-1", lambda u_id: cards)
+    await vector_index.wait_refreshed()
+    assert len(index) == 3
+    assert sorted(embedder.embedded) == sorted(
+        [card_text(cards["card-2"]), card_text(cards["card-4"])])
+    assert "card-3" not in index
+
+
+@pytest.mark.asyncio
+async def test_semantic_search_and_background_writes(backend, embedder,
+                                                     monkeypatch):
+    results = await firebase_utils.semantic_search_cards(
+        "user-1", "東京認識的 AI 新創")
+    assert results[0]["card_id"] == "card-1"
+    assert results[0]["score"] > results[1]["score"]
+
+    saves = []
+    monkeypatch.setattr(vector_index, "_save",
+                        lambda u_id, index: saves.append(u_id))
+    embedder.embedded.clear()
+    firebase_utils.update_namecard_memo("card-3", "user-1", "東京 AI 展")
+    # 與向量無關的欄位不需要重新產生向量
+    firebase_utils.update_namecard_field("user-1", "card-3", "phone", "0912")
+    card_id = firebase_utils.add_namecard(
+        {"name": "林志明", "company": "量子運算新創"}, "user-1")
+    # 寫入不在 webhook 中產生向量，背景一次處理並只保存一次
+    assert embedder.embedded == []
+    await vector_index.wait_refreshed()
+    assert sorted(embedder.embedded) == sorted([
+        card_text({**CARDS["card-3"], "memo": "東京 AI 展"}),
+        card_text({"name": "林志明", "company": "量子運算新創"})])
+    assert saves == ["user-1"]
+
+    results = await firebase_utils.semantic_search_cards(
+        "user-1", "量子運算", 1)
+    assert [card["card_id"] for card in results] == [card_id]
+
+
+@pytest.mark.asyncio
+async def test_writes_are_embedded_before_the_index_is_loaded(embedder):
+    vector_index.card_written("user-1", "card-1", CARDS["card-1"])
+    await vector_index.wait_refreshed()
+    assert embedder.embedded == [card_text(CARDS["card-1"])]
+
+    # 重新啟動後只需為其他名片產生向量
+    vector_index.clear()
+    embedder.embedded.clear()
+    index = vector_index.get_index("user-1", lambda u_id: CARDS)
+    await vector_index.wait_refreshed()
+    assert len(index) == 3
+    assert card_text(CARDS["card-1"]) not in embedder.embedded
+
+
+@pytest.mark.asyncio
+async def test_card_changed_while_embedding_keeps_newer_data(embedder):
+    cards = {"card-1": dict(CARDS["card-1"])}
+    index = vector_index.get_index("user-1", lambda u_id: cards)
+    # 背景更新開始前名片又被修改：以修改後的資料產生向量
+    vector_index.card_written(
+        "user-1", "card-1", {**CARDS["card-1"], "memo": "量子運算"})
+    vector_index.card_written("user-1", "card-2", CARDS["card-2"])
+    vector_index.card_written("user-1", "card-2", None)
+    await vector_index.wait_refreshed()
+    assert len(index) == 1
+    assert index.digest("card-1") == text_digest(
+        card_text({**CARDS["card-1"], "memo": "量子運算"}))
+
+
+@pytest.mark.asyncio
+async def test_remote_embeddings_go_through_scheduler_and_breaker(
+        embedder, monkeypatch):
+    monkeypatch.setattr(embedder, "remote", True, raising=False)
+    scheduler = vertex_scheduler.VertexScheduler()
+    monkeypatch.setattr(vertex_scheduler, "scheduler", scheduler)
+    circuit_breaker.vertex.reset()
+    cards = {card_id: dict(card) for card_id, card in CARDS.items()}
+
+    results = await vector_index.search(
+        "user-1", ["半導體"], lambda u_id: cards, 1)
+    assert [card_id for card_id, _ in results[0]] == ["card-2"]
+    classes = scheduler.summary()["classes"]
+    assert classes[vertex_scheduler.BACKGROUND]["granted"] == 1
+    assert classes[vertex_scheduler.INTERACTIVE]["granted"] == 1
+
+    monkeypatch.setattr(config, "CIRCUIT_MIN_CALLS", 1)
+    circuit_breaker.vertex.reset()
+    with pytest.raises(RuntimeError):
+        with circuit_breaker.vertex.guard():
+            raise RuntimeError("Vertex down")
+    with pytest.raises(circuit_breaker.CircuitOpenError):
+        await vector_index.search("user-1", ["半導體"], lambda u_id: cards)
+    circuit_breaker.vertex.reset()
+
+
+@pytest.mark.asyncio
+async def test_agent_tool_exposes_semantic_search(backend):
+    with agent_runtime.agent_request("user-1"):
+        results = await agent_runtime.semantic_search_namecards(
+            "半導體 經理", limit=1)
+    assert [card["card_id"] for card in results] == ["card-2"]
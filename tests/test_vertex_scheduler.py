@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from app import config
+from app.vertex_scheduler import (
+    BACKGROUND, INTERACTIVE, OCR, VertexScheduler
+)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    # 每秒補回 50 個請求（20ms 一個），token 配額不構成限制
+    monkeypatch.setattr(config, "VERTEX_QPM", 3000)
+    monkeypatch.setattr(config, "VERTEX_TPM", 10**9)
+    monkeypatch.setattr(config, "VERTEX_TOKEN_ESTIMATE", 2000)
+    return VertexScheduler()
+
+
+async def drain(scheduler):
+    """用完目前的請求配額，之後的呼叫都要排隊"""
+    while scheduler.summary()["requests_available"] >= 1:
+        await scheduler.acquire(BACKGROUND, "bulk")
+
+
+@pytest.mark.asyncio
+async def test_priority_then_round_robin_between_users(scheduler):
+    await drain(scheduler)
+    order = []
+
+    async def call(priority, user_id):
+        ticket = await scheduler.acquire(priority, user_id)
+        order.append((priority, user_id))
+        scheduler.settle(ticket, 2000)
+
+    tasks = [asyncio.create_task(call(priority, user_id))
+             for priority, user_id in [
+                 (BACKGROUND, "bulk"), (BACKGROUND, "bulk"),
+                 (BACKGROUND, "bulk"), (BACKGROUND, "user-2"),
+                 (OCR, "user-3"), (INTERACTIVE, "user-4")]]
+    await asyncio.gather(*tasks)
+
+    assert order == [
+        (INTERACTIVE, "user-4"), (OCR, "user-3"),
+        (BACKGROUND, "bulk"), (BACKGROUND, "user-2"),
+        (BACKGROUND, "bulk"), (BACKGROUND, "bulk"),
+    ]
+    classes = scheduler.summary()["classes"]
+    assert classes[INTERACTIVE]["granted"] == 1
+    assert classes[INTERACTIVE]["avg_wait_ms"] > 0
+    assert classes[BACKGROUND]["max_wait_ms"] >= (
+        classes[INTERACTIVE]["max_wait_ms"])
+    assert classes[BACKGROUND]["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_is_skipped(scheduler):
+    await drain(scheduler)
+    cancelled = asyncio.create_task(scheduler.acquire(OCR, "user-1"))
+    waiting = asyncio.create_task(scheduler.acquire(OCR, "user-2"))
+    await asyncio.sleep(0)
+    assert scheduler.summary()["classes"][OCR]["queued"] == 2
+
+    cancelled.cancel()
+    ticket = await waiting
+    assert ticket.user_id == "user-2"
+    assert scheduler.summary()["classes"][OCR]["granted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_token_budget_is_settled_with_actual_usage(monkeypatch):
+    monkeypatch.setattr(config, "VERTEX_QPM", 600)
+    monkeypatch.setattr(config, "VERTEX_TPM", 10000)
+    monkeypatch.setattr(config, "VERTEX_TOKEN_ESTIMATE", 2000)
+    scheduler = VertexScheduler(clock=lambda: 0.0)
+
+    ticket = await scheduler.acquire(OCR, "user-1")
+    assert ticket.wait == 0
+    assert scheduler.summary()["tokens_available"] == 8000
+
+    scheduler.settle(ticket, 500)
+    summary = scheduler.summary()
+    assert summary["tokens_available"] == 9500
+    assert summary["classes"][OCR]["token_estimate"] == 1700
+
+    # 沒有送出的呼叫退回預扣的 token，不影響平均用量
+    ticket = await scheduler.acquire(OCR, "user-1")
+    scheduler.settle(ticket, 0)
+    summary = scheduler.summary()
+    assert summary["tokens_available"] == 9500
+    assert summary["classes"][OCR]["token_estimate"] == 1700
+    assert summary["requests_available"] == 598